@@ -1,10 +1,19 @@
 import logging
-import urllib3
 import json
+import uuid
 from os import environ
 
 from utils.utils import Utils
-from s3.s3 import s3CopyFiles
+from transport.transport import Transport
+from job_store.job_store import JOB_STATE_ACCEPTED, JOB_STATE_CHILD_ACCOUNT_REGISTERED, JOB_STATE_ONBOARDING_STARTED, JOB_STATE_SUCCEEDED, JOB_STATE_FAILED
+
+# Timeouts in seconds and retry policy of the Archera endpoints called by this lambda, see `transport.transport.Transport`. Calls creating accounts are not idempotent,
+# so the transport only retries them after connection failures. They carry an idempotency key derived from the job ID, which lets Archera recognize a call replayed by a retried job.
+ARCHERA_ENDPOINTS = {
+    'register_child': {'connect_timeout': 3, 'read_timeout': 10},
+    'onboarding_start': {'connect_timeout': 3, 'read_timeout': 10},
+    'cloudformation_template': {'connect_timeout': 3, 'read_timeout': 15}
+}
 
 class Archera:
 
@@ -17,13 +26,19 @@ class Archera:
 
         self.logger = logger
         self.utils = Utils(logger=self.logger)
-        self.http = urllib3.PoolManager()
+        self.transport = Transport(logger=self.logger, service_name='ARCHERA', endpoints=ARCHERA_ENDPOINTS)
         self.base_url = base_url
         self.region_name = region_name
 
         ssm_key_partner_org_account_id = environ.get('SSM_KEY_ARCHERA_PARTNER_ORG_ID') # Archera Partner Account ID
         ssm_key_partner_api_key = environ.get('SSM_KEY_ARCHERA_PARTNER_API_KEY')
 
+        # Resolve both Archera Partner parameters with a single GetParameters call. The `get_ssm_parameter` calls below are then served from the cache.
+        self.utils.prefetch(
+            region_name=self.region_name,
+            ssm_parameter_names=[ssm_key_partner_org_account_id, ssm_key_partner_api_key]
+        )
+
         self.partner_account_id = self.utils.get_ssm_parameter(
             parameter_name=ssm_key_partner_org_account_id,
             region_name=region_name
@@ -33,6 +48,9 @@ class Archera:
             region_name=self.region_name
         )
 
+        # Built once per execution environment and shared by every CREATE of a bulk request
+        self.http_headers = self.__get_headers(api_key=self.partner_api_key)
+
     # __get_base_url: Returns str with the customized URL for the Archera REST APIs which includes the base URL and Account ID parameter.
     def __get_base_url(self, account_id: str) -> str:
         return self.base_url + '/org/' + account_id
@@ -40,8 +58,6 @@ class Archera:
     # __get_headers: Returns the headers for the Archera REST APIs. Returns dict with the headers.
     def __get_headers(self, api_key: str) -> dict:
 
-        self.logger.debug('Archera API Key: ' + api_key)
-
         import base64
 
         # Convert string to bytes
@@ -53,15 +69,17 @@ class Archera:
         # Convert bytes back to string for readability
         base64_str = base64_str.decode('utf-8')
 
-        self.logger.debug("Base64 encoded string: " + base64_str)
-
         return {
             'Content-Type': 'application/json',
             'Authorization': 'Basic ' + base64_str
         }
     
+    # __get_idempotency_key: Returns str with the idempotency key of a job step. The key is the same on every attempt of the job, so a replayed step does not create a second child account.
+    def __get_idempotency_key(self, job: dict, step: str) -> str:
+        return job['JobId'] + ':' + step
+
     # __create_child_account: Creates a new Account under the Archera Partner account using REST APIs. Returns str with the new Account ID.
-    def __create_child_account(self, httpHeaders: dict, partner_account_id: str, child_account_name: str) -> str:
+    def __create_child_account(self, httpHeaders: dict, partner_account_id: str, child_account_name: str, idempotency_key: str) -> str:
         '''
             The HTTP Body can contain the following information
                 - company (string, required): Name of the child account
@@ -72,14 +90,16 @@ class Archera:
             'company': child_account_name
         }
         try:
-            self.logger.debug('Archera URL: ' + self.__get_base_url(account_id=partner_account_id) + '/partners/onboarding/register_child')
-            r = self.http.request(
+            self.logger.debug('Archera URL: %s/partners/onboarding/register_child', self.__get_base_url(account_id=partner_account_id))
+            r = self.transport.request(
                 'POST', self.__get_base_url(account_id=partner_account_id) + '/partners/onboarding/register_child',
+                endpoint='register_child',
                 headers=httpHeaders,
-                body=json.dumps(httpBody)
+                body=json.dumps(httpBody),
+                idempotency_key=idempotency_key
             )
             response = json.loads(r.data)
-            self.logger.debug('Create Child Account Response: ' + str(response))
+            self.logger.debug('Create Child Account Response: %s', response)
             if r.status == 200:
                 return response['org_id']
             else:
@@ -94,14 +114,16 @@ class Archera:
             raise
 
     # __init_child_account_onboarding: Creates a new Account under the Archera Partner account using REST APIs. Returns str with the new Account ID.
-    def __init_child_account_onboarding(self, httpHeaders: dict, child_account_id: str) -> str:
+    def __init_child_account_onboarding(self, httpHeaders: dict, child_account_id: str, idempotency_key: str) -> str:
         try:
-            r = self.http.request(
+            r = self.transport.request(
                 'POST', self.__get_base_url(account_id=child_account_id) + '/partners/onboarding/start',
-                headers=httpHeaders
+                endpoint='onboarding_start',
+                headers=httpHeaders,
+                idempotency_key=idempotency_key
             )
             response = json.loads(r.data)
-            self.logger.debug('Init Child Account Onboarding Response: ' + str(response))
+            self.logger.debug('Init Child Account Onboarding Response: %s', response)
             if r.status == 200:
                 return response['onboarding_id']
             else:
@@ -115,15 +137,21 @@ class Archera:
         except Exception:
             raise
 
-    # __get_account_cloudformation_template: Downloads the Archera Account-specific Onboarding template to local filesystem. Returns str.
-    def __get_account_cloudformation_template(self, httpHeaders: dict, child_account_id: str) -> str:
+    # __get_account_cloudformation_template: Downloads the Archera Account-specific Onboarding template. Returns dict with the `template` member of the response.
+    # The body is parsed straight from the response stream and the connection released, so the raw body is not kept alongside the parsed template.
+    def __get_account_cloudformation_template(self, httpHeaders: dict, child_account_id: str) -> dict:
         try:
-            r = self.http.request(
+            r = self.transport.request(
                 'GET', self.__get_base_url(account_id=child_account_id) + '/partners/onboarding/aws/cloudformation_template',
-                headers=httpHeaders
+                endpoint='cloudformation_template',
+                headers=httpHeaders,
+                preload_content=False
             )
-            response = json.loads(r.data)
-            self.logger.debug('Get Account CloudFormation Template Response: ' + str(response))
+            try:
+                response = json.load(r)
+            finally:
+                r.release_conn()
+            self.logger.debug('Get Account CloudFormation Template Response with keys: %s', list(response.keys()))
             if r.status != 200:
                 self.logger.exception(response)
                 if len(response.keys()) == 1:
@@ -135,53 +163,102 @@ class Archera:
         except Exception:
             raise
 
-        return json.dumps(response['template'])
+        return response['template']
         
-    def create_account(self, customer_account_name: str) -> tuple[bool, dict]:        
-        httpHeaders = self.__get_headers(api_key=self.partner_api_key)
-        self.logger.debug('HTTP Headers: ' + str(httpHeaders))
-
-        customer_account_id = None
-        http_response_data = {}
-
-        self.logger.info('Starting Archera Onboarding')
-        customer_account_id = self.__create_child_account(httpHeaders=httpHeaders, partner_account_id=self.partner_account_id, child_account_name=customer_account_name)
-        http_response_data.update({'ArcheraChildAccountId': customer_account_id})
-
-        self.logger.debug('Initiating onboarding for Customer Archera Account ID: ' + customer_account_id)
-        onboarding_id = self.__init_child_account_onboarding(httpHeaders=httpHeaders, child_account_id=customer_account_id)
-        http_response_data.update({'ArcheraOnboardingId': customer_account_id})
-
-        if customer_account_id and onboarding_id:
-
-            self.logger.debug('Downloading the Archera Account-specific Onboarding template to runtime')
-            cfn_template_response = self.__get_account_cloudformation_template(httpHeaders=httpHeaders, child_account_id=customer_account_id)
-
-            if cfn_template_response:
-
-                # Setup S3
-                s3Copy = s3CopyFiles(
-                    logger=self.logger,
-                    region_name=self.region_name
-                )
-
-                cfn_template_pre_signed_url = s3Copy.s3_put_object(
-                    dst_bucket=environ.get('TEMPLATE_BUCKET_NAME'),  
-                    dst_key_prefix=environ.get('TEMPLATE_KEY_PREFIX'),      
-                    dst_key=customer_account_id,
-                    data=cfn_template_response
-                )
-
-                if cfn_template_pre_signed_url:                
-                    self.logger.info('Archera API Account creation for ' + customer_account_id + ' was successful')
-                    http_response_data.update({'ArcheraAccountCreationStatus': 'SUCCESS'})
-                    http_response_data.update({'ArcheraCloudFormationTemplateUrl': cfn_template_pre_signed_url})
-                    self.logger.info('Finished Archera Account Creation')
-                    return True, http_response_data
-                else:
-                    self.logger.error('Archera API Account creation process for ' + customer_account_id + ' was not successful')
-                    http_response_data.update({'ArcheraAccountCreationStatus': 'NEEDS_INVESTIGATION'})
-                    return False, http_response_data
-            else:
-                self.logger.error("Archera's API Account creation failed. Please refer to CloudWatch Logs for a detailed error message.")
-                return False, http_response_data
\ No newline at end of file
+    # __store_cloudformation_template: Downloads the Archera Account-specific Onboarding template and stores it in S3. Returns str with the presigned URL of the template, or None when it could not be stored.
+    def __store_cloudformation_template(self, httpHeaders: dict, child_account_id: str) -> str:
+
+        self.logger.debug('Downloading the Archera Account-specific Onboarding template to runtime')
+        cfn_template_response = self.__get_account_cloudformation_template(httpHeaders=httpHeaders, child_account_id=child_account_id)
+
+        if not cfn_template_response:
+            self.logger.error("Archera's API Account creation failed. Please refer to CloudWatch Logs for a detailed error message.")
+            return None
+
+        # Setup S3. Imported here so botocore is only loaded once a template is uploaded.
+        from s3.s3 import s3CopyFiles
+        s3Copy = s3CopyFiles(
+            logger=self.logger,
+            region_name=self.region_name
+        )
+
+        # The template is serialized while it is uploaded, without a copy on /tmp. With TEMPLATE_CONTENT_ADDRESSED, identical templates are stored once and shared between accounts.
+        s3_upload = s3Copy.s3_upload_json_content_addressed if environ.get('TEMPLATE_CONTENT_ADDRESSED', 'false').lower() == 'true' else s3Copy.s3_upload_json
+        # With TEMPLATE_GZIP, the template is stored gzip-compressed with `Content-Encoding: gzip`
+        return s3_upload(
+            dst_bucket=environ.get('TEMPLATE_BUCKET_NAME'),
+            dst_key_prefix=environ.get('TEMPLATE_KEY_PREFIX'),
+            dst_key=child_account_id,
+            document=cfn_template_response,
+            compress=environ.get('TEMPLATE_GZIP', 'false').lower() == 'true'
+        )
+
+    # run_create_job: Runs the CREATE steps of an onboarding job as a state machine, starting from the job's current state:
+    #   ACCEPTED -> register_child -> CHILD_ACCOUNT_REGISTERED -> onboarding start -> ONBOARDING_STARTED -> template download and S3 upload -> SUCCEEDED
+    # The result of every step is checkpointed with `save_job` before the next Archera call, so a job which failed or timed out resumes after its last completed step.
+    # A step which failed after reaching Archera is replayed with the same idempotency key.
+    # job: dict with the job record, see `job_store.job_store.JobStore`. Updated in place.
+    # save_job: Function persisting the job record
+    #
+    # Returns: dict with the job record
+    # Raises: Exception when a step fails. The job keeps the state and checkpoints of its last completed step.
+    def run_create_job(self, job: dict, save_job) -> dict:
+
+        httpHeaders = self.http_headers
+        checkpoints = job['Checkpoints']
+
+        if job['State'] == JOB_STATE_ACCEPTED:
+            self.logger.info('Starting Archera Onboarding')
+            checkpoints['ArcheraChildAccountId'] = self.__create_child_account(httpHeaders=httpHeaders, partner_account_id=self.partner_account_id, child_account_name=job['Request']['CustomerAccountName'], idempotency_key=self.__get_idempotency_key(job=job, step='register_child'))
+            job['State'] = JOB_STATE_CHILD_ACCOUNT_REGISTERED
+            save_job(job)
+
+        if job['State'] == JOB_STATE_CHILD_ACCOUNT_REGISTERED:
+            self.logger.debug('Initiating onboarding for Customer Archera Account ID: %s', checkpoints['ArcheraChildAccountId'])
+            checkpoints['ArcheraOnboardingId'] = self.__init_child_account_onboarding(httpHeaders=httpHeaders, child_account_id=checkpoints['ArcheraChildAccountId'], idempotency_key=self.__get_idempotency_key(job=job, step='onboarding_start'))
+            job['State'] = JOB_STATE_ONBOARDING_STARTED
+            save_job(job)
+
+        if job['State'] == JOB_STATE_ONBOARDING_STARTED:
+            cfn_template_pre_signed_url = self.__store_cloudformation_template(httpHeaders=httpHeaders, child_account_id=checkpoints['ArcheraChildAccountId'])
+            if not cfn_template_pre_signed_url:
+                self.logger.error('Archera API Account creation process for %s was not successful', checkpoints['ArcheraChildAccountId'])
+                raise Exception('Unable to store the CloudFormation template for child Account ' + str(checkpoints['ArcheraChildAccountId']) + '.')
+            checkpoints['ArcheraCloudFormationTemplateUrl'] = cfn_template_pre_signed_url
+            job['State'] = JOB_STATE_SUCCEEDED
+            save_job(job)
+            self.logger.info('Archera API Account creation for %s was successful', checkpoints['ArcheraChildAccountId'])
+
+        return job
+
+    # get_create_response_data: Returns dict with the HTTP response data of a CREATE job, i.e. its checkpoints and the account creation status
+    @staticmethod
+    def get_create_response_data(job: dict) -> dict:
+
+        http_response_data = dict(job['Checkpoints'])
+
+        if job['State'] == JOB_STATE_SUCCEEDED:
+            http_response_data.update({'ArcheraAccountCreationStatus': 'SUCCESS'})
+        elif job['State'] == JOB_STATE_FAILED:
+            http_response_data.update({'ArcheraAccountCreationStatus': 'ACCOUNT_CREATION_FAILED'})
+        else:
+            http_response_data.update({'ArcheraAccountCreationStatus': 'IN_PROGRESS'})
+
+        return http_response_data
+
+    # create_account: Runs the CREATE steps within the current request. Returns tuple with the onboarding status and the HTTP response data.
+    # Raises: Exception when a step fails
+    def create_account(self, customer_account_name: str) -> tuple[bool, dict]:
+
+        job = {
+            'JobId': str(uuid.uuid4()),
+            'State': JOB_STATE_ACCEPTED,
+            'Request': {'CustomerAccountName': customer_account_name},
+            'Checkpoints': {}
+        }
+
+        # Nothing to resume within a single request, so the checkpoints are not persisted
+        self.run_create_job(job=job, save_job=lambda job: None)
+
+        self.logger.info('Finished Archera Account Creation')
+        return job['State'] == JOB_STATE_SUCCEEDED, self.get_create_response_data(job=job)
@@ -1,20 +1,24 @@
 from os import environ
 import logging
 import traceback
-import boto3
+import time
 
-# Setting up the logging level from the environment variable `LOGLEVEL`.
-logging.basicConfig()
-logger = logging.getLogger(__name__)
-logger.setLevel(environ['LOGLEVEL'] if 'LOGLEVEL' in environ.keys() else 'INFO')
+# Start of the init phase, for the init report at the end of this module
+init_started_at = time.perf_counter()
+
+from structured_logger.structured_logger import get_logger, start_request, log_payload
+
+# Setting up the logging level from the environment variable `LOGLEVEL`. Log entries are written as JSON with secrets redacted, see `structured_logger`.
+logger = get_logger(__name__, level=environ['LOGLEVEL'] if 'LOGLEVEL' in environ.keys() else 'INFO')
 
 # Setting up logging level specific to `botocore` from the environment variable `BOTOCORE_LOGLEVEL`.
 if 'BOTOCORE_LOGLEVEL' in environ.keys():
+    import boto3
     if environ['BOTOCORE_LOGLEVEL'] == 'DEBUG':
         logger.info('Setting boto3 logging to DEBUG')
         boto3.set_stream_logger('') # Log everything on boto3 messages to stdout
     else:
-        logger.info('Setting boto3 logging to ' + environ['BOTOCORE_LOGLEVEL'])
+        logger.info('Setting boto3 logging to %s', environ['BOTOCORE_LOGLEVEL'])
         boto3.set_stream_logger(level=logging._nameToLevel[environ['BOTOCORE_LOGLEVEL']]) # Log boto3 messages that match BOTOCORE_LOGLEVEL to stdout
 
 # Access environment variables
@@ -23,39 +27,383 @@ region_name = environ.get('REGION')
 customer_account_name_suffix = environ.get('CUSTOMER_ACCOUNT_NAME_SUFFIX')
 environment = environ.get('ENVIRONMENT')
 
-from archera.archera import Archera
-archera = Archera(
-    logger=logger,
-    base_url=base_url,
-    region_name=region_name
-)
+from utils.utils import Utils
+utilsObj = Utils(logger=logger)
+
+# get_archera: Returns the shared Archera object. It is created on the first request, so the init phase does not wait on its SSM calls.
+def get_archera():
+
+    # Imported here to keep urllib3 and the Archera client out of the init phase
+    from archera.archera import Archera
+
+    return utilsObj.get_lazy('archera', lambda: Archera(
+        logger=logger,
+        base_url=base_url,
+        region_name=region_name
+    ))
+
+# Milliseconds held back from the Lambda's remaining time, so the handler can still log and respond when an Archera call is cut short
+ARCHERA_DEADLINE_MARGIN_MS = 1000
+
+# set_archera_deadline: Bounds the Archera calls of this request, timeouts and retries included, by the Lambda's remaining time
+def set_archera_deadline(context) -> None:
+
+    from transport.transport import Transport
+
+    if hasattr(context, 'get_remaining_time_in_millis'):
+        Transport.set_deadline(time.monotonic() + max(context.get_remaining_time_in_millis() - ARCHERA_DEADLINE_MARGIN_MS, 0) / 1000)
+    else:
+        Transport.set_deadline(None)
+
+# log_archera_transport_stats: Logs the Archera circuit breaker state and latency histograms, which are shared by the execution environment
+def log_archera_transport_stats() -> None:
+
+    from transport.transport import Transport
+
+    logger.info('Archera transport stats - %s', Transport(logger=logger, service_name='ARCHERA').get_transport_stats())
+
+# Archera CREATE job mode - With ARCHERA_JOB_MODE=async, a CREATE request is saved as a job and answered with 202 and the job ID straight away.
+# The job worker (this function invoked asynchronously, or the one named by ARCHERA_JOB_WORKER_FUNCTION) runs the CREATE steps and checkpoints the job after every Archera call.
+# Progress and the final presigned URL are reported by the status route, GET /onboard-archera/jobs/{jobId}.
+DEFAULT_ARCHERA_JOB_MAX_ATTEMPTS = 3
+
+# is_job_mode: Returns bool, True when CREATE requests run as asynchronous jobs
+def is_job_mode() -> bool:
+    return environ.get('ARCHERA_JOB_MODE', 'sync').lower() == 'async'
+
+# get_job_store: Returns the shared JobStore object
+def get_job_store():
+
+    from job_store.job_store import JobStore
+
+    return utilsObj.get_lazy('job_store', lambda: JobStore(logger=logger, region_name=region_name))
+
+# run_job: Runs the remaining CREATE steps of a job. A failed attempt is recorded on the job and raised again while attempts are left,
+# so the asynchronous invocation is retried by Lambda and resumes from the last checkpoint. Returns dict with the job record, or None when there is no such job.
+def run_job(job_id: str, max_attempts: int) -> dict:
+
+    from job_store.job_store import JOB_FINAL_STATES, JOB_STATE_FAILED
+
+    job_store = get_job_store()
+    job = job_store.get_job(job_id=job_id)
+
+    if job is None:
+        logger.error('Job %s not found', job_id)
+        return None
+
+    if job['State'] in JOB_FINAL_STATES:
+        logger.info('Job %s is already %s', job_id, job['State'])
+        return job
+
+    # Saved before the first Archera call, so an attempt cut short by the Lambda timeout still counts
+    job['Attempts'] += 1
+    job_store.save_job(job=job)
+
+    try:
+        get_archera().run_create_job(job=job, save_job=job_store.save_job)
+        logger.info('Job %s finished in %s attempt(s)', job_id, job['Attempts'])
+
+    except Exception as e:
+        logger.exception('Job %s failed in state %s, attempt %s of %s', job_id, job['State'], job['Attempts'], max_attempts)
+        log_archera_transport_stats()
+        job['LastError'] = str(e)
+        if job['Attempts'] >= max_attempts:
+            job['State'] = JOB_STATE_FAILED
+        job_store.save_job(job=job)
+        if job['State'] != JOB_STATE_FAILED:
+            raise
+
+    return job
+
+# start_job_worker: Invokes the job worker asynchronously for the jobs. Without a worker function (e.g. local runs), the jobs are run within the current request instead.
+def start_job_worker(job_ids: list, context=None) -> None:
+
+    import json
+
+    worker_function = environ.get('ARCHERA_JOB_WORKER_FUNCTION', environ.get('AWS_LAMBDA_FUNCTION_NAME'))
+
+    if not worker_function:
+        logger.info('No job worker function, running job(s) %s within this request', job_ids)
+        run_bulk(function=lambda job_id: run_job(job_id=job_id, max_attempts=1), items=job_ids, context=context)
+        return
+
+    utilsObj.get_client('lambda', region_name=region_name).invoke(
+        FunctionName=worker_function,
+        InvocationType='Event',
+        Payload=json.dumps({'ArcheraJobId': job_ids[0]} if len(job_ids) == 1 else {'ArcheraJobIds': job_ids}).encode('utf-8')
+    )
+    logger.debug('Job worker %s invoked for job(s) %s', worker_function, job_ids)
+
+# get_job_status: Returns dict with the HTTP response for the status route, with the job state, its checkpoints and the final presigned URL once it succeeded
+def get_job_status(job_id: str) -> dict:
+
+    import json
+    from archera.archera import Archera
+
+    job = get_job_store().get_job(job_id=job_id)
+
+    if job is None:
+        return {
+            'statusCode': 404,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'ArcheraJobId': job_id, 'ArcheraJobState': 'NOT_FOUND'})
+        }
+
+    http_response_data = Archera.get_create_response_data(job=job)
+    http_response_data.update({
+        'ArcheraRequestType': job['JobType'],
+        'ArcheraJobId': job['JobId'],
+        'ArcheraJobState': job['State'],
+        'ArcheraJobAttempts': job['Attempts'],
+        'ArcheraJobCreatedAt': job['CreatedAt'],
+        'ArcheraJobUpdatedAt': job['UpdatedAt']
+    })
+    # The error of an earlier attempt is only reported while the job has not succeeded
+    if job['LastError'] and job['State'] != 'SUCCEEDED':
+        http_response_data.update({'ArcheraErrorMessage': job['LastError']})
+
+    return http_response_data
+
+# job_worker_handler: Runs Archera CREATE jobs. Invoked asynchronously with {"ArcheraJobId": "<job ID>"} by the CREATE request in job mode,
+# or with {"ArcheraJobIds": [...]} by a bulk CREATE, whose jobs are then run concurrently, see `run_bulk`.
+# Raises: Exception when a job failed with attempts left or was not started before the deadline, so the invocation is retried. Finished jobs are skipped on the retry.
+def job_worker_handler(event, context) -> dict:
+
+    start_request(context)
+    set_archera_deadline(context)
+
+    max_attempts = int(environ.get('ARCHERA_JOB_MAX_ATTEMPTS', DEFAULT_ARCHERA_JOB_MAX_ATTEMPTS))
+
+    if 'ArcheraJobId' in event:
+        job = run_job(job_id=event['ArcheraJobId'], max_attempts=max_attempts)
+        return {'ArcheraJobId': event['ArcheraJobId'], 'ArcheraJobState': job['State'] if job else 'NOT_FOUND'}
+
+    job_ids = event['ArcheraJobIds']
+    results = run_bulk(function=lambda job_id: run_job(job_id=job_id, max_attempts=max_attempts), items=job_ids, context=context)
+
+    job_states = []
+    for job_id, (is_finished, job) in zip(job_ids, results):
+        if not is_finished or isinstance(job, Exception):
+            job_states.append({'ArcheraJobId': job_id, 'ArcheraJobState': 'RETRYING'})
+        else:
+            job_states.append({'ArcheraJobId': job_id, 'ArcheraJobState': job['State'] if job else 'NOT_FOUND'})
+
+    retry_job_ids = [x['ArcheraJobId'] for x in job_states if x['ArcheraJobState'] == 'RETRYING']
+    if retry_job_ids:
+        raise Exception('Archera jobs to retry - ' + str(retry_job_ids))
+
+    return {'ArcheraJobs': job_states}
+
+# Bulk CREATE - A CREATE request with CUSTOMER_ACCOUNT_NAMES onboards a list of customers. Their CREATE steps run concurrently on the shared Archera
+# connection pool, with at most ARCHERA_BULK_CONCURRENCY customers at once. Keep it within ARCHERA_HTTP_MAX_POOL_SIZE, so every thread gets a pooled connection.
+DEFAULT_ARCHERA_BULK_CONCURRENCY = 8
+# Upper bound for the number of customers in one bulk CREATE. Can be overridden with `ARCHERA_BULK_MAX_ACCOUNTS`.
+DEFAULT_ARCHERA_BULK_MAX_ACCOUNTS = 500
+
+# get_bulk_concurrency: Returns int with the number of customers onboarded at once by a bulk CREATE
+def get_bulk_concurrency() -> int:
+    return max(int(environ.get('ARCHERA_BULK_CONCURRENCY', DEFAULT_ARCHERA_BULK_CONCURRENCY)), 1)
+
+# run_bulk: Calls `function` for every item, with at most `get_bulk_concurrency` calls running at once. The result of every call is logged as soon as it finishes.
+# Calls which were not started before the Lambda deadline (less ARCHERA_DEADLINE_MARGIN_MS) are cancelled.
+# Returns list with one (is_finished, result) tuple per item, in the order of `items`. The result is the exception raised by a failed call, and None for a cancelled one.
+def run_bulk(function, items: list, context=None) -> list:
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
+
+    results = [(False, None)] * len(items)
+    if not items:
+        return results
+
+    timeout = None
+    if hasattr(context, 'get_remaining_time_in_millis'):
+        timeout = max(context.get_remaining_time_in_millis() - ARCHERA_DEADLINE_MARGIN_MS, 0) / 1000
+
+    executor = ThreadPoolExecutor(max_workers=min(get_bulk_concurrency(), len(items)), thread_name_prefix='archera-bulk')
+    futures = {executor.submit(function, item): position for position, item in enumerate(items)}
+
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            position = futures[future]
+            try:
+                results[position] = (True, future.result())
+                logger.info('Bulk item %s of %s finished - %s', position + 1, len(items), items[position])
+            except Exception as e:
+                results[position] = (True, e)
+                logger.error('Bulk item %s of %s failed - %s - %s', position + 1, len(items), items[position], e)
+
+    except TimeoutError:
+        logger.error('Bulk deadline reached with %s of %s item(s) unfinished', len([x for x in results if not x[0]]), len(items))
+
+    finally:
+        # Calls already running are bounded by the Archera transport deadline, the others are dropped
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+# create_accounts: Runs a bulk CREATE for `customer_account_names`. Customers are onboarded independently, so the ones which succeeded are kept when others fail.
+# In job mode, one job is saved per customer and the jobs are handed to the job worker in batches of `get_bulk_concurrency` jobs, each run concurrently by one invocation.
+# Returns dict with the HTTP response, with one item per customer in request order and the number of customers per status
+def create_accounts(customer_account_names: list, event: dict, context) -> dict:
+
+    import json
+
+    max_accounts = int(environ.get('ARCHERA_BULK_MAX_ACCOUNTS', DEFAULT_ARCHERA_BULK_MAX_ACCOUNTS))
+    if not isinstance(customer_account_names, list) or not 0 < len(customer_account_names) <= max_accounts or not all(isinstance(x, str) and x for x in customer_account_names):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({
+                'ArcheraRequestType': 'CREATE',
+                'ArcheraAccountCreationStatus': 'ACCOUNT_CREATION_FAILED',
+                'ArcheraErrorMessage': 'CUSTOMER_ACCOUNT_NAMES must be a list of 1 to ' + str(max_accounts) + ' customer account names'
+            })
+        }
+
+    logger.info('Bulk CREATE for %s customer(s)', len(customer_account_names))
+    http_response_items = [{'CustomerAccountName': x} for x in customer_account_names]
+
+    # Archera needs `c/o Ibexlabs` suffix at the Partner portal level
+    if is_job_mode():
+        results = run_bulk(
+            function=lambda x: get_job_store().create_job(job_type='CREATE', request={'CustomerAccountName': x + ' c/o Ibexlabs'}),
+            items=customer_account_names,
+            context=context
+        )
+        job_status_path = event.get('rawPath', '/onboard-archera').rstrip('/') + '/jobs/'
+
+        job_ids = []
+        for http_response_item, (is_finished, job) in zip(http_response_items, results):
+            if is_finished and not isinstance(job, Exception):
+                job_ids.append(job['JobId'])
+                http_response_item.update({
+                    'ArcheraJobId': job['JobId'],
+                    'ArcheraJobStatusPath': job_status_path + job['JobId'],
+                    'ArcheraAccountCreationStatus': 'IN_PROGRESS'
+                })
+            else:
+                http_response_item.update({
+                    'ArcheraAccountCreationStatus': 'ACCOUNT_CREATION_FAILED',
+                    'ArcheraErrorMessage': str(job) if job else 'Not started before the request deadline'
+                })
+
+        batch_size = get_bulk_concurrency()
+        job_batches = [job_ids[x:x + batch_size] for x in range(0, len(job_ids), batch_size)]
+        for job_batch, (is_finished, error) in zip(job_batches, run_bulk(function=lambda x: start_job_worker(job_ids=x, context=context), items=job_batches, context=context)):
+            if is_finished and error is None:
+                continue
+            # The jobs stay ACCEPTED, so the customers are reported as failed rather than left waiting on a worker which never started
+            for http_response_item in http_response_items:
+                if http_response_item.get('ArcheraJobId') in job_batch:
+                    http_response_item.update({
+                        'ArcheraAccountCreationStatus': 'ACCOUNT_CREATION_FAILED',
+                        'ArcheraErrorMessage': str(error) if error else 'Not started before the request deadline'
+                    })
+
+    else:
+        results = run_bulk(
+            function=lambda x: get_archera().create_account(customer_account_name=x + ' c/o Ibexlabs')[1],
+            items=customer_account_names,
+            context=context
+        )
+
+        for http_response_item, (is_finished, http_response_data) in zip(http_response_items, results):
+            if is_finished and not isinstance(http_response_data, Exception):
+                http_response_item.update(http_response_data)
+            else:
+                http_response_item.update({
+                    'ArcheraAccountCreationStatus': 'ACCOUNT_CREATION_FAILED',
+                    'ArcheraErrorMessage': str(http_response_data) if http_response_data else 'Not started before the request deadline'
+                })
+
+    if any(x['ArcheraAccountCreationStatus'] == 'ACCOUNT_CREATION_FAILED' for x in http_response_items):
+        log_archera_transport_stats()
+
+    account_creation_statuses = {}
+    for http_response_item in http_response_items:
+        account_creation_statuses[http_response_item['ArcheraAccountCreationStatus']] = account_creation_statuses.get(http_response_item['ArcheraAccountCreationStatus'], 0) + 1
+
+    http_response_data = {
+        'ArcheraRequestType': 'CREATE',
+        'ArcheraAccountCreationStatuses': account_creation_statuses,
+        'ArcheraAccounts': http_response_items
+    }
+
+    if is_job_mode():
+        return {
+            'statusCode': 202,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps(http_response_data)
+        }
+
+    return http_response_data
+
+# With EAGER_INIT (e.g. under provisioned concurrency), create the Archera object during the init phase instead
+if environ.get('EAGER_INIT', 'false').lower() == 'true':
+    get_archera()
+
+utilsObj.report_init(started_at=init_started_at)
 
 # lambda_handler: This script executes as part of an API to create Archera Accounts using Archera's API. The script is executed when the stack is created, updated and removed.
 # Returns the dynamic Archera CloudFormation template in the HTTP API response
 def lambda_handler(event, context) -> dict:
-    
-    logger.debug('Event - ' + str(event))
-    logger.debug('Context - ' + str(context))
-    logger.debug('Environment variables - ' + str(environ))
 
-    # Parse HTTP Request Body for request parameters
+    # Asynchronous invocation of the job worker, see `start_job_worker`
+    if 'ArcheraJobId' in event or 'ArcheraJobIds' in event:
+        return job_worker_handler(event, context)
+
+    start_request(context)
+    set_archera_deadline(context)
+    log_payload(logger, 'Event', event)
+    logger.debug('Context - %s', context)
+    logger.debug('Environment variables - %s', environ)
+
+    # Status route - GET /onboard-archera/jobs/{jobId}
+    if (event.get('pathParameters') or {}).get('jobId'):
+        return get_job_status(job_id=event['pathParameters']['jobId'])
+
+    # Parse HTTP Request Body for request parameters. The body may be base64-encoded and gzip-compressed, see `Utils.get_http_body`.
     import json
-    http_body = json.loads(event['body'])
-    customer_account_name = http_body['CUSTOMER_ACCOUNT_NAME']
+    http_body = json.loads(utilsObj.get_http_body(event))
+    customer_account_name = http_body.get('CUSTOMER_ACCOUNT_NAME')
     request_type = http_body['REQUEST_TYPE']
 
+    # Bulk CREATE - {"REQUEST_TYPE": "CREATE", "CUSTOMER_ACCOUNT_NAMES": [...]}, see `create_accounts`
+    if request_type.upper() == 'CREATE' and 'CUSTOMER_ACCOUNT_NAMES' in http_body:
+        return create_accounts(customer_account_names=http_body['CUSTOMER_ACCOUNT_NAMES'], event=event, context=context)
+
     # Get Create Account CloudFormation Template - The following section gets executed when the REQUEST_TYPE is set to CREATE
     if request_type.upper() == 'CREATE':
 
         try:
-            logger.debug('Create Account Integration through CloudFormation Event - ' + str(event))
+            logger.debug('Create Account Integration through CloudFormation')
+
+            # Job mode - Save the job, start the worker and answer with the job ID and its status route
+            if is_job_mode():
+                job = get_job_store().create_job(
+                    job_type='CREATE',
+                    request={'CustomerAccountName': customer_account_name + ' c/o Ibexlabs'}
+                )
+                start_job_worker(job_ids=[job['JobId']], context=context)
+
+                job_status_path = event.get('rawPath', '/onboard-archera').rstrip('/') + '/jobs/' + job['JobId']
+                return {
+                    'statusCode': 202,
+                    'headers': {'Content-Type': 'application/json', 'Location': job_status_path},
+                    'body': json.dumps({
+                        'ArcheraRequestType': 'CREATE',
+                        'ArcheraJobId': job['JobId'],
+                        'ArcheraJobStatusPath': job_status_path,
+                        'ArcheraAccountCreationStatus': 'IN_PROGRESS'
+                    })
+                }
 
-            archera_onboarding_status, http_response_data = archera.create_account(
+            archera_onboarding_status, http_response_data = get_archera().create_account(
                 customer_account_name=customer_account_name + ' c/o Ibexlabs'
             ) # Archera needs `c/o Ibexlabs` suffix at the Partner portal level
 
-            logger.debug('Archera Onboarding Status - ' + str(archera_onboarding_status))
-            logger.debug('HTTP Response Data - ' + str(http_response_data))
+            logger.debug('Archera Onboarding Status - %s', archera_onboarding_status)
+            logger.debug('HTTP Response Data - %s', http_response_data)
             if archera_onboarding_status:
                 # Respond to HTTP request with http_response_data
                 http_response_data.update({
@@ -67,18 +415,20 @@ def lambda_handler(event, context) -> dict:
 
         # Handling error response when the account creation failed and there is an exception in calling the API.
         except Exception as e:
-            logger.exception('Create Account Error - ' + str(traceback.print_tb(e.__traceback__)))
+            logger.exception('Create Account Error - %s', traceback.print_tb(e.__traceback__))
+            log_archera_transport_stats()
             # Respond to HTTP request with failure message
             return {
                 'ArcheraRequestType': 'CREATE',
-                'ArcheraAccountCreationStatus': 'ACCOUNT_CREATION_FAILED'
+                'ArcheraAccountCreationStatus': 'ACCOUNT_CREATION_FAILED',
+                'ArcheraErrorMessage': str(e)
             }
 
     # Update Account CloudFormation Template - The following section gets executed when the REQUEST_TYPE is set to UPDATE
     if request_type.upper() == 'UPDATE':
 
         try:
-            logger.debug('Update Account Integration through CloudFormation Event - ' + str(event))
+            logger.debug('Update Account Integration through CloudFormation')
 
             # TODO: Require an implementation to fetch a list of existing Archera Account IDs
             # archera_update_stack_status = archera.update_stack(account_id=None)
@@ -97,7 +447,7 @@ def lambda_handler(event, context) -> dict:
 
         # Handling error response when the account update cloudformation API failed and there is an exception in calling the API.
         except Exception as e:
-            logger.exception('Update Account Error - ' + str(traceback.print_tb(e.__traceback__)))
+            logger.exception('Update Account Error - %s', traceback.print_tb(e.__traceback__))
             # Respond to HTTP request with failure message
             return {
                 'ArcheraRequestType': 'UPDATE',
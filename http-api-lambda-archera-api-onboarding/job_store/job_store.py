@@ -0,0 +1,109 @@
+import logging
+import json
+import uuid
+import time
+from os import environ, makedirs, replace, path
+
+from utils.utils import Utils
+
+# Job states. A job moves through the CREATE steps in this order and ends in SUCCEEDED or FAILED.
+JOB_STATE_ACCEPTED = 'ACCEPTED'
+JOB_STATE_CHILD_ACCOUNT_REGISTERED = 'CHILD_ACCOUNT_REGISTERED'
+JOB_STATE_ONBOARDING_STARTED = 'ONBOARDING_STARTED'
+JOB_STATE_SUCCEEDED = 'SUCCEEDED'
+JOB_STATE_FAILED = 'FAILED'
+
+JOB_STATES = [JOB_STATE_ACCEPTED, JOB_STATE_CHILD_ACCOUNT_REGISTERED, JOB_STATE_ONBOARDING_STARTED, JOB_STATE_SUCCEEDED]
+JOB_FINAL_STATES = [JOB_STATE_SUCCEEDED, JOB_STATE_FAILED]
+
+# JobStore - class to persist Archera onboarding jobs and their checkpoints
+# Jobs are stored as one JSON object per job under `JOB_STORE_KEY_PREFIX` in the S3 bucket `JOB_STORE_BUCKET_NAME`. Without a bucket, a local directory (`JOB_STORE_DIR`) stands in for S3, e.g. in tests and local runs.
+class JobStore:
+
+    # JobStore Constructor
+    # logger: Logger object
+    # region_name: AWS region of the S3 bucket
+    #
+    # Returns: JobStore object
+    # Raises: None
+    def __init__(self, logger: logging.Logger, region_name: str):
+        self.logger = logger
+        self.region_name = region_name
+        self.bucket_name = environ.get('JOB_STORE_BUCKET_NAME')
+        self.key_prefix = environ.get('JOB_STORE_KEY_PREFIX', 'archera-jobs/')
+        self.job_dir = environ.get('JOB_STORE_DIR', '/tmp/archera-jobs')
+
+    # is_local: Returns bool, True when the local directory is used instead of S3
+    def is_local(self) -> bool:
+        return not self.bucket_name
+
+    # __is_job_id: Returns bool, True when job_id is a job ID issued by `create_job`. Anything else is rejected before it is used in an object key or a file name.
+    def __is_job_id(self, job_id: str) -> bool:
+        try:
+            return str(uuid.UUID(str(job_id))) == str(job_id)
+        except ValueError:
+            return False
+
+    # create_job: Creates and saves a new job in the ACCEPTED state. Returns dict with the job record.
+    def create_job(self, job_type: str, request: dict) -> dict:
+
+        job = {
+            'JobId': str(uuid.uuid4()),
+            'JobType': job_type,
+            'State': JOB_STATE_ACCEPTED,
+            'Request': request,
+            'Checkpoints': {},
+            'Attempts': 0,
+            'LastError': None,
+            'CreatedAt': int(time.time()),
+            'UpdatedAt': int(time.time())
+        }
+
+        self.save_job(job=job)
+        self.logger.debug('Job %s created', job['JobId'])
+        return job
+
+    # save_job: Writes the job record, replacing the previous one. Local files are replaced atomically so a reader never sees a partial record.
+    def save_job(self, job: dict) -> None:
+
+        job['UpdatedAt'] = int(time.time())
+        job_body = json.dumps(job)
+
+        if self.is_local():
+            makedirs(self.job_dir, exist_ok=True)
+            with open(path.join(self.job_dir, job['JobId'] + '.json.tmp'), 'w') as job_file:
+                job_file.write(job_body)
+            replace(path.join(self.job_dir, job['JobId'] + '.json.tmp'), path.join(self.job_dir, job['JobId'] + '.json'))
+        else:
+            Utils(logger=self.logger).get_client('s3', region_name=self.region_name).put_object(
+                Bucket=self.bucket_name,
+                Key=self.key_prefix + job['JobId'] + '.json',
+                Body=job_body.encode('utf-8'),
+                ContentType='application/json'
+            )
+
+        self.logger.debug('Job %s saved in state %s', job['JobId'], job['State'])
+
+    # get_job: Returns dict with the job record, or None when there is no job with that ID
+    def get_job(self, job_id: str) -> dict:
+
+        if not self.__is_job_id(job_id):
+            return None
+
+        if self.is_local():
+            try:
+                with open(path.join(self.job_dir, job_id + '.json'), 'r') as job_file:
+                    return json.loads(job_file.read())
+            except FileNotFoundError:
+                return None
+
+        s3_client = Utils(logger=self.logger).get_client('s3', region_name=self.region_name)
+        try:
+            response = s3_client.get_object(
+                Bucket=self.bucket_name,
+                Key=self.key_prefix + job_id + '.json'
+            )
+        except s3_client.exceptions.NoSuchKey:
+            return None
+
+        return json.loads(response['Body'].read())
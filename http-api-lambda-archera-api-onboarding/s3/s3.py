@@ -1,9 +1,132 @@
 import logging
-from boto3 import client
+import json
+import io
+import hashlib
+import threading
+import time
+import zlib
 from botocore.exceptions import ClientError
 
+from utils.utils import Utils
+
+# Bytes buffered between the JSON serializer and the S3 upload
+JSON_STREAM_BUFFER_SIZE = 64 * 1024
+
+# Key layout of the content-addressed template store, below the template key prefix. Templates are keyed by the SHA-256 digest of their bytes
+# and each account gets a small pointer object naming the template it was last given.
+CONTENT_ADDRESSED_TEMPLATE_KEY = 'templates/{encoding}sha256-{digest}.json'
+CONTENT_ADDRESSED_POINTER_KEY = 'accounts/{account_key}.json'
+
+# Compression level for gzip-encoded objects. Level 6 is the gzip default and within a few percent of level 9 on JSON, at a fraction of the CPU.
+GZIP_COMPRESSION_LEVEL = 6
+
+# Nesting depth down to which JSONStream walks the document itself. Deeper values (e.g. a single CloudFormation resource) are encoded in one `json.dumps` call,
+# which uses the C encoder, while `json.JSONEncoder.iterencode` falls back to the pure Python one and is about 15 times slower.
+JSON_STREAM_SPLIT_DEPTH = 2
+
+# JSONStream - read-only file object which serializes a JSON document as it is read
+# The document is encoded one value at a time down to JSON_STREAM_SPLIT_DEPTH, so only the chunks not yet read are held in memory. The bytes match `json.dumps(document)`.
+class JSONStream(io.RawIOBase):
+
+    # JSONStream Constructor
+    # document: JSON serializable object
+    #
+    # Returns: JSONStream object
+    # Raises: None
+    def __init__(self, document):
+        self.chunks = self.__iter_json(value=document, depth=0)
+        self.pending = bytearray()
+
+    def readable(self) -> bool:
+        return True
+
+    # __iter_json: Yields str chunks of the serialized value. Dicts with non-string keys are left to `json.dumps`, which converts the keys.
+    def __iter_json(self, value, depth: int):
+
+        if depth < JSON_STREAM_SPLIT_DEPTH and isinstance(value, dict) and value and all(isinstance(x, str) for x in value):
+            separator = '{'
+            for item_key, item_value in value.items():
+                yield separator + json.dumps(item_key) + ': '
+                yield from self.__iter_json(value=item_value, depth=depth + 1)
+                separator = ', '
+            yield '}'
+
+        elif depth < JSON_STREAM_SPLIT_DEPTH and isinstance(value, (list, tuple)) and value:
+            separator = '['
+            for item_value in value:
+                yield separator
+                yield from self.__iter_json(value=item_value, depth=depth + 1)
+                separator = ', '
+            yield ']'
+
+        else:
+            yield json.dumps(value)
+
+    # readinto: Fills the buffer with the next bytes of the serialized document. Returns int with the number of bytes read, 0 at the end of the document.
+    # Chunks are copied straight into the buffer, only the part of a chunk which does not fit is kept for the next read.
+    def readinto(self, buffer) -> int:
+
+        buffer = memoryview(buffer).cast('B')
+
+        read_size = min(len(buffer), len(self.pending))
+        buffer[:read_size] = self.pending[:read_size]
+        del self.pending[:read_size]
+
+        while read_size < len(buffer):
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            chunk = chunk.encode('utf-8')
+            chunk_size = min(len(buffer) - read_size, len(chunk))
+            buffer[read_size:read_size + chunk_size] = chunk[:chunk_size]
+            self.pending.extend(chunk[chunk_size:])
+            read_size += chunk_size
+
+        return read_size
+
+# GzipStream - read-only file object which gzip-compresses another file object as it is read
+# The source is read and compressed JSON_STREAM_BUFFER_SIZE bytes at a time, so neither the source nor the compressed bytes are held in full.
+# The gzip header carries no timestamp or file name, so the same input always compresses to the same bytes.
+class GzipStream(io.RawIOBase):
+
+    # GzipStream Constructor
+    # source: Readable file object with the bytes to compress
+    #
+    # Returns: GzipStream object
+    # Raises: None
+    def __init__(self, source):
+        self.source = source
+        self.compressor = zlib.compressobj(GZIP_COMPRESSION_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        self.pending = bytearray()
+        self.is_source_read = False
+
+    def readable(self) -> bool:
+        return True
+
+    # readinto: Fills the buffer with the next compressed bytes. Returns int with the number of bytes read, 0 once the gzip trailer was read.
+    def readinto(self, buffer) -> int:
+
+        while len(self.pending) < len(buffer) and not self.is_source_read:
+            source_chunk = self.source.read(JSON_STREAM_BUFFER_SIZE)
+            if source_chunk:
+                self.pending.extend(self.compressor.compress(source_chunk))
+            else:
+                self.pending.extend(self.compressor.flush())
+                self.is_source_read = True
+
+        read_size = min(len(buffer), len(self.pending))
+        memoryview(buffer).cast('B')[:read_size] = self.pending[:read_size]
+        del self.pending[:read_size]
+
+        return read_size
+
 class s3CopyFiles:
 
+    # Content-addressed objects known to exist, shared by every s3CopyFiles object in the execution environment. Keyed by (bucket, key), so warm invocations skip the HEAD.
+    # Pointers are not cached, since another execution environment may have pointed them at a different object since.
+    content_addressed_cache = {}
+    content_addressed_cache_lock = threading.Lock()
+
     # s3CopyFiles Constructor
     # logger: Logger object
     # config: Config Dict
@@ -14,7 +137,7 @@ class s3CopyFiles:
 
         self.logger = logger
         self.region_name = region_name
-        self.s3_client = client('s3', region_name=self.region_name)
+        self.s3_client = Utils(logger=self.logger).get_client('s3', region_name=self.region_name)
 
     # check_s3_object_exists: Check if a file exists on an S3 bucket, returns `bool`. 
     def check_s3_object_exists(self, bucket_name: str, object_key: str) -> bool:
@@ -32,32 +155,105 @@ class s3CopyFiles:
             else:
                 raise
 
-    # s3_put_object: Put S3 object into destination bucket
-    def s3_put_object(self, dst_bucket: str, dst_key_prefix: str, dst_key: str, data: str, expiration=3600) -> str:
+    # __get_presigned_url: Returns str with a presigned GET URL for the S3 object, valid for `expiration` seconds
+    def __get_presigned_url(self, bucket_name: str, object_key: str, expiration: int) -> str:
+
+        presigned_url = self.s3_client.generate_presigned_url(
+            ClientMethod='get_object',
+            Params={'Bucket': bucket_name, 'Key': object_key},
+            ExpiresIn=expiration
+        )
+        self.logger.debug("Generated presigned URL: %s", presigned_url)
+        return presigned_url
+
+    # get_json_digest: Returns str with the hex SHA-256 digest of the serialized JSON document, as uploaded by `s3_upload_json`. The document is hashed as it is serialized.
+    def get_json_digest(self, document) -> str:
+
+        json_digest = hashlib.sha256()
+        json_stream = io.BufferedReader(JSONStream(document=document), buffer_size=JSON_STREAM_BUFFER_SIZE)
 
-        # Create the file locally
-        with open('/tmp/' + dst_key + '.json', 'w+') as file:
-            file.write(data)
+        for json_chunk in iter(lambda: json_stream.read(JSON_STREAM_BUFFER_SIZE), b''):
+            json_digest.update(json_chunk)
+
+        return json_digest.hexdigest()
+
+    # s3_upload_json_content_addressed: Stores a JSON document under the digest of its content and points the account's pointer object at it.
+    # The digest is taken over the uncompressed JSON, gzip-encoded objects are kept under their own `gzip/` key so both encodings can coexist in one bucket.
+    # An identical document is uploaded once per bucket. When it already exists (from the local cache, or else a single HEAD) only the pointer is written.
+    # Returns str with a presigned URL for the content-addressed object, or None when the upload failed.
+    def s3_upload_json_content_addressed(self, dst_bucket: str, dst_key_prefix: str, dst_key: str, document, expiration=3600, compress: bool = False) -> str:
 
-        # Upload file to S3
         try:
-            self.s3_client.upload_file(
-                Filename='/tmp/' + dst_key + '.json',
+            json_digest = self.get_json_digest(document=document)
+            object_key = dst_key_prefix + CONTENT_ADDRESSED_TEMPLATE_KEY.format(encoding='gzip/' if compress else '', digest=json_digest)
+            pointer_key = dst_key_prefix + CONTENT_ADDRESSED_POINTER_KEY.format(account_key=dst_key)
+
+            with s3CopyFiles.content_addressed_cache_lock:
+                is_cached = s3CopyFiles.content_addressed_cache.get((dst_bucket, object_key), False)
+
+            if is_cached or self.check_s3_object_exists(bucket_name=dst_bucket, object_key=object_key):
+                self.logger.debug('Object %s already exists in bucket %s. Skipping upload.', object_key, dst_bucket)
+            elif self.s3_upload_json(dst_bucket=dst_bucket, dst_key_prefix='', dst_key=object_key, document=document, compress=compress) is None:
+                return None
+
+            with s3CopyFiles.content_addressed_cache_lock:
+                s3CopyFiles.content_addressed_cache[(dst_bucket, object_key)] = True
+
+            self.s3_client.put_object(
                 Bucket=dst_bucket,
-                Key=dst_key_prefix + dst_key
+                Key=pointer_key,
+                Body=json.dumps({'Key': object_key, 'Digest': json_digest, 'UpdatedAt': int(time.time())}).encode('utf-8'),
+                ContentType='application/json'
             )
-            self.logger.debug('File ' + dst_key + ' uploaded to bucket ' + dst_bucket + '/' + dst_key_prefix + '.')
 
-            # Generate a presigned URL for the uploaded file
-            presigned_url = self.s3_client.generate_presigned_url(
-                ClientMethod='get_object',
-                Params={'Bucket': dst_bucket, 'Key': dst_key_prefix + dst_key},
-                ExpiresIn=expiration
+            self.logger.debug('Pointer %s in bucket %s points at %s.', pointer_key, dst_bucket, object_key)
+
+            return self.__get_presigned_url(bucket_name=dst_bucket, object_key=object_key, expiration=expiration)
+
+        except Exception as e:
+            self.logger.exception("Error uploading file or generating URL: %s", e)
+            return None
+
+    # s3_put_object: Put S3 object into destination bucket straight from memory. Returns str with a presigned URL for the object, or None when the upload failed.
+    def s3_put_object(self, dst_bucket: str, dst_key_prefix: str, dst_key: str, data: str, expiration=3600) -> str:
+
+        try:
+            self.s3_client.put_object(
+                Bucket=dst_bucket,
+                Key=dst_key_prefix + dst_key,
+                Body=data.encode('utf-8') if isinstance(data, str) else data
             )
-            self.logger.debug("Generated presigned URL: " + str(presigned_url))
-            return presigned_url
+            self.logger.debug('File %s uploaded to bucket %s/%s.', dst_key, dst_bucket, dst_key_prefix)
+
+            return self.__get_presigned_url(bucket_name=dst_bucket, object_key=dst_key_prefix + dst_key, expiration=expiration)
 
         except Exception as e:
-            self.logger.exception(f"Error uploading file or generating URL: {e}")
+            self.logger.exception("Error uploading file or generating URL: %s", e)
             return None
 
+    # s3_upload_json: Uploads a JSON document to the destination bucket, serializing it while it is uploaded. Neither the serialized document nor a local file is ever held in full.
+    # With `compress`, the JSON is gzip-compressed on the fly and stored with `Content-Encoding: gzip`, so clients following the presigned URL download the compressed bytes and decompress them transparently.
+    # Returns str with a presigned URL for the object, or None when the upload failed.
+    def s3_upload_json(self, dst_bucket: str, dst_key_prefix: str, dst_key: str, document, expiration=3600, compress: bool = False) -> str:
+
+        json_stream = io.BufferedReader(JSONStream(document=document), buffer_size=JSON_STREAM_BUFFER_SIZE)
+        extra_args = {'ContentType': 'application/json'}
+
+        if compress:
+            json_stream = io.BufferedReader(GzipStream(source=json_stream), buffer_size=JSON_STREAM_BUFFER_SIZE)
+            extra_args.update({'ContentEncoding': 'gzip'})
+
+        try:
+            self.s3_client.upload_fileobj(
+                Fileobj=json_stream,
+                Bucket=dst_bucket,
+                Key=dst_key_prefix + dst_key,
+                ExtraArgs=extra_args
+            )
+            self.logger.debug('File %s uploaded to bucket %s/%s.', dst_key, dst_bucket, dst_key_prefix)
+
+            return self.__get_presigned_url(bucket_name=dst_bucket, object_key=dst_key_prefix + dst_key, expiration=expiration)
+
+        except Exception as e:
+            self.logger.exception("Error uploading file or generating URL: %s", e)
+            return None
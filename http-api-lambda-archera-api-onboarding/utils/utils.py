@@ -1,10 +1,62 @@
-from boto3 import session, client
-from botocore.exceptions import ClientError
+from os import environ
 import logging
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import base64
+import zlib
+
+# boto3 and botocore are imported by the methods that use them, so a cold start only pays for them once an AWS call is actually made
+
+# Default time-to-live in seconds for cached SSM parameter values. Can be overridden with the `SSM_PARAMETER_CACHE_TTL` environment variable.
+DEFAULT_SSM_PARAMETER_CACHE_TTL = 300
+
+# Default botocore client settings used by the shared client registry. Each one can be overridden with the environment variable of the same name.
+# Pool sizes are kept small for 128 MB functions, but large enough for the concurrent prefetch and delivery threads.
+DEFAULT_AWS_CLIENT_CONFIG = {
+    'AWS_CLIENT_MAX_POOL_CONNECTIONS': 10,
+    'AWS_CLIENT_CONNECT_TIMEOUT': 3,
+    'AWS_CLIENT_READ_TIMEOUT': 10,
+    'AWS_CLIENT_MAX_ATTEMPTS': 3
+}
+
+# SSM GetParameters accepts at most 10 parameter names per call.
+SSM_GET_PARAMETERS_BATCH_SIZE = 10
+
+# Upper bound for the number of concurrent SSM and Secrets Manager calls made while prefetching.
+MAX_PREFETCH_WORKERS = 8
+
+# Default limit in bytes for a decompressed HTTP request body, so a small gzip body cannot expand without bound. Can be overridden with the `MAX_HTTP_BODY_SIZE` environment variable.
+DEFAULT_MAX_HTTP_BODY_SIZE = 10 * 1024 * 1024
+
+# Leading bytes of a gzip stream, used to detect compressed bodies sent without a Content-Encoding header
+GZIP_MAGIC_NUMBER = b'\x1f\x8b'
 
 class Utils:
 
+    # SSM parameter cache shared by every Utils object in the execution environment, so cached values survive across warm invocations.
+    # Keyed by (region_name, parameter_name, with_decryption). Each entry holds the value, the parameter version, the TTL and the expiry timestamp.
+    ssm_parameter_cache = {}
+    ssm_parameter_cache_stats = {'hits': 0, 'misses': 0, 'refreshes': 0, 'invalidations': 0}
+    ssm_parameter_cache_lock = threading.Lock()
+
+    # boto3 client registry shared by every Utils object in the execution environment, so clients and their HTTP connection pools are reused across warm invocations.
+    # Keyed by (service_name, region_name). Populated lazily by `get_client`.
+    aws_client_registry = {}
+    aws_client_registry_lock = threading.Lock()
+    aws_session = None
+
+    # Secrets Manager cache shared by every Utils object in the execution environment. Keyed by (region_name, secret_arn).
+    aws_secret_cache = {}
+
+    # Subsystems created on first use by `get_lazy`, shared by every Utils object in the execution environment. Keyed by name.
+    # The lock is re-entrant so one factory can depend on another lazy subsystem.
+    lazy_registry = {}
+    lazy_registry_lock = threading.RLock()
+    # Milliseconds spent creating each lazy subsystem, for the init report
+    lazy_init_durations = {}
+
     # Utils Constructor
     # logger: Logger object
     #
@@ -13,69 +65,399 @@ class Utils:
     def __init__(self, logger: logging.Logger):
         self.logger = logger
 
+    # get_lazy: Returns the subsystem registered under `name`, calling `factory()` to create it on first use. The subsystem is then reused across warm invocations.
+    def get_lazy(self, name: str, factory):
+
+        if name in Utils.lazy_registry:
+            return Utils.lazy_registry[name]
+
+        with Utils.lazy_registry_lock:
+            if name not in Utils.lazy_registry:
+                started_at = time.perf_counter()
+                Utils.lazy_registry[name] = factory()
+                Utils.lazy_init_durations[name] = round((time.perf_counter() - started_at) * 1000, 1)
+                self.logger.debug('Initialised %s in %sms', name, Utils.lazy_init_durations[name])
+
+        return Utils.lazy_registry[name]
+
+    # get_init_report: Returns dict with the milliseconds spent creating each lazy subsystem so far
+    def get_init_report(self) -> dict:
+        with Utils.lazy_registry_lock:
+            return dict(Utils.lazy_init_durations)
+
+    # report_init: Logs the milliseconds spent in the init phase since `started_at` (a time.perf_counter value), the number of modules loaded and the lazy subsystems created so far.
+    # Warns when the init phase took longer than the `INIT_BUDGET_MS` environment variable. Returns float with the init duration in milliseconds.
+    def report_init(self, started_at: float) -> float:
+
+        import sys
+
+        init_duration_ms = round((time.perf_counter() - started_at) * 1000, 1)
+        self.logger.info('Init completed in %sms with %s modules loaded. Lazy subsystems: %s', init_duration_ms, len(sys.modules), self.get_init_report())
+
+        if environ.get('INIT_BUDGET_MS') and init_duration_ms > float(environ.get('INIT_BUDGET_MS')):
+            self.logger.warning('Init took %sms, over the budget of %sms', init_duration_ms, environ.get('INIT_BUDGET_MS'))
+
+        return init_duration_ms
+
+    # get_http_body: Returns bytes with the body of an API Gateway event, base64-decoded when `isBase64Encoded` is set and decompressed when it is gzip-compressed.
+    # A body is treated as gzip when the `Content-Encoding` header says so or when it starts with the gzip magic number. Returns None when the event has no body.
+    # Raises: Exception when the body is not valid gzip or is larger than MAX_HTTP_BODY_SIZE once decompressed
+    def get_http_body(self, event: dict) -> bytes:
+
+        http_body = event.get('body')
+
+        if http_body is None:
+            return None
+
+        http_body = base64.b64decode(http_body) if event.get('isBase64Encoded') else (http_body.encode('utf-8') if isinstance(http_body, str) else http_body)
+
+        content_encoding = {str(x).lower(): str(y).lower() for x, y in (event.get('headers') or {}).items()}.get('content-encoding', '')
+
+        if 'gzip' not in content_encoding and not http_body.startswith(GZIP_MAGIC_NUMBER):
+            return http_body
+
+        max_http_body_size = int(environ.get('MAX_HTTP_BODY_SIZE', DEFAULT_MAX_HTTP_BODY_SIZE))
+
+        try:
+            decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+            decompressed_body = decompressor.decompress(http_body, max_http_body_size + 1)
+        except zlib.error as e:
+            raise Exception('Invalid gzip request body - ' + str(e))
+
+        if len(decompressed_body) > max_http_body_size:
+            raise Exception('Request body is larger than ' + str(max_http_body_size) + ' bytes once decompressed')
+
+        if not decompressor.eof:
+            raise Exception('Invalid gzip request body - stream is truncated')
+
+        self.logger.debug('Decompressed gzip request body from %s to %s bytes', len(http_body), len(decompressed_body))
+        return decompressed_body
+
+    # get_client_config: Returns the botocore Config used for every client in the registry, with connection pooling, TCP keep-alive, timeouts and the standard retry mode.
+    def get_client_config(self):
+
+        from botocore.config import Config
+
+        client_config = dict(DEFAULT_AWS_CLIENT_CONFIG)
+        for config_key in client_config.keys():
+            if config_key in environ.keys():
+                try:
+                    client_config.update({config_key: int(environ[config_key])})
+                except ValueError:
+                    self.logger.error('Error: Invalid %s value. Using default value %s.', config_key, client_config[config_key])
+
+        return Config(
+            max_pool_connections=client_config['AWS_CLIENT_MAX_POOL_CONNECTIONS'],
+            connect_timeout=client_config['AWS_CLIENT_CONNECT_TIMEOUT'],
+            read_timeout=client_config['AWS_CLIENT_READ_TIMEOUT'],
+            tcp_keepalive=True,
+            retries={
+                'mode': 'standard',
+                'max_attempts': client_config['AWS_CLIENT_MAX_ATTEMPTS']
+            }
+        )
+
+    # get_client: Returns the shared boto3 client for the given service and region, creating it on first use. Clients are thread-safe and reused across warm invocations.
+    def get_client(self, service_name: str, region_name: str):
+
+        registry_key = (service_name, region_name)
+
+        aws_client = Utils.aws_client_registry.get(registry_key)
+        if aws_client:
+            return aws_client
+
+        # boto3 sessions are not thread-safe, so client creation is serialised
+        with Utils.aws_client_registry_lock:
+            aws_client = Utils.aws_client_registry.get(registry_key)
+            if aws_client is None:
+                if Utils.aws_session is None:
+                    from boto3 import session
+                    Utils.aws_session = session.Session()
+                self.logger.debug('Creating boto3 client for %s in %s', service_name, region_name)
+                aws_client = Utils.aws_session.client(
+                    service_name=service_name,
+                    region_name=region_name,
+                    config=self.get_client_config()
+                )
+                Utils.aws_client_registry[registry_key] = aws_client
+
+        return aws_client
+
     # get_aws_secret: Gets a secret from Ibexlabs AWS Secrets Manager. Returns str with the secret value.
-    def get_aws_secret(self, secret_arn: str, region_name: str) -> str:    
-        
-        # Create a Secrets Manager client
-        boto3_session = session.Session()
-        secrets_client = boto3_session.client(
+    # Secrets resolved by `prefetch` (or a previous call) are served from the in-process cache until their TTL expires, unless `force_refresh` is set.
+    def get_aws_secret(self, secret_arn: str, region_name: str, force_refresh: bool = False) -> str:
+
+        cache_key = (region_name, secret_arn)
+
+        with Utils.ssm_parameter_cache_lock:
+            cached_secret = Utils.aws_secret_cache.get(cache_key)
+            if cached_secret and cached_secret['expires_at'] > time.monotonic() and not force_refresh:
+                return cached_secret['value']
+
+        secret_value = self.__get_aws_secret(secret_arn=secret_arn, region_name=region_name)
+
+        # Nothing is cached for a secret without a value, so the next call reads Secrets Manager again
+        if secret_value is None:
+            return None
+
+        with Utils.ssm_parameter_cache_lock:
+            Utils.aws_secret_cache[cache_key] = {
+                'value': secret_value,
+                'expires_at': time.monotonic() + self.get_ssm_parameter_cache_ttl()
+            }
+
+        return secret_value
+
+    # __get_aws_secret: Reads a secret from AWS Secrets Manager, bypassing the cache. Returns str with the secret value.
+    # Raises: ClientError when Secrets Manager rejects the call
+    def __get_aws_secret(self, secret_arn: str, region_name: str) -> str:
+
+        from botocore.exceptions import ClientError
+
+        # Get the shared Secrets Manager client
+        secrets_client = self.get_client(
             service_name='secretsmanager',
             region_name=region_name
         )
 
         try:
-            self.logger.info('Secret ARN: ' + str(secret_arn))
+            self.logger.info('Secret ARN: %s', secret_arn)
             secret = secrets_client.get_secret_value(
                 SecretId=secret_arn
             )
             if type(secret['SecretString']) == type({}):
                 import json
                 secret_dict = json.loads(secret['SecretString'])
-                self.logger.debug('Secret ARN: ' + str(secret_dict))
+                self.logger.debug('Secret ARN: %s', secret_dict)
                 return secret_dict
             else:
-                secret_str = secret['SecretString']
-                self.logger.debug('Secret value: ' + str(secret_str))
-                return secret_str
+                return secret['SecretString']
         
         except ClientError as e:
             if e.response['Error']['Code'] == 'DecryptionFailureException':
                 # Secrets Manager can't decrypt the protected secret text using the provided KMS key.
                 # Deal with the exception here, and/or rethrow at your discretion.
-                self.logger.error('Error: DecryptionFailureException. ' + str(traceback.print_tb(e.__traceback__)))
+                self.logger.error('Error: DecryptionFailureException. %s', traceback.print_tb(e.__traceback__))
                 raise e
             elif e.response['Error']['Code'] == 'InternalServiceErrorException':
                 # An error occurred on the server side.
-                self.logger.error('Error: InternalServiceErrorException. ' + str(traceback.print_tb(e.__traceback__)))
+                self.logger.error('Error: InternalServiceErrorException. %s', traceback.print_tb(e.__traceback__))
+                raise e
+            else:
+                self.logger.error('Error: %s. %s', e.response['Error']['Code'], traceback.print_tb(e.__traceback__))
                 raise e
 
-    # get_ssm_parameter: Gets the value from Ibexlabs AWS SSM Parameter Store. Returns str with the parameter value.
-    def get_ssm_parameter(self, parameter_name: str, region_name: str) -> str:
-        
-        # Create a SSM client
-        ssm_client = client(
+    # get_ssm_parameter_cache_ttl: Returns the default TTL in seconds for cached SSM parameters.
+    def get_ssm_parameter_cache_ttl(self) -> int:
+        try:
+            return int(environ.get('SSM_PARAMETER_CACHE_TTL', DEFAULT_SSM_PARAMETER_CACHE_TTL))
+        except ValueError:
+            self.logger.error('Error: Invalid SSM_PARAMETER_CACHE_TTL value. Using default TTL of %s seconds.', DEFAULT_SSM_PARAMETER_CACHE_TTL)
+            return DEFAULT_SSM_PARAMETER_CACHE_TTL
+
+    # get_ssm_parameter_cache_stats: Returns dict with the SSM parameter cache hit, miss, refresh and invalidation counters.
+    def get_ssm_parameter_cache_stats(self) -> dict:
+        with Utils.ssm_parameter_cache_lock:
+            stats = dict(Utils.ssm_parameter_cache_stats)
+            stats.update({'size': len(Utils.ssm_parameter_cache)})
+        return stats
+
+    # prefetch: Resolves all SSM parameters and Secrets Manager secrets needed by a Lambda function in one go, typically during the init phase.
+    # SSM parameters are read with batched GetParameters calls and secrets with parallel GetSecretValue calls. Results are stored in the in-process caches,
+    # so later `get_ssm_parameter` and `get_aws_secret` calls are cache hits. Returns dict mapping each parameter name or secret ARN to its value.
+    def prefetch(self, region_name: str, ssm_parameter_names: list = [], secret_arns: list = [], with_decryption: bool = False, force_refresh: bool = False) -> dict:
+
+        now = time.monotonic()
+        prefetched_values = {}
+
+        # Skip empty names, duplicates and values which are still fresh in the cache. With `force_refresh`, every value is read again.
+        missing_parameter_names = []
+        missing_secret_arns = []
+        with Utils.ssm_parameter_cache_lock:
+            for parameter_name in ssm_parameter_names:
+                if not parameter_name or parameter_name in missing_parameter_names:
+                    continue
+                cached_parameter = Utils.ssm_parameter_cache.get((region_name, parameter_name, with_decryption))
+                if cached_parameter and cached_parameter['expires_at'] > now and not force_refresh:
+                    prefetched_values.update({parameter_name: cached_parameter['value']})
+                else:
+                    missing_parameter_names.append(parameter_name)
+
+            for secret_arn in secret_arns:
+                if not secret_arn or secret_arn in missing_secret_arns:
+                    continue
+                cached_secret = Utils.aws_secret_cache.get((region_name, secret_arn))
+                if cached_secret and cached_secret['expires_at'] > now and not force_refresh:
+                    prefetched_values.update({secret_arn: cached_secret['value']})
+                else:
+                    missing_secret_arns.append(secret_arn)
+
+        parameter_batches = [missing_parameter_names[i:i + SSM_GET_PARAMETERS_BATCH_SIZE] for i in range(0, len(missing_parameter_names), SSM_GET_PARAMETERS_BATCH_SIZE)]
+        if not parameter_batches and not missing_secret_arns:
+            return prefetched_values
+
+        self.logger.debug('Prefetching SSM parameters %s and secrets %s', missing_parameter_names, missing_secret_arns)
+
+        with ThreadPoolExecutor(max_workers=min(MAX_PREFETCH_WORKERS, len(parameter_batches) + len(missing_secret_arns))) as executor:
+
+            parameter_futures = [
+                executor.submit(self.__get_ssm_parameters, parameter_names=batch, region_name=region_name, with_decryption=with_decryption)
+                for batch in parameter_batches
+            ]
+            secret_futures = {
+                secret_arn: executor.submit(self.get_aws_secret, secret_arn=secret_arn, region_name=region_name, force_refresh=force_refresh)
+                for secret_arn in missing_secret_arns
+            }
+
+            ttl = self.get_ssm_parameter_cache_ttl()
+            for future in parameter_futures:
+                parameters = future.result()
+                with Utils.ssm_parameter_cache_lock:
+                    for parameter_name, parameter in parameters.items():
+                        Utils.ssm_parameter_cache[(region_name, parameter_name, with_decryption)] = {
+                            'value': parameter['Value'],
+                            'version': parameter['Version'],
+                            'ttl': ttl,
+                            'expires_at': time.monotonic() + ttl
+                        }
+                        prefetched_values.update({parameter_name: parameter['Value']})
+
+            for secret_arn, future in secret_futures.items():
+                prefetched_values.update({secret_arn: future.result()})
+
+        return prefetched_values
+
+    # __get_ssm_parameters: Reads up to 10 parameters from AWS SSM Parameter Store with a single GetParameters call, bypassing the cache.
+    # Returns dict mapping each parameter name to a dict with the parameter `Value` and `Version`.
+    def __get_ssm_parameters(self, parameter_names: list, region_name: str, with_decryption: bool = False) -> dict:
+
+        from botocore.exceptions import ClientError
+
+        # Get the shared SSM client
+        ssm_client = self.get_client(
+            service_name='ssm',
+            region_name=region_name
+        )
+
+        try:
+            self.logger.info('SSM Parameter Names: %s', parameter_names)
+            response = ssm_client.get_parameters(
+                Names=parameter_names,
+                WithDecryption=with_decryption
+            )
+
+            if response.get('InvalidParameters'):
+                # AWS SSM Parameter Store can't find some of the provided parameter keys. They are left out of the cache and fetched (and reported) individually on first use.
+                self.logger.error('Error: ParameterNotFound. %s', response['InvalidParameters'])
+
+            return {
+                parameter['Name']: {
+                    'Value': parameter['Value'],
+                    'Version': parameter.get('Version', 0)
+                }
+                for parameter in response.get('Parameters', [])
+            }
+
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'InternalServerError':
+                # An error occurred on the server side.
+                self.logger.error('Error: InternalServerError. %s', traceback.print_tb(e.__traceback__))
+            raise e
+
+    # get_ssm_parameter_version: Returns int with the version of the cached parameter value, or None when the parameter is not cached
+    def get_ssm_parameter_version(self, parameter_name: str, region_name: str, with_decryption: bool = False) -> int:
+        with Utils.ssm_parameter_cache_lock:
+            cached_parameter = Utils.ssm_parameter_cache.get((region_name, parameter_name, with_decryption))
+            return cached_parameter['version'] if cached_parameter else None
+
+    # invalidate_ssm_parameter: Removes a parameter from the SSM parameter cache, or clears the whole cache when no parameter name is provided.
+    def invalidate_ssm_parameter(self, parameter_name: str = None, region_name: str = None) -> None:
+        with Utils.ssm_parameter_cache_lock:
+            if parameter_name is None:
+                Utils.ssm_parameter_cache.clear()
+                return
+            for cache_key in [x for x in Utils.ssm_parameter_cache.keys() if x[1] == parameter_name and (region_name is None or x[0] == region_name)]:
+                del Utils.ssm_parameter_cache[cache_key]
+
+    # get_ssm_parameter: Gets the value from Ibexlabs AWS SSM Parameter Store. Returns str with the parameter value, or None when SSM returned no value.
+    # Values are served from the in-process cache until their TTL expires. An expired entry is re-read from SSM and replaced when the parameter version has changed.
+    # Passing `version` forces a re-read when the cached value is older than the expected parameter version.
+    def get_ssm_parameter(self, parameter_name: str, region_name: str, with_decryption: bool = False, ttl: int = None, version: int = None) -> str:
+
+        cache_key = (region_name, parameter_name, with_decryption)
+        now = time.monotonic()
+
+        with Utils.ssm_parameter_cache_lock:
+            cached_parameter = Utils.ssm_parameter_cache.get(cache_key)
+            if cached_parameter and cached_parameter['expires_at'] > now and (version is None or cached_parameter['version'] >= version):
+                Utils.ssm_parameter_cache_stats['hits'] += 1
+                return cached_parameter['value']
+            Utils.ssm_parameter_cache_stats['misses'] += 1
+
+        parameter = self.__get_ssm_parameter(
+            parameter_name=parameter_name,
+            region_name=region_name,
+            with_decryption=with_decryption
+        )
+
+        # Nothing is cached for a parameter without a value, so the next call reads SSM again
+        if parameter is None:
+            return None
+
+        ttl = ttl if ttl is not None else (cached_parameter['ttl'] if cached_parameter else self.get_ssm_parameter_cache_ttl())
+
+        with Utils.ssm_parameter_cache_lock:
+            if cached_parameter:
+                if cached_parameter['version'] != parameter['Version']:
+                    self.logger.info('SSM Parameter %s changed from version %s to %s. Invalidating cached value.', parameter_name, cached_parameter['version'], parameter['Version'])
+                    Utils.ssm_parameter_cache_stats['invalidations'] += 1
+                else:
+                    Utils.ssm_parameter_cache_stats['refreshes'] += 1
+
+            Utils.ssm_parameter_cache[cache_key] = {
+                'value': parameter['Value'],
+                'version': parameter['Version'],
+                'ttl': ttl,
+                'expires_at': time.monotonic() + ttl
+            }
+
+        return parameter['Value']
+
+    # __get_ssm_parameter: Reads a parameter from AWS SSM Parameter Store, bypassing the cache. Returns dict with the parameter `Value` and `Version`, or None when the response has no value.
+    # Raises: ClientError when SSM rejects the call, e.g. ParameterNotFound
+    def __get_ssm_parameter(self, parameter_name: str, region_name: str, with_decryption: bool = False) -> dict:
+
+        from botocore.exceptions import ClientError
+
+        # Get the shared SSM client
+        ssm_client = self.get_client(
             service_name='ssm',
             region_name=region_name
         )
 
         try:
-            self.logger.info('SSM Parameter Name: ' + str(parameter_name))
+            self.logger.info('SSM Parameter Name: %s', parameter_name)
             parameter_value = ssm_client.get_parameter(
-                Name=parameter_name
+                Name=parameter_name,
+                WithDecryption=with_decryption
             )
-            if 'Parameter' in parameter_value.keys():
-                if 'Value' in parameter_value['Parameter'].keys():
-                    return parameter_value['Parameter']['Value']
-            else:
-                self.logger.error('Error: ParameterNotFound. ')
-                raise ssm_client.exceptions.ParameterNotFound
 
-        except Exception as e:
+        except ClientError as e:
             if e.response['Error']['Code'] == 'ParameterNotFound':
                 # AWS SSM Parameter Store can't find the provided parameter key and rethrow the exception
-                self.logger.error('Error: ParameterNotFound. ' + str(traceback.print_tb(e.__traceback__)))
-                raise e
+                self.logger.error('Error: ParameterNotFound. %s', traceback.print_tb(e.__traceback__))
             elif e.response['Error']['Code'] == 'InternalServerError':
                 # An error occurred on the server side.
-                self.logger.error('Error: InternalServerError. ' + str(traceback.print_tb(e.__traceback__)))
-                raise e
\ No newline at end of file
+                self.logger.error('Error: InternalServerError. %s', traceback.print_tb(e.__traceback__))
+            else:
+                self.logger.error('Error: %s. %s', e.response['Error']['Code'], traceback.print_tb(e.__traceback__))
+            raise e
+
+        if 'Value' not in parameter_value.get('Parameter', {}):
+            self.logger.error('Error: SSM Parameter %s has no value.', parameter_name)
+            return None
+
+        return {
+            'Value': parameter_value['Parameter']['Value'],
+            'Version': parameter_value['Parameter'].get('Version', 0)
+        }
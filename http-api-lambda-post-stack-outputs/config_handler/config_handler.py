@@ -1,8 +1,9 @@
-from os import environ, getcwd, listdir
-import re
+from os import environ, getcwd, path, replace
 import logging
-import traceback
 import json
+import copy
+import threading
+import time
 
 from utils.utils import Utils
 
@@ -16,30 +17,43 @@ ConfigKeyValuePair = {
     'ENABLE_JIRA_INTEGRATION': 'jira.enabled'
 }
 
+# Expected type of every config key. The compile step rejects config.json files which do not match.
+ConfigKeyTypes = {
+    'jira.cloud_url': str,
+    'jira.project_key': str,
+    'jira.auth_email': str,
+    'jira.api_token': str,
+    'jira.default_issue_labels': list,
+    'jira.enabled': bool,
+    'routing.default': dict,
+    'routing.rules': list
+}
+
+# Config keys whose environment variable holds the name of the SSM parameter with the value, instead of the value itself
+ConfigSSMKeys = ['jira.api_token']
+
+# Compiled config snapshot, written at build time next to the handler module by `python3 -m config_handler.config_handler`
+CONFIG_SNAPSHOT_FILE = 'config_snapshot.json'
+CONFIG_SNAPSHOT_PATH = path.join(path.dirname(path.dirname(path.abspath(__file__))), CONFIG_SNAPSHOT_FILE)
+
 # ConfigHandler: class to handle configuration file and environment variables
 class ConfigHandler():
 
+    # Config snapshot shared by every ConfigHandler object in the execution environment, loaded once per cold start
+    config_snapshot = None
+    config_snapshot_lock = threading.Lock()
+
     # ConfigHandler Constructor
-    # jira_cloud_url: str
-    # jira_project_key: str
-    # jira_auth_email: str
-    # jira_api_token: str
-    # jira_default_issue_labels: list
-    # jira_enabled: bool
+    # logger: Logger object
+    # region_name: AWS region of the SSM parameters referenced by the environment variables in ConfigSSMKeys
     #
     # Returns: ConfigHandler object
     # Raises: None
     def __init__(self, logger: logging.Logger, region_name: str):
 
-        # Create a JSON Config parser
         self.logger = logger
-        self.jira_cloud_url = self.jira_project_key = self.jira_auth_email = ''
-
-        utilsObj = Utils(logger=logger)
-        self.jira_api_token = utilsObj.get_ssm_parameter(
-            parameter_name=environ.get("JIRA_API_TOKEN"),
-            region_name=region_name
-        )
+        self.region_name = region_name
+        self.jira_cloud_url = self.jira_project_key = self.jira_auth_email = self.jira_api_token = ''
         self.jira_default_issue_labels = []
         self.jira_enabled = False
         self.config = self.build_config()
@@ -59,153 +73,168 @@ class ConfigHandler():
                 'api_token': self.jira_api_token,
                 'default_issue_labels': self.jira_default_issue_labels,
                 'enabled': False
+            },
+            'routing': {
+                'default': {},
+                'rules': []
             }
         }
 
-    # Load the config.json file from the current working directory, or from the GITHUB_WORKSPACE environment variable if running inside GitHub Actions
+    # Load the config.json file from the current working directory, or from the GITHUB_WORKSPACE environment variable if running inside GitHub Actions. Returns an empty dict when there is no config.json.
     def __load_config_file(self) -> dict:
 
+        local_directory = getcwd()
+
+        if 'GITHUB_ACTIONS' in environ.keys():
+
+            self.logger.debug('Running inside GitHub Actions')
+            local_directory = environ.get('GITHUB_WORKSPACE')
+
         try:
-            config = {}
-            local_directory = getcwd()
+            with open(path.join(local_directory, 'config.json'), 'r') as config_file:
+                config = json.loads(config_file.read())
+        except FileNotFoundError:
+            return {}
 
-            if 'GITHUB_ACTIONS' in environ.keys():
+        self.logger.debug("JSON Config - %s", config)
+        return config
 
-                self.logger.debug('Running inside GitHub Actions')
-                local_directory = environ.get('GITHUB_WORKSPACE')
+    # __merge: Recursively copies the keys of `source` over `destination`. Returns the destination dict.
+    def __merge(self, destination: dict, source: dict) -> dict:
 
-            for file in listdir(local_directory):
+        for key, value in source.items():
+            if isinstance(value, dict) and isinstance(destination.get(key), dict):
+                self.__merge(destination[key], value)
+            else:
+                destination[key] = copy.deepcopy(value)
 
-                if file == 'config.json':
+        return destination
 
-                    with open('config.json', 'r+') as config_file:
+    # __get_value: Returns the value at a dotted config key, or None when any part of the path is missing
+    def __get_value(self, config: dict, config_key: str):
 
-                        config = json.loads(config_file.read())
+        value = config
+        for item in config_key.split('.'):
+            if not isinstance(value, dict) or item not in value:
+                return None
+            value = value[item]
 
-                        self.logger.debug("JSON Config - " + str(config))
+        return value
 
-            return config if config else self.config
-        
-        except Exception as e:
-            self.logger.error('Error loading config.json file: ' + str(traceback.print_tb(e.__traceback__)))
+    # __set_value: Sets the value at a dotted config key, creating the parent dicts as needed
+    def __set_value(self, config: dict, config_key: str, value) -> None:
 
-    # Load the config.json file from environment variables instead if running inside GitHub Actions. Environment variables override config.json values to enable CI workflows.
-    def __load_config_env(self) -> dict:
+        item_path = config_key.split('.')
+        for item in item_path[:-1]:
+            config = config.setdefault(item, {})
+        config[item_path[-1]] = value
 
-        try:
-            config = {}
-
-            temp_list = []
-            for config_key, config_value in ConfigKeyValuePair.items():
-        
-                if 'GITHUB_ACTIONS' in environ.keys():
-                        if environ['GITHUB_ACTIONS']:
-                            config_key = 'INPUT_' + config_key
-
-                if config_key in environ.keys():
-                    self.logger.debug('Config found within environment variables - ' + str(config_key) + ' - ' + str(config_value))
-                    temp_list.append(config_value)
-
-            self.logger.debug('ConfigMap JSON key values found within environment variables - ' + str(temp_list))
-
-            unique_parent_list = []
-            for item in temp_list:
-                if item.split('.')[0] not in unique_parent_list:
-                    unique_parent_list.append(item.split('.')[0])
-
-            self.logger.debug('Parent config attributes found within environment variables - ' + str(unique_parent_list))
-
-            for parent_item in unique_parent_list:
-
-                temp_config_dict = {}
-                for list_item in [x for x in temp_list if re.match(parent_item+'.*', x)]:
-
-                    if 'GITHUB_ACTIONS' in environ.keys():
-                        if environ['GITHUB_ACTIONS']:
-                            list_item = 'INPUT_' + list_item
-
-                    self.logger.debug('Config `' + str(list_item) + '` within parent `' + str(parent_item))
-                    self.logger.debug('Config value - ' + str(environ[list_item.replace('.', '_').upper()]))
-
-                    item_path = list_item.split('.')
-                    for item in reversed(item_path):
-                        
-                        if 'GITHUB_ACTIONS' in environ.keys():
-                            if environ['GITHUB_ACTIONS']:
-                                if list_item == 'INPUT_jira.default_issue_labels':
-                                    temp_config_dict.update({
-                                        item: environ[list_item.replace('.', '_').upper()].split(',')
-                                    })
-                                else:
-                                    if list_item in ['INPUT_jira.enabled']:
-                                        temp_config_dict.update({
-                                            item: self.get_boolean(environ[list_item.replace('.', '_').upper()])
-                                        })
-                                    else:
-                                        temp_config_dict.update({
-                                            item: environ[list_item.replace('.', '_').upper()]
-                                        })
-                                config.update({list_item.split('.')[0].replace('INPUT_',''): temp_config_dict})
-                                break
-                        else:
-                            if list_item == 'jira.default_issue_labels':
-                                temp_config_dict.update({
-                                    item: environ[list_item.replace('.', '_').upper()].split(',')
-                                })
-                            else:
-                                if list_item in ['jira.enabled']:
-                                    temp_config_dict.update({
-                                        item: self.get_boolean(environ[list_item.replace('.', '_').upper()])
-                                    })
-                                else:
-                                    temp_config_dict.update({
-                                        item: environ[list_item.replace('.', '_').upper()]
-                                    })
-                            config.update({list_item.split('.')[0]: temp_config_dict})
-                            break
-            self.logger.debug('Config from environment variables - ' + str(config))
-            return config
-        
-        except Exception as e:
-            self.logger.error('Error loading environment variables: ' + str(traceback.print_tb(e.__traceback__)))
-            
-    def get_combined_config(self) -> dict:
+    # compile_config: Merges config.json over the default config and validates the types against ConfigKeyTypes. Returns dict with the config snapshot.
+    # Raises: Exception when a config key has the wrong type
+    def compile_config(self) -> dict:
 
-        from mergedeep import merge
-        try:
-            # Build a config file using config.json if it exists    
-            config_file = self.__load_config_file()
+        config = self.__merge(self.build_config(), self.__load_config_file())
+
+        for config_key, config_type in ConfigKeyTypes.items():
+            value = self.__get_value(config, config_key)
+            if value is not None and not isinstance(value, config_type):
+                raise Exception('Invalid config value for ' + config_key + ' - expected ' + config_type.__name__ + ', found ' + type(value).__name__)
+
+        # Compile the routing table once, so invalid routing rules fail the build instead of the first request
+        from routing_table.routing_table import RoutingTable
+        RoutingTable(logger=self.logger, routing_config=config['routing'])
+
+        if self.__get_value(config, 'jira.api_token'):
+            self.logger.warning('config.json contains jira.api_token. The token is written to the config snapshot in plain text, prefer the JIRA_API_TOKEN SSM parameter.')
+
+        return {
+            'compiled_at': int(time.time()),
+            'config': config
+        }
+
+    # write_config_snapshot: Compiles the config and writes the snapshot to `snapshot_path`. The file is replaced atomically. Returns dict with the config snapshot.
+    def write_config_snapshot(self, snapshot_path: str = CONFIG_SNAPSHOT_PATH) -> dict:
+
+        config_snapshot = self.compile_config()
+
+        with open(snapshot_path + '.tmp', 'w') as snapshot_file:
+            snapshot_file.write(json.dumps(config_snapshot, indent=2, sort_keys=True))
+        replace(snapshot_path + '.tmp', snapshot_path)
+
+        self.logger.info('Config snapshot written to %s', snapshot_path)
+        return config_snapshot
+
+    # __get_config_snapshot: Returns dict with the config from the compiled snapshot, read once per execution environment.
+    # Without a snapshot (e.g. local runs), the config is compiled in memory from config.json instead.
+    def __get_config_snapshot(self) -> dict:
+
+        with ConfigHandler.config_snapshot_lock:
+
+            if ConfigHandler.config_snapshot is None:
+                try:
+                    with open(CONFIG_SNAPSHOT_PATH, 'r') as snapshot_file:
+                        ConfigHandler.config_snapshot = json.loads(snapshot_file.read())
+                    self.logger.debug('Loaded config snapshot compiled at %s', ConfigHandler.config_snapshot['compiled_at'])
+                except FileNotFoundError:
+                    self.logger.debug('No config snapshot found at %s. Compiling config at runtime.', CONFIG_SNAPSHOT_PATH)
+                    ConfigHandler.config_snapshot = self.compile_config()
+
+            return ConfigHandler.config_snapshot['config']
 
-            # Override config.json if exists, with Environment variables for CI purposes
-            config_env = self.__load_config_env()
+    # __apply_env_overrides: Overrides config keys with the environment variables set for them in ConfigKeyValuePair. Environment variables override config.json values to enable CI workflows.
+    def __apply_env_overrides(self, config: dict) -> dict:
 
-            # Return merged config objects
-            combined_config = merge(config_file, config_env)
+        env_prefix = 'INPUT_' if environ.get('GITHUB_ACTIONS') else ''
 
-            # Check if required fields exists in the config else return an exception. **Only works for strings in the config dictionary.**
-            if "enabled" in combined_config["jira"].keys():
+        for env_key, config_key in ConfigKeyValuePair.items():
+
+            env_value = environ.get(env_prefix + env_key)
+            if env_value is None:
+                continue
+
+            self.logger.debug('Config found within environment variables - %s - %s', env_prefix + env_key, config_key)
+
+            if config_key in ConfigSSMKeys:
+                env_value = Utils(logger=self.logger).get_ssm_parameter(
+                    parameter_name=env_value,
+                    region_name=self.region_name
+                )
+            elif ConfigKeyTypes.get(config_key) is list:
+                env_value = env_value.split(',')
+            elif ConfigKeyTypes.get(config_key) is bool:
+                env_value = self.get_boolean(env_value)
+
+            self.__set_value(config, config_key, env_value)
+
+        return config
+
+    # get_routing_config: Returns dict with the routing config from the compiled snapshot. Routing does not depend on the Jira integration, so it is also read when only Slack is enabled.
+    def get_routing_config(self) -> dict:
+        return copy.deepcopy(self.__get_config_snapshot().get('routing', {}))
+
+    # get_combined_config: Returns dict with the compiled config snapshot, overridden by the environment variables which are set.
+    # Raises: Exception when Jira is enabled and a required field is missing
+    def get_combined_config(self) -> dict:
 
-                if combined_config["jira"]["enabled"]:
+        combined_config = self.__apply_env_overrides(copy.deepcopy(self.__get_config_snapshot()))
 
-                    from flatten_json import flatten
-                    combined_config_key_list = flatten(combined_config, '.')
+        # Check for required fields when the Jira integration is enabled
+        if self.__get_value(combined_config, 'jira.enabled'):
 
-                    # Check for required fields. **Only works for strings in the config dictionary.**
-                    is_field_not_found = 0
-                    field_not_found_list = []
-                    for field in self.required_fields:
+            field_not_found_list = [x for x in self.required_fields if not self.__get_value(combined_config, x)]
 
-                        if field not in combined_config_key_list:
+            if field_not_found_list:
+                self.logger.error('Missing config fields - %s', field_not_found_list)
+                raise Exception('Missing config fields - ' + str(field_not_found_list))
 
-                            is_field_not_found = 1
-                            field_not_found_list.append(field)
+        return combined_config
 
-                    if is_field_not_found:
-                        self.logger.error('Missing config fields - ' + str(field_not_found_list))
-                        raise
+# Build step - compiles config.json into the config snapshot shipped with the Lambda package. Run from the Lambda directory: python3 -m config_handler.config_handler
+if __name__ == '__main__':
 
-            return combined_config
+    from structured_logger.structured_logger import get_logger
 
-        except Exception as e:
-            self.logger.error('Error merging config: ' + str(traceback.print_tb(e.__traceback__)))
-        
\ No newline at end of file
+    ConfigHandler(
+        logger=get_logger('config_handler', level='INFO'),
+        region_name=environ.get('REGION')
+    ).write_config_snapshot()
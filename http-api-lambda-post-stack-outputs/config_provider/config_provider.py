@@ -0,0 +1,131 @@
+import logging
+import threading
+import hashlib
+import json
+import time
+from os import environ
+
+from utils.utils import Utils
+
+# Default minimum number of seconds between two config reloads. Can be overridden with the `CONFIG_RELOAD_INTERVAL` environment variable, 0 disables reloading.
+DEFAULT_CONFIG_RELOAD_INTERVAL = 60
+
+# ConfigProvider - class to serve a versioned config which is reloaded in the background
+# The config is built by `load_config` from SSM parameters. Every CONFIG_RELOAD_INTERVAL seconds a request starts a background reload, which re-reads the parameters
+# with one batched GetParameters call and swaps in the new config when its content changed. Requests keep reading the current config and never wait on a reload.
+class ConfigProvider:
+
+    # Current config shared by every ConfigProvider object in the execution environment. The whole dict is replaced on reload, so readers always see a consistent config.
+    # Holds the config, its version (incremented on every change), the SSM parameter versions it was built from, its content fingerprint and the monotonic load time.
+    current_config = None
+    config_reload_lock = threading.Lock()
+    config_reload_thread = None
+    config_stats = {
+        'version': 0,
+        'reloads': 0,
+        'changes': 0,
+        'failures': 0,
+        'last_reload_ms': None,
+        'max_reload_ms': 0,
+        'parameter_versions': {}
+    }
+
+    # ConfigProvider Constructor
+    # logger: Logger object
+    # region_name: AWS region of the SSM parameters
+    # ssm_parameter_names: SSM parameters read by `load_config`. They are refreshed in one call before each reload.
+    # load_config: Function returning dict with the config. Reads the SSM parameters through Utils, which serves them from the refreshed cache.
+    #
+    # Returns: ConfigProvider object
+    # Raises: None
+    def __init__(self, logger: logging.Logger, region_name: str, ssm_parameter_names: list, load_config):
+        self.logger = logger
+        self.region_name = region_name
+        self.ssm_parameter_names = [x for x in ssm_parameter_names if x]
+        self.load_config = load_config
+        self.utils = Utils(logger=self.logger)
+        self.reload_interval = int(environ.get('CONFIG_RELOAD_INTERVAL', DEFAULT_CONFIG_RELOAD_INTERVAL))
+
+    # get_config_stats: Returns dict with the config version and the reload counters and latencies
+    def get_config_stats(self) -> dict:
+        with ConfigProvider.config_reload_lock:
+            return dict(ConfigProvider.config_stats)
+
+    # get_config: Returns dict with the current config. Only the first call of the execution environment loads the config synchronously.
+    # Once the config is older than the reload interval, a background reload is started and the current config is returned straight away.
+    def get_config(self) -> dict:
+
+        current_config = ConfigProvider.current_config
+
+        if current_config is None:
+            with ConfigProvider.config_reload_lock:
+                if ConfigProvider.current_config is None:
+                    self.__reload(is_initial_load=True)
+            return ConfigProvider.current_config['config']
+
+        if self.reload_interval > 0 and time.monotonic() - current_config['loaded_at'] >= self.reload_interval:
+            self.__start_background_reload()
+
+        return current_config['config']
+
+    # __start_background_reload: Starts the reload thread unless a reload is already running
+    def __start_background_reload(self) -> None:
+
+        if not ConfigProvider.config_reload_lock.acquire(blocking=False):
+            return
+
+        try:
+            if ConfigProvider.config_reload_thread is not None and ConfigProvider.config_reload_thread.is_alive():
+                return
+            ConfigProvider.config_reload_thread = threading.Thread(target=self.__reload_in_background, name='config-reload', daemon=True)
+            ConfigProvider.config_reload_thread.start()
+        finally:
+            ConfigProvider.config_reload_lock.release()
+
+    # __reload_in_background: Reload thread target. A failed reload keeps the current config, which is retried after the next reload interval.
+    def __reload_in_background(self) -> None:
+
+        with ConfigProvider.config_reload_lock:
+            try:
+                self.__reload(is_initial_load=False)
+            except Exception as e:
+                ConfigProvider.config_stats['failures'] += 1
+                ConfigProvider.current_config = dict(ConfigProvider.current_config, loaded_at=time.monotonic())
+                self.logger.warning('Config reload failed, keeping config version %s - %s', ConfigProvider.config_stats['version'], e)
+
+    # __reload: Refreshes the SSM parameters, rebuilds the config and swaps it in when it changed. Must be called with config_reload_lock held.
+    def __reload(self, is_initial_load: bool) -> None:
+
+        started_at = time.perf_counter()
+
+        if self.ssm_parameter_names:
+            self.utils.prefetch(
+                region_name=self.region_name,
+                ssm_parameter_names=self.ssm_parameter_names,
+                force_refresh=not is_initial_load
+            )
+
+        config = self.load_config()
+        config_fingerprint = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        parameter_versions = {x: self.utils.get_ssm_parameter_version(parameter_name=x, region_name=self.region_name) for x in self.ssm_parameter_names}
+
+        reload_ms = round((time.perf_counter() - started_at) * 1000, 1)
+        ConfigProvider.config_stats['reloads'] += 1
+        ConfigProvider.config_stats['last_reload_ms'] = reload_ms
+        ConfigProvider.config_stats['max_reload_ms'] = max(ConfigProvider.config_stats['max_reload_ms'], reload_ms)
+        ConfigProvider.config_stats['parameter_versions'] = parameter_versions
+
+        is_changed = ConfigProvider.current_config is None or ConfigProvider.current_config['fingerprint'] != config_fingerprint
+        if is_changed:
+            ConfigProvider.config_stats['version'] += 1
+            ConfigProvider.config_stats['changes'] += 0 if is_initial_load else 1
+
+        ConfigProvider.current_config = {
+            'config': config if is_changed else ConfigProvider.current_config['config'],
+            'version': ConfigProvider.config_stats['version'],
+            'parameter_versions': parameter_versions,
+            'fingerprint': config_fingerprint,
+            'loaded_at': time.monotonic()
+        }
+
+        self.logger.info('Config version %s %s in %sms. SSM parameter versions: %s', ConfigProvider.config_stats['version'], 'loaded' if is_initial_load else ('reloaded' if is_changed else 'unchanged'), reload_ms, parameter_versions)
@@ -0,0 +1,123 @@
+import logging
+import json
+import uuid
+import time
+from os import environ, listdir, makedirs, remove, replace, path
+
+from utils.utils import Utils
+
+# Seconds between queue polls while receive_batch waits for more messages
+RECEIVE_BATCH_POLL_INTERVAL = 0.25
+
+# DeliveryQueue - class to queue stack output deliveries for the asynchronous /send mode
+# Messages go to the SQS queue in `DELIVERY_QUEUE_URL`. Without a queue URL, a local directory set in `DELIVERY_QUEUE_DIR` stands in for SQS, e.g. in tests and local runs.
+# With neither set the queue is not configured, since a directory in a Lambda's /tmp is never seen by the worker.
+class DeliveryQueue:
+
+    # DeliveryQueue Constructor
+    # logger: Logger object
+    # region_name: AWS region of the SQS queue
+    #
+    # Returns: DeliveryQueue object
+    # Raises: None
+    def __init__(self, logger: logging.Logger, region_name: str):
+        self.logger = logger
+        self.region_name = region_name
+        self.queue_url = environ.get('DELIVERY_QUEUE_URL')
+        self.queue_dir = environ.get('DELIVERY_QUEUE_DIR')
+
+    # is_configured: Returns bool, True when DELIVERY_QUEUE_URL or DELIVERY_QUEUE_DIR is set
+    def is_configured(self) -> bool:
+        return bool(self.queue_url or self.queue_dir)
+
+    # is_local: Returns bool, True when the local directory queue is used instead of SQS
+    def is_local(self) -> bool:
+        return not self.queue_url
+
+    # enqueue: Adds a message to the queue. Returns str with the delivery ID assigned to the message.
+    def enqueue(self, message: dict) -> str:
+
+        if not self.is_configured():
+            raise Exception('Delivery queue is not configured - set DELIVERY_QUEUE_URL or DELIVERY_QUEUE_DIR')
+
+        delivery_id = str(uuid.uuid4())
+        message_body = json.dumps({
+            'DeliveryId': delivery_id,
+            'EnqueuedAt': time.time(),
+            'Message': message
+        })
+
+        if self.is_local():
+            makedirs(self.queue_dir, exist_ok=True)
+            # Name files by enqueue time so the local queue drains in FIFO order, and write them atomically so a reader never sees a partial message
+            file_name = str(time.time_ns()) + '-' + delivery_id + '.json'
+            with open(path.join(self.queue_dir, file_name + '.tmp'), 'w') as message_file:
+                message_file.write(message_body)
+            replace(path.join(self.queue_dir, file_name + '.tmp'), path.join(self.queue_dir, file_name))
+        else:
+            Utils(logger=self.logger).get_client('sqs', region_name=self.region_name).send_message(
+                QueueUrl=self.queue_url,
+                MessageBody=message_body
+            )
+
+        self.logger.debug("Delivery %s enqueued", delivery_id)
+        return delivery_id
+
+    # receive: Reads up to `max_messages` messages from the queue. Returns list of (receipt, delivery ID, message) tuples. Pass the receipt to `delete` once the message is processed.
+    def receive(self, max_messages: int = 10) -> list:
+
+        messages = []
+
+        if self.is_local():
+            if not self.queue_dir or not path.isdir(self.queue_dir):
+                return messages
+            for file_name in sorted([x for x in listdir(self.queue_dir) if x.endswith('.json')])[:max_messages]:
+                with open(path.join(self.queue_dir, file_name), 'r') as message_file:
+                    message_body = json.loads(message_file.read())
+                messages.append((file_name, message_body['DeliveryId'], message_body['Message']))
+        else:
+            response = Utils(logger=self.logger).get_client('sqs', region_name=self.region_name).receive_message(
+                QueueUrl=self.queue_url,
+                MaxNumberOfMessages=min(max_messages, 10)
+            )
+            for sqs_message in response.get('Messages', []):
+                message_body = json.loads(sqs_message['Body'])
+                messages.append((sqs_message['ReceiptHandle'], message_body['DeliveryId'], message_body['Message']))
+
+        return messages
+
+    # receive_batch: Collects messages until `max_messages` are received or `window_seconds` have passed since the first poll, so deliveries enqueued close together can be sent as one digest.
+    # Returns list of (receipt, delivery ID, message) tuples in the order they were first received.
+    def receive_batch(self, max_messages: int, window_seconds: float) -> list:
+
+        window_deadline = time.monotonic() + window_seconds
+        messages = {}
+
+        while True:
+
+            # SQS hides received messages, so only the missing ones are requested. The local queue lists the same files again and is deduplicated by delivery ID.
+            for receipt, delivery_id, message in self.receive(max_messages=max_messages if self.is_local() else max_messages - len(messages)):
+                messages.setdefault(delivery_id, (receipt, delivery_id, message))
+
+            # An empty queue is not worth waiting on - the window only starts once there is something to coalesce
+            if not messages or len(messages) >= max_messages or time.monotonic() >= window_deadline:
+                break
+
+            time.sleep(min(RECEIVE_BATCH_POLL_INTERVAL, max(window_deadline - time.monotonic(), 0)))
+
+        self.logger.debug("Received batch of %s deliveries", len(messages))
+        return list(messages.values())[:max_messages]
+
+    # delete: Removes a processed message from the queue
+    def delete(self, receipt: str) -> None:
+
+        if self.is_local():
+            try:
+                remove(path.join(self.queue_dir, receipt))
+            except FileNotFoundError:
+                pass
+        else:
+            Utils(logger=self.logger).get_client('sqs', region_name=self.region_name).delete_message(
+                QueueUrl=self.queue_url,
+                ReceiptHandle=receipt
+            )
@@ -0,0 +1,193 @@
+import logging
+import threading
+import json
+from os import environ, replace
+from botocore.exceptions import ClientError
+
+from utils.utils import Utils
+
+# Snapshot of the index kept in /tmp, so warm invocations and new execution environments on the same host can skip the S3 read.
+# Holds the index and the ETag of the S3 object it was read from, which is revalidated against S3 before the snapshot is used.
+JIRA_ISSUE_INDEX_FILE = '/tmp/jira_issue_index.json'
+
+# Number of conditional S3 writes attempted by a flush. Every failed attempt re-reads the object written by another execution environment and merges the pending changes into it.
+JIRA_ISSUE_INDEX_WRITE_ATTEMPTS = 3
+
+# S3 error codes returned when a conditional write lost the race against another writer
+CONDITIONAL_WRITE_ERROR_CODES = ['PreconditionFailed', 'ConditionalRequestConflict', '412', '409']
+
+# IssueIndex - class to map AWS Account IDs to the JIRA issue key tracking them
+# The index lives in memory, is snapshotted to /tmp and, when `JIRA_ISSUE_INDEX_BUCKET` is set, is persisted as a single JSON object in S3.
+# Changes are buffered and written once per `flush`, with a conditional write on the object's ETag so concurrent writers do not drop each other's entries.
+# It is a cache: a missing or stale entry only costs a fallback JQL search, after which the entry is written again.
+class IssueIndex:
+
+    # Index shared by every IssueIndex object in the execution environment. Maps '<project_key>|<aws_account_id>' to the issue key.
+    index = {}
+    index_loaded = False
+    index_lock = threading.Lock()
+    # ETag of the S3 object the index was last read from or written to, or None when the object does not exist
+    index_etag = None
+    # Changes not written yet. Maps the index key to the issue key, or to None for a removed entry.
+    pending_changes = {}
+
+    # IssueIndex Constructor
+    # logger: Logger object
+    # region_name: AWS region of the S3 bucket holding the index
+    #
+    # Returns: IssueIndex object
+    # Raises: None
+    def __init__(self, logger: logging.Logger, region_name: str = None):
+        self.logger = logger
+        self.region_name = region_name
+        self.bucket_name = environ.get('JIRA_ISSUE_INDEX_BUCKET')
+        self.object_key = environ.get('JIRA_ISSUE_INDEX_KEY', 'jira-issue-index.json')
+
+    # __get_s3_client: Returns the shared S3 client
+    def __get_s3_client(self):
+        return Utils(logger=self.logger).get_client('s3', region_name=self.region_name)
+
+    # __get_error_code: Returns str with the error code of a ClientError
+    def __get_error_code(self, e: ClientError) -> str:
+        return str(e.response.get('Error', {}).get('Code'))
+
+    # __set_index: Replaces the index with the entries read from S3 and re-applies the pending changes on top
+    def __set_index(self, index: dict, etag: str) -> None:
+
+        IssueIndex.index = dict(index)
+        for index_key, issue_key in IssueIndex.pending_changes.items():
+            if issue_key is None:
+                IssueIndex.index.pop(index_key, None)
+            else:
+                IssueIndex.index[index_key] = issue_key
+        IssueIndex.index_etag = etag
+
+    # __load_index: Loads the index once per execution environment. The /tmp snapshot is only used as is when S3 is not configured or the S3 object still has the snapshot's ETag.
+    def __load_index(self) -> None:
+
+        if IssueIndex.index_loaded:
+            return
+
+        IssueIndex.index_loaded = True
+        try:
+            with open(JIRA_ISSUE_INDEX_FILE, 'r') as index_file:
+                snapshot = json.loads(index_file.read())
+            self.__set_index(index=snapshot['index'], etag=snapshot.get('etag'))
+            self.logger.debug("Loaded JIRA issue index snapshot with %s entries", len(IssueIndex.index))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.warning("Unable to load JIRA issue index snapshot - %s", e)
+
+        if self.bucket_name:
+            self.__read_index()
+
+    # __read_index: Reads the index from S3 unless the object still has the ETag the index was read with. Returns bool whether the read succeeded.
+    def __read_index(self) -> bool:
+
+        s3_args = {'Bucket': self.bucket_name, 'Key': self.object_key}
+        if IssueIndex.index_etag:
+            s3_args.update({'IfNoneMatch': IssueIndex.index_etag})
+
+        try:
+            s3_object = self.__get_s3_client().get_object(**s3_args)
+        except ClientError as e:
+            error_code = self.__get_error_code(e)
+            if error_code in ['304', 'NotModified']:
+                self.logger.debug("JIRA issue index snapshot is current with s3://%s/%s", self.bucket_name, self.object_key)
+                return True
+            if error_code in ['NoSuchKey', '404']:
+                self.__set_index(index={}, etag=None)
+                self.__save_snapshot()
+                return True
+            self.logger.warning("Unable to load JIRA issue index from S3 - %s", e)
+            return False
+
+        self.__set_index(index=json.loads(s3_object['Body'].read()), etag=s3_object.get('ETag'))
+        self.__save_snapshot()
+        self.logger.debug("Loaded JIRA issue index from s3://%s/%s with %s entries", self.bucket_name, self.object_key, len(IssueIndex.index))
+        return True
+
+    # __save_snapshot: Writes the index and its ETag to the /tmp snapshot. The file is replaced atomically so concurrent readers never see a partial snapshot.
+    def __save_snapshot(self) -> None:
+
+        try:
+            with open(JIRA_ISSUE_INDEX_FILE + '.tmp', 'w') as index_file:
+                index_file.write(json.dumps({'etag': IssueIndex.index_etag, 'index': IssueIndex.index}))
+            replace(JIRA_ISSUE_INDEX_FILE + '.tmp', JIRA_ISSUE_INDEX_FILE)
+        except Exception as e:
+            self.logger.warning("Unable to save JIRA issue index snapshot - %s", e)
+
+    # __write_index: Writes the index to S3 only if the object has not changed since it was read. When another writer got there first, the object is re-read, the pending changes
+    # are merged into it and the write is attempted again. Returns bool whether the write succeeded.
+    def __write_index(self) -> bool:
+
+        for attempt in range(JIRA_ISSUE_INDEX_WRITE_ATTEMPTS):
+
+            s3_args = {
+                'Bucket': self.bucket_name,
+                'Key': self.object_key,
+                'Body': json.dumps(IssueIndex.index).encode('utf-8'),
+                'ContentType': 'application/json'
+            }
+            s3_args.update({'IfMatch': IssueIndex.index_etag} if IssueIndex.index_etag else {'IfNoneMatch': '*'})
+
+            try:
+                IssueIndex.index_etag = self.__get_s3_client().put_object(**s3_args).get('ETag')
+                return True
+            except ClientError as e:
+                if self.__get_error_code(e) not in CONDITIONAL_WRITE_ERROR_CODES:
+                    self.logger.warning("Unable to save JIRA issue index to S3 - %s", e)
+                    return False
+
+            self.logger.info("JIRA issue index changed in S3 since it was read. Merging and retrying, attempt %s", attempt + 1)
+            IssueIndex.index_etag = None
+            if not self.__read_index():
+                return False
+
+        self.logger.warning("Unable to save JIRA issue index to S3 after %s conflicting writes", JIRA_ISSUE_INDEX_WRITE_ATTEMPTS)
+        return False
+
+    # flush: Writes the buffered changes to S3 and the /tmp snapshot. Called once per upsert or batch.
+    def flush(self) -> None:
+
+        with IssueIndex.index_lock:
+
+            if not IssueIndex.pending_changes:
+                return
+
+            self.logger.debug("Flushing %s JIRA issue index changes", len(IssueIndex.pending_changes))
+            if self.bucket_name:
+                try:
+                    self.__write_index()
+                except Exception as e:
+                    self.logger.warning("Unable to save JIRA issue index to S3 - %s", e)
+
+            # The changes stay in the in-memory index even when the S3 write failed, since the index is only a cache
+            IssueIndex.pending_changes = {}
+            self.__save_snapshot()
+
+    # get_issue_key: Returns str with the issue key indexed for the AWS Account ID, or None on an index miss
+    def get_issue_key(self, project_key: str, aws_account_id: str) -> str:
+
+        with IssueIndex.index_lock:
+            self.__load_index()
+            return IssueIndex.index.get(project_key + '|' + str(aws_account_id))
+
+    # put_issue_key: Records the issue key for the AWS Account ID. Written on the next flush.
+    def put_issue_key(self, project_key: str, aws_account_id: str, issue_key: str) -> None:
+
+        with IssueIndex.index_lock:
+            self.__load_index()
+            if IssueIndex.index.get(project_key + '|' + str(aws_account_id)) == issue_key:
+                return
+            IssueIndex.index[project_key + '|' + str(aws_account_id)] = issue_key
+            IssueIndex.pending_changes[project_key + '|' + str(aws_account_id)] = issue_key
+
+    # remove_issue_key: Removes a stale entry, e.g. when the indexed issue has been deleted or moved. Written on the next flush.
+    def remove_issue_key(self, project_key: str, aws_account_id: str) -> None:
+
+        with IssueIndex.index_lock:
+            self.__load_index()
+            if IssueIndex.index.pop(project_key + '|' + str(aws_account_id), None) is not None:
+                IssueIndex.pending_changes[project_key + '|' + str(aws_account_id)] = None
@@ -1,134 +1,397 @@
 import logging
-from jira.client import JIRA
+import json
+import hashlib
+from os import environ
+from jira.exceptions import JIRAError
+from requests.exceptions import RequestException
 from jira.resources import Issue
 
+from jira_handler.issue_index.issue_index import IssueIndex
+from jira_handler.jira_client.jira_client import JiraClient
+
+# Issue fields returned by the existing-issue search. Only what the upsert compares against is downloaded, the description body is not.
+ISSUE_SEARCH_FIELDS = 'summary,labels'
+
+# Issue entity property holding the SHA-256 fingerprint of the content the issue was last written with. Returned together with the search results.
+CONTENT_FINGERPRINT_PROPERTY = 'stack-outputs-fingerprint'
+
+# Label tagged onto every issue created for an AWS account. Used for exact-match lookups when the issue index has no entry.
+AWS_ACCOUNT_LABEL_PREFIX = 'aws-account-'
+
+# Number of issues returned by a summary search. Jira's `~` operator is a fuzzy text search, so the results are filtered for the exact summary afterwards.
+JIRA_SUMMARY_SEARCH_MAX_RESULTS = 10
+
+# Number of AWS accounts resolved per JQL search, and number of issues per bulk create request (the JIRA Cloud limit), when upserting a batch
+JIRA_BULK_CHUNK_SIZE = 50
+
 # Issues - Python class to manipulate JIRA issues using the JIRA Python SDK
 class Issues:
 
     # Issues Constructor
-    # jira_credentials: JIRA credentials object
+    # jira_credentials: JiraClient object
     # project_key: Project key string
     # email_domain: Email domain string
     # default_issue_labels: Default issue labels list
+    # issue_index: IssueIndex object mapping AWS Account IDs to issue keys
     # logger: Logger object
     #
     # Returns: Issues object
     # Raises: None
-    def __init__(self, logger: logging.Logger, jira_credentials: JIRA, project_key: str, project_id: int, email_domain: str, default_issue_labels: list = []):
+    def __init__(self, logger: logging.Logger, jira_credentials: JiraClient, project_key: str, project_id: int, email_domain: str, default_issue_labels: list = [], issue_index: IssueIndex = None):
         self.jira = jira_credentials
         self.project_key = project_key
         self.project_id = project_id
         self.email_domain = email_domain
         self.default_issue_labels = default_issue_labels
+        self.issue_index = issue_index
         self.logger = logger
-    
-    # Check if JIRA issue already exists, returns bool and issue_key if key exists
-    def __does_issue_exist(self, issue_summary: str) -> tuple[bool, str]:
+        # Migration path for issues created before the AWS account label existed. When enabled, AWS accounts without an indexed or labelled issue are also looked up by their exact summary.
+        self.legacy_summary_lookup = environ.get('JIRA_LEGACY_SUMMARY_LOOKUP', 'false').lower() == 'true'
+
+    # get_content_fingerprint: Returns str with the SHA-256 hex digest of the canonicalized content. Dicts are serialized with sorted keys, so the digest is stable across invocations and key order.
+    def get_content_fingerprint(self, content) -> str:
+
+        if not isinstance(content, str):
+            content = json.dumps(content, sort_keys=True, separators=(',', ':'), default=str)
+
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    # __get_issue_fingerprint: Returns str with the fingerprint stored on the issue, or None when the issue has never been written with one
+    def __get_issue_fingerprint(self, issue: Issue) -> str:
+        return (issue.raw.get('properties', {}).get(CONTENT_FINGERPRINT_PROPERTY) or {}).get('sha256')
+
+    # __get_fingerprint_property: Returns list with the entity property payload storing the fingerprint, for create and edit requests
+    def __get_fingerprint_property(self, issue_fingerprint: str) -> list:
+        return [{
+            'key': CONTENT_FINGERPRINT_PROPERTY,
+            'value': {'sha256': issue_fingerprint}
+        }]
+
+    # get_aws_account_label: Returns str with the label identifying the issue for an AWS Account ID
+    def get_aws_account_label(self, aws_account_id: str) -> str:
+        return AWS_ACCOUNT_LABEL_PREFIX + str(aws_account_id)
+
+    # Get the indexed JIRA issue for an AWS Account ID, returns the issue or None on an index miss. Stale entries are removed from the index.
+    def __get_indexed_issue(self, aws_account_id: str) -> Issue:
+
+        issue_key = self.issue_index.get_issue_key(project_key=self.project_key, aws_account_id=aws_account_id)
+        if not issue_key:
+            return None
+
+        try:
+            issue = self.jira.issue(issue_key, fields=ISSUE_SEARCH_FIELDS, properties=CONTENT_FINGERPRINT_PROPERTY)
+        except JIRAError as e:
+            if e.status_code != 404:
+                raise
+            issue = None
+
+        if issue is None or not issue.key.startswith(self.project_key + '-'):
+            self.logger.info("Removing stale JIRA issue index entry %s for AWS Account %s", issue_key, aws_account_id)
+            self.issue_index.remove_issue_key(project_key=self.project_key, aws_account_id=aws_account_id)
+            return None
+
+        self.logger.debug("Issue found in index - %s", issue.key)
+        return issue
+
+    # Find the JIRA issue whose summary is exactly issue_summary, returns the issue or None
+    def __find_issue_by_summary(self, issue_summary: str) -> Issue:
 
-        # Search for issues in this project where the given summary matches exactly and the status is not Done to avoid older issues being updated with newer findings. Newer findings require newer tickets in that case.
         issues = self.jira.search_issues(
-            'project = ' + self.project_key + ' AND summary ~ "\\"' + issue_summary + '\\""'
+            'project = ' + self.project_key + ' AND summary ~ "\\"' + issue_summary + '\\""',
+            maxResults=JIRA_SUMMARY_SEARCH_MAX_RESULTS,
+            fields=ISSUE_SEARCH_FIELDS,
+            properties=CONTENT_FINGERPRINT_PROPERTY
         )
 
-        self.logger.debug("Search Issue results - " + str(issues))
+        self.logger.debug("Search Issue results - %s", issues)
+
+        return next((x for x in issues if x.fields.summary == issue_summary), None)
+
+    # Check if JIRA issue already exists, returns bool and the matching issue (with summary, description and labels) if it exists
+    # When an AWS Account ID is provided, the issue index is checked first, then the AWS account label, and a miss on both means the issue does not exist.
+    # The exact summary is only searched for without an AWS Account ID, or with JIRA_LEGACY_SUMMARY_LOOKUP enabled to adopt issues created before the label existed.
+    def __does_issue_exist(self, issue_summary: str, aws_account_id: str = None) -> tuple[bool, Issue]:
+
+        if aws_account_id:
+
+            if self.issue_index:
+                issue = self.__get_indexed_issue(aws_account_id=aws_account_id)
+                if issue:
+                    return True, issue
+
+            issues = self.jira.search_issues(
+                'project = ' + self.project_key + ' AND labels = "' + self.get_aws_account_label(aws_account_id) + '"',
+                maxResults=1,
+                fields=ISSUE_SEARCH_FIELDS,
+                properties=CONTENT_FINGERPRINT_PROPERTY
+            )
+
+            if len(issues) > 0:
+                self.logger.info("Issue already exists - %s", issues)
+                if self.issue_index:
+                    self.issue_index.put_issue_key(project_key=self.project_key, aws_account_id=aws_account_id, issue_key=issues[0].key)
+                return True, issues[0]
 
-        if len(issues) > 0:
-            self.logger.info("Issue already exists - " + str(issues))
-            return True, issues[0].key
+            if not self.legacy_summary_lookup:
+                self.logger.info("Issue does not exist for AWS Account %s", aws_account_id)
+                return False, None
+
+        issue = self.__find_issue_by_summary(issue_summary=issue_summary)
+
+        if issue:
+            self.logger.info("Issue already exists - %s", issue)
+            if aws_account_id and self.issue_index:
+                self.issue_index.put_issue_key(project_key=self.project_key, aws_account_id=aws_account_id, issue_key=issue.key)
+            return True, issue
         else:
-            self.logger.info("Issue does not exist - " + str(issues))
-            return False, ''
-    
-    # Create a new JIRA issue
-    def __create_issue(self, issue_summary: str, issue_desc: str, issue_type: str) -> Issue:        
-
-        # Create an issue
-        new_issue = self.jira.create_issue(
-            fields={
-                'project': self.project_id,
-                'summary': issue_summary,
-                'description': issue_desc,
-                'issuetype': {'name': issue_type}
-            }
-        )
-        self.logger.info("New Issue created: " + str(new_issue))
-        self.logger.info("New Issue type: " + str(type(new_issue)))
+            self.logger.info("Issue does not exist - %s", issue_summary)
+            return False, None
+
+    # Build the create payload for a JIRA issue, including the mandatory labels, the AWS account label and the content fingerprint property
+    def __get_create_issue_payload(self, issue_summary: str, issue_desc: str, issue_type: str, issue_fingerprint: str, aws_account_id: str = None) -> dict:
+
+        fields = {
+            'project': {'id': self.project_id},
+            'summary': issue_summary,
+            'description': issue_desc,
+            'issuetype': {'name': issue_type}
+        }
+
+        if self.default_issue_labels:
+            self.logger.debug("Tagging mandatory labels onto Issue.")
+            fields.update({'labels': list(self.default_issue_labels)})
+        else:
+            self.logger.debug("No mandatory labels to tag onto Issue.")
+
+        if aws_account_id:
+            fields.update({'labels': fields.get('labels', []) + [self.get_aws_account_label(aws_account_id)]})
+
+        return {
+            'fields': fields,
+            'properties': self.__get_fingerprint_property(issue_fingerprint)
+        }
+
+    # Create a new JIRA issue. Mandatory labels and the content fingerprint are part of the create payload and the created issue is not re-read.
+    def __create_issue(self, issue_summary: str, issue_desc: str, issue_type: str, issue_fingerprint: str, aws_account_id: str = None) -> Issue:        
+
+        # Create an issue. The entity properties are part of the create payload, which the SDK's create_issue() cannot send.
+        new_issue = self.jira.post_issue(payload=self.__get_create_issue_payload(
+            issue_summary=issue_summary,
+            issue_desc=issue_desc,
+            issue_type=issue_type,
+            issue_fingerprint=issue_fingerprint,
+            aws_account_id=aws_account_id
+        ))
+        self.logger.info("New Issue created: %s", new_issue)
+
+        if aws_account_id and self.issue_index:
+            self.issue_index.put_issue_key(project_key=self.project_key, aws_account_id=aws_account_id, issue_key=new_issue.key)
+
         return new_issue
 
     # Get an JIRA issue
     def __get_issue(self, issue_id: str) -> Issue:
 
         issue = self.jira.issue(issue_id)
-        self.logger.debug("Get Issue: " + str(issue.fields.summary) + " - " + str(issue.fields.description))
+        self.logger.debug("Get Issue: %s - %s", issue.fields.summary, issue.fields.description)
         return issue
 
-    # Update an JIRA issue
-    def __update_issue(self, issue_id: str, issue_summary: str, issue_desc: str) -> Issue:
+    # Update an JIRA issue with a single PUT. `Issue.update()` from the SDK re-reads the whole issue afterwards, so the edit request is sent on its own
+    # and only the local copy of the fields is updated. The issue is re-read only when `refetch` is set.
+    def __update_issue(self, issue: Issue, issue_summary: str, issue_desc: str, issue_fingerprint: str, refetch: bool = False, aws_account_id: str = None) -> Issue:
 
-        self.logger.debug("Updating Issue ID: " + issue_id)
+        self.logger.debug("Updating Issue ID: %s", issue.key)
 
-        # Change the issue's summary and description.
-        self.jira.issue(issue_id).update(
-            fields={
-                'summary': issue_summary,
-                'description': issue_desc
-            },
-            notify=True
-        )
+        fields = {
+            'summary': issue_summary,
+            'description': issue_desc
+        }
+
+        # Tag issues found through the summary search with the AWS account label, so later lookups are exact matches
+        labels = list(getattr(issue.fields, 'labels', None) or [])
+        if aws_account_id and self.get_aws_account_label(aws_account_id) not in labels:
+            labels.append(self.get_aws_account_label(aws_account_id))
+            fields.update({'labels': labels})
+
+        # Change the issue's summary and description, and store the new content fingerprint in the same request.
+        self.jira.put_issue(issue=issue, payload={
+            'fields': fields,
+            'properties': self.__get_fingerprint_property(issue_fingerprint)
+        })
+
+        if refetch:
+            return self.__get_issue(issue_id = issue.key)
 
-        updated_issue = self.jira.issue(issue_id)
-        self.logger.debug("Issue Updated: " + str(updated_issue.fields.summary) + " - " + str(updated_issue.fields.description))
-        return updated_issue
+        issue.fields.summary = issue_summary
+        issue.fields.description = issue_desc
+        issue.fields.labels = labels
+        issue.raw.setdefault('properties', {}).update({CONTENT_FINGERPRINT_PROPERTY: {'sha256': issue_fingerprint}})
+        self.logger.debug("Issue Updated: %s", issue.key)
+        return issue
     
-    def upsert_jira_issue(self, issue_summary: str, issue_desc: str, issue_type: str = "Task") -> Issue:
+    # Update or insert a JIRA issue. Set `refetch` to re-read the issue after an update.
+    # With an AWS Account ID, an indexed account costs one read plus, at most, one update call, and a new account costs one label search plus the create call.
+    # aws_account_id: AWS Account ID the issue tracks. Enables the issue index and AWS account label lookups.
+    # issue_content: Content the fingerprint is computed from, e.g. the parsed stack outputs. Defaults to the issue description.
+    def upsert_jira_issue(self, issue_summary: str, issue_desc: str, issue_type: str = "Task", refetch: bool = False, aws_account_id: str = None, issue_content = None) -> Issue:
+
+        issue_fingerprint = self.get_content_fingerprint(issue_content if issue_content is not None else issue_desc)
 
         # Check if issue already exists. If it does, then don't create a new issue. If it doesn't, then create a new issue
-        # Returns bool and issue_key if key exists. Returns bool and empty string if key doesn't exist.
-        key_info = self.__does_issue_exist(issue_summary = issue_summary)
+        # Returns bool and the issue if it exists. Returns bool and None if it doesn't exist.
+        key_info = self.__does_issue_exist(issue_summary = issue_summary, aws_account_id = aws_account_id)
 
         if key_info[0]:
 
-            issue = self.__get_issue(issue_id = key_info[1])
+            issue = key_info[1]
 
-            # Compare hashes of server version (issue.fields.description) and local version (issue_desc)
-            if hash(issue.fields.description) != hash(issue_desc):
+            # Compare the fingerprint stored on the issue with the fingerprint of the local content. Issues written before fingerprints existed are updated once.
+            if self.__get_issue_fingerprint(issue) != issue_fingerprint:
                 self.logger.debug("Issue Description has changed. Updating Issue.")
 
                 return self.__update_issue(
-                    issue_id = key_info[1],
+                    issue = issue,
                     issue_summary = issue_summary,
                     issue_desc = issue_desc,
+                    issue_fingerprint = issue_fingerprint,
+                    refetch = refetch,
+                    aws_account_id = aws_account_id
                 )
             else:
                 self.logger.debug("Issue Description has not changed. Issue does not need an update.")
             return issue
         else:
             # Create an Issue with the data object
-            new_issue = self.__create_issue(
+            return self.__create_issue(
                 issue_summary = issue_summary,
                 issue_desc = issue_desc,
-                issue_type = issue_type
+                issue_type = issue_type,
+                issue_fingerprint = issue_fingerprint,
+                aws_account_id = aws_account_id
             )
 
-            if self.default_issue_labels:
-                self.logger.debug("Tagging mandatory labels onto Issue.")
-                self.__tag_mandatory_labels_onto_issue(issue_id = new_issue)
-            else:
-                self.logger.debug("No mandatory labels to tag onto Issue.")
+    # Find the existing JIRA issues for a batch of AWS accounts with one JQL search per JIRA_BULK_CHUNK_SIZE accounts. Returns dict mapping AWS Account ID to issue.
+    # The search matches AWS account labels. With JIRA_LEGACY_SUMMARY_LOOKUP enabled it also matches the exact summary, for issues created before the label existed.
+    # Indexed issue keys are not part of the JQL, since Jira rejects the whole search when one of them was deleted or moved. Index entries of accounts the search did not find are removed.
+    def __find_issues(self, items: dict) -> dict:
 
-            return new_issue
+        found_issues = {}
+        aws_account_ids = list(items.keys())
 
-    # Tag mandatory labels onto a JIRA issue
-    def __tag_mandatory_labels_onto_issue(self, issue_id: str) -> Issue:
+        for i in range(0, len(aws_account_ids), JIRA_BULK_CHUNK_SIZE):
 
-        # Get an issue.
-        issue = self.jira.issue(issue_id)
+            chunk = aws_account_ids[i:i + JIRA_BULK_CHUNK_SIZE]
+
+            jql_clauses = ['labels in (' + ', '.join(['"' + self.get_aws_account_label(x) + '"' for x in chunk]) + ')']
+            if self.legacy_summary_lookup:
+                jql_clauses.extend(['summary ~ "\\"' + items[x]['issue_summary'] + '\\""' for x in chunk])
+
+            issues = self.jira.search_issues(
+                'project = ' + self.project_key + ' AND (' + ' OR '.join(jql_clauses) + ')',
+                maxResults=2 * len(chunk),
+                fields=ISSUE_SEARCH_FIELDS,
+                properties=CONTENT_FINGERPRINT_PROPERTY
+            )
+
+            summaries = {items[x]['issue_summary']: x for x in chunk} if self.legacy_summary_lookup else {}
+            for issue in issues:
+
+                # Match on the AWS account label first, then the exact summary
+                label_matches = [x[len(AWS_ACCOUNT_LABEL_PREFIX):] for x in (getattr(issue.fields, 'labels', None) or []) if x.startswith(AWS_ACCOUNT_LABEL_PREFIX)]
+                aws_account_id = next((x for x in label_matches if x in items), None) or summaries.get(issue.fields.summary)
+
+                if aws_account_id and (aws_account_id not in found_issues or aws_account_id in label_matches):
+                    found_issues.update({aws_account_id: issue})
+
+            if self.issue_index:
+                for aws_account_id in [x for x in chunk if x not in found_issues]:
+                    if self.issue_index.get_issue_key(project_key=self.project_key, aws_account_id=aws_account_id):
+                        self.logger.info("Removing stale JIRA issue index entry for AWS Account %s", aws_account_id)
+                        self.issue_index.remove_issue_key(project_key=self.project_key, aws_account_id=aws_account_id)
+
+        self.logger.debug("Batch search found %s of %s issues", len(found_issues), len(aws_account_ids))
+        return found_issues
+
+    # Create JIRA issues with the bulk create API, JIRA_BULK_CHUNK_SIZE issues per request. Returns dict mapping AWS Account ID to the created issue, or to the exception when its creation failed.
+    def __create_issues(self, items: dict, issue_type: str) -> dict:
+
+        created_issues = {}
+        aws_account_ids = list(items.keys())
+
+        for i in range(0, len(aws_account_ids), JIRA_BULK_CHUNK_SIZE):
+
+            chunk = aws_account_ids[i:i + JIRA_BULK_CHUNK_SIZE]
+
+            # The SDK's create_issues() cannot send entity properties and looks up the project once per issue, so the bulk create payload is built here.
+            try:
+                response = self.jira.post_issues(payload={
+                    'issueUpdates': [
+                        self.__get_create_issue_payload(
+                            issue_summary=items[x]['issue_summary'],
+                            issue_desc=items[x]['issue_desc'],
+                            issue_type=issue_type,
+                            issue_fingerprint=items[x]['issue_fingerprint'],
+                            aws_account_id=x
+                        ) for x in chunk
+                    ]
+                })
+            except (JIRAError, RequestException) as e:
+                self.logger.error("Bulk issue creation failed - %s", e)
+                created_issues.update({x: e for x in chunk})
+                continue
+
+            # Created issues are returned in request order, without the elements that failed
+            failed_elements = {x['failedElementNumber']: x for x in response.get('errors', [])}
+            for aws_account_id in [x for n, x in enumerate(chunk) if n in failed_elements]:
+                created_issues.update({aws_account_id: JIRAError(text=str(failed_elements[chunk.index(aws_account_id)].get('elementErrors')))})
+
+            for aws_account_id, raw_issue in zip([x for n, x in enumerate(chunk) if n not in failed_elements], response.get('issues', [])):
+                new_issue = self.jira.get_issue(raw=raw_issue)
+                created_issues.update({aws_account_id: new_issue})
+                if self.issue_index:
+                    self.issue_index.put_issue_key(project_key=self.project_key, aws_account_id=aws_account_id, issue_key=new_issue.key)
+
+            self.logger.info("Bulk created %s issues, %s failed", len(response.get('issues', [])), len(failed_elements))
+
+        return created_issues
+
+    # Update or insert JIRA issues for a batch of AWS accounts. Existing issues are found with one search per JIRA_BULK_CHUNK_SIZE accounts, changed ones are updated
+    # and missing ones are created through the bulk create API.
+    # items: list of dicts with `issue_summary`, `issue_desc`, `aws_account_id` and optionally `issue_content`
+    # Returns dict mapping AWS Account ID to the upserted issue, or to the exception raised for that account.
+    def upsert_jira_issues(self, items: list, issue_type: str = "Task") -> dict:
+
+        # Later items for the same AWS account replace earlier ones
+        batch_items = {}
+        for item in items:
+            batch_items.update({str(item['aws_account_id']): dict(item, issue_fingerprint=self.get_content_fingerprint(item.get('issue_content') if item.get('issue_content') is not None else item['issue_desc']))})
+
+        results = {}
+        found_issues = self.__find_issues(items=batch_items)
+
+        for aws_account_id, issue in found_issues.items():
+
+            if self.issue_index:
+                self.issue_index.put_issue_key(project_key=self.project_key, aws_account_id=aws_account_id, issue_key=issue.key)
+
+            if self.__get_issue_fingerprint(issue) == batch_items[aws_account_id]['issue_fingerprint']:
+                results.update({aws_account_id: issue})
+                continue
 
-        # Modify the List of existing labels. The new label is unicode with no spaces
-        for label in self.default_issue_labels:
-            issue.fields.labels.append(label)
+            try:
+                results.update({aws_account_id: self.__update_issue(
+                    issue = issue,
+                    issue_summary = batch_items[aws_account_id]['issue_summary'],
+                    issue_desc = batch_items[aws_account_id]['issue_desc'],
+                    issue_fingerprint = batch_items[aws_account_id]['issue_fingerprint'],
+                    aws_account_id = aws_account_id
+                )})
+            except (JIRAError, RequestException) as e:
+                self.logger.error("Updating Issue %s failed - %s", issue.key, e)
+                results.update({aws_account_id: e})
 
-        # Change the issue without sending updates
-        issue.update(notify=False, fields={"labels": issue.fields.labels})
+        missing_items = {x: y for x, y in batch_items.items() if x not in found_issues}
+        if missing_items:
+            results.update(self.__create_issues(items=missing_items, issue_type=issue_type))
 
-        return issue
\ No newline at end of file
+        return results
@@ -0,0 +1,129 @@
+import logging
+import json
+from requests import Session
+from requests.adapters import HTTPAdapter
+from jira.client import JIRA
+from jira.exceptions import JIRAError
+from jira.resources import Issue, IssueType, Project
+
+from rate_governor.rate_governor import RateGovernor
+
+# RateGovernedAdapter - requests transport adapter which sends every request through a RateGovernor, so Jira calls share the outbound rate limit
+# and throttled responses are retried within the delivery deadline. Mounted on the JiraClient session for the Jira Cloud URL.
+class RateGovernedAdapter(HTTPAdapter):
+
+    # RateGovernedAdapter Constructor
+    # rate_governor: RateGovernor object of the destination
+    #
+    # Returns: RateGovernedAdapter object
+    # Raises: None
+    def __init__(self, rate_governor: RateGovernor, **kwargs):
+        super().__init__(**kwargs)
+        self.rate_governor = rate_governor
+
+    # send: Sends the prepared request under the destination's rate limit. Returns the requests Response.
+    def send(self, request, **kwargs):
+        return self.rate_governor.call(super().send, request, **kwargs)
+
+# JiraClient - class for the Jira Cloud REST API v2 calls made by JiraHandler, on a keep-alive requests session owned by the client.
+# Mirrors the JIRA SDK methods used here and returns the SDK's resource objects. Error responses raise JIRAError, like the SDK.
+# The session has no transport retries, so a request which may have reached Jira is never sent twice. Only throttled responses are retried, by the rate governor.
+class JiraClient:
+
+    # JiraClient Constructor
+    # logger: Logger object
+    # server_url: Jira Cloud URL, e.g. https://example.atlassian.net
+    # auth_email: Email of the Jira user
+    # api_token: API token of the Jira user
+    # timeout: HTTP timeout in seconds
+    # rate_governor: RateGovernor object every request is sent through
+    #
+    # Returns: JiraClient object
+    # Raises: None
+    def __init__(self, logger: logging.Logger, server_url: str, auth_email: str, api_token: str, timeout: float, rate_governor: RateGovernor):
+
+        self.logger = logger
+        self.server_url = server_url.rstrip('/')
+        self.timeout = timeout
+
+        # Resource options of the JIRA SDK, used to build Issue, IssueType and Project objects from the responses
+        self.options = dict(JIRA.DEFAULT_OPTIONS, server=self.server_url)
+
+        self.session = Session()
+        self.session.auth = (auth_email, api_token)
+        self.session.headers.update(self.options['headers'])
+        self.session.mount(self.server_url, RateGovernedAdapter(rate_governor=rate_governor))
+
+    # get_url: Returns str with the REST API v2 URL of the path
+    def get_url(self, path: str) -> str:
+        return self.server_url + '/rest/api/2/' + path
+
+    # request: Sends a request to Jira. Returns the parsed JSON response, or None when the response has no body.
+    # Raises: JIRAError when Jira answers with an error status, requests exceptions when there is no answer
+    def request(self, method: str, url: str, params: dict = None, data: dict = None):
+
+        response = self.session.request(
+            method,
+            url,
+            params=params,
+            data=json.dumps(data) if data is not None else None,
+            timeout=self.timeout
+        )
+
+        if not response.ok:
+            raise JIRAError(text=response.text, status_code=response.status_code, url=response.url, request=response.request, response=response)
+
+        return response.json() if response.content else None
+
+    # get_issue: Returns an Issue object for the raw issue JSON
+    def get_issue(self, raw: dict) -> Issue:
+        return Issue(self.options, self.session, raw=raw)
+
+    # get_issue_type: Returns an IssueType object for the raw issue type JSON
+    def get_issue_type(self, raw: dict) -> IssueType:
+        return IssueType(self.options, self.session, raw=raw)
+
+    # issue: Returns the Issue with the key, with only the requested fields and entity properties
+    def issue(self, issue_key: str, fields: str = None, properties: str = None) -> Issue:
+        return self.get_issue(self.request('GET', self.get_url('issue/' + issue_key), params={'fields': fields, 'properties': properties}))
+
+    # search_issues: Returns list with the Issues matching the JQL, up to maxResults from a single page of results
+    def search_issues(self, jql_str: str, maxResults: int = 50, fields: str = None, properties: str = None) -> list:
+
+        response = self.request('GET', self.get_url('search'), params={
+            'jql': jql_str,
+            'startAt': 0,
+            'maxResults': maxResults,
+            'fields': fields,
+            'properties': properties
+        })
+
+        return [self.get_issue(x) for x in response.get('issues', [])]
+
+    # post_issue: Creates an issue from the full create payload, entity properties included. Returns the created Issue, which only holds its ID, key and URL.
+    def post_issue(self, payload: dict) -> Issue:
+        return self.get_issue(self.request('POST', self.get_url('issue'), data=payload))
+
+    # post_issues: Creates issues with the bulk create API. Returns dict with the raw response, holding the created `issues` and the `errors` of the failed elements.
+    def post_issues(self, payload: dict) -> dict:
+        return self.request('POST', self.get_url('issue/bulk'), data=payload)
+
+    # put_issue: Edits an issue with the edit payload. Jira answers with no content, so nothing is returned.
+    def put_issue(self, issue: Issue, payload: dict) -> None:
+        self.request('PUT', issue.self, data=payload)
+
+    # project: Returns the Project with the key
+    def project(self, project_key: str) -> Project:
+        return Project(self.options, self.session, raw=self.request('GET', self.get_url('project/' + project_key)))
+
+    # projects: Returns list with every Project visible to the user
+    def projects(self) -> list:
+        return [Project(self.options, self.session, raw=x) for x in self.request('GET', self.get_url('project'))]
+
+    # issue_types_for_project: Returns list with the IssueTypes of the project
+    def issue_types_for_project(self, projectIdOrKey: str) -> list:
+        return [self.get_issue_type(x) for x in self.request('GET', self.get_url('project/' + str(projectIdOrKey) + '/statuses'))]
+
+    # close: Closes the session and its pooled connections
+    def close(self) -> None:
+        self.session.close()
@@ -1,64 +1,198 @@
 import logging
-from jira import JIRA
+import threading
+import hashlib
+from os import environ
+from jira.exceptions import JIRAError
 from jira.resources import Issue
 
+from rate_governor.rate_governor import RateGovernor
+
 from jira_handler.projects.projects import Projects
 from jira_handler.issues.issues import Issues
+from jira_handler.issue_index.issue_index import IssueIndex
+from jira_handler.jira_client.jira_client import JiraClient
+
+# Default HTTP timeout in seconds for Jira REST calls. Can be overridden with the `JIRA_CLIENT_TIMEOUT` environment variable.
+DEFAULT_JIRA_CLIENT_TIMEOUT = 10
+
+# Outbound rate limit for Jira Cloud REST calls. Overridable with `JIRA_RATE_LIMIT_PER_SECOND` and `JIRA_RATE_LIMIT_BURST`.
+JIRA_RATE_LIMIT_PER_SECOND = 10
+JIRA_RATE_LIMIT_BURST = 10
+
+# is_unauthorized: Returns bool whether the exception is Jira rejecting the session, e.g. after its API token expired or was revoked
+def is_unauthorized(e) -> bool:
+    return isinstance(e, JIRAError) and e.status_code == 401
 
 class JiraHandler:
 
+    # Authenticated Jira clients shared by every JiraHandler object in the execution environment, so the HTTP session and its TLS connections are reused across warm invocations.
+    # Keyed by (cloud_url, auth_email). Each entry holds the client and a digest of the API token it was created with.
+    jira_clients = {}
+    jira_clients_lock = threading.Lock()
+    jira_client_stats = {'created': 0, 'reused': 0, 'reconnects': 0}
+
     # JiraHandler Constructor
     # logger: Logger object
     #
     # Returns: JiraHandler object
     # Raises: None
-    def __init__(self, logger: logging.Logger, config: dict):
+    def __init__(self, logger: logging.Logger, config: dict, region_name: str = None):
         
         self.logger = logger
         self.config = config
+        self.issue_index = IssueIndex(logger=self.logger, region_name=region_name)
+        self.rate_governor = RateGovernor(
+            logger=self.logger,
+            destination='JIRA',
+            default_rate_per_second=JIRA_RATE_LIMIT_PER_SECOND,
+            default_burst=JIRA_RATE_LIMIT_BURST
+        )
 
-    # jira_create_issue: Creates an JIRA Object and creates a new issue on JIRA
-    def jira_create_issue(self, issue_summary: str = '', issue_desc: str = '') -> Issue:
+    # get_jira_client_stats: Returns dict with the Jira client creation, reuse and reconnect counters.
+    def get_jira_client_stats(self) -> dict:
+        with JiraHandler.jira_clients_lock:
+            return dict(JiraHandler.jira_client_stats)
 
-        # Create a JIRA Object
-        jira = JIRA(
-            server=self.config["jira"]["cloud_url"],
-            basic_auth=(self.config["jira"]["auth_email"],
-            self.config["jira"]["api_token"])
-        )
+    # get_jira_client: Returns the shared authenticated JiraClient object for the configured Cloud URL and user, creating it on first use.
+    # A new client is created when the API token has rotated or when `force_reconnect` is set after a stale session.
+    def get_jira_client(self, force_reconnect: bool = False) -> JiraClient:
 
-        # Create an Projects Object
-        projectsObj = Projects(jira_credentials=jira, logger=self.logger)
+        client_key = (self.config["jira"]["cloud_url"], self.config["jira"]["auth_email"])
+        token_digest = hashlib.sha256(str(self.config["jira"]["api_token"]).encode('utf-8')).hexdigest()
 
-        # Returns bool and project ID
-        project_info = projectsObj.does_project_exist(self.config["jira"]["project_key"])
+        with JiraHandler.jira_clients_lock:
 
-        if project_info[0]:
+            jira_client = JiraHandler.jira_clients.get(client_key)
 
-            # Create an Issues Object
-            issueObj = Issues(
+            if jira_client and jira_client['token_digest'] == token_digest and not force_reconnect:
+                JiraHandler.jira_client_stats['reused'] += 1
+                return jira_client['client']
+
+            if jira_client:
+                self.logger.info("Reconnecting JIRA client for %s. Token rotated: %s", client_key[0], jira_client['token_digest'] != token_digest)
+                JiraHandler.jira_client_stats['reconnects'] += 1
+                jira_client['client'].close()
+
+            # Create a JiraClient Object. Its session has no transport retries, every request goes through the rate governor instead, which retries throttled requests within the delivery deadline.
+            jira = JiraClient(
                 logger=self.logger,
-                jira_credentials=jira,
-                project_key=self.config["jira"]["project_key"],
-                project_id=project_info[1],
-                email_domain="@" + str(self.config["jira"]["auth_email"].split('@')[1]),
-                default_issue_labels=self.config["jira"]["default_issue_labels"],
+                server_url=self.config["jira"]["cloud_url"],
+                auth_email=self.config["jira"]["auth_email"],
+                api_token=self.config["jira"]["api_token"],
+                timeout=int(environ.get('JIRA_CLIENT_TIMEOUT', DEFAULT_JIRA_CLIENT_TIMEOUT)),
+                rate_governor=self.rate_governor
+            )
+
+            JiraHandler.jira_clients[client_key] = {
+                'client': jira,
+                'token_digest': token_digest
+            }
+            JiraHandler.jira_client_stats['created'] += 1
+
+            return jira
+
+    # jira_create_issue: Creates or updates an issue on JIRA using the shared JiraClient Object. Retries once on a new session when Jira rejects the current one with a 401.
+    # The issue index changes are written once, after the upsert.
+    # Other errors are not retried, since a request that failed after it was sent may already have created the issue.
+    # project_config: Optional dict with the `project_key` and `default_issue_labels` chosen by the routing table, overriding the configured ones
+    def jira_create_issue(self, issue_summary: str = '', issue_desc: str = '', aws_account_id: str = None, issue_content = None, project_config: dict = None) -> Issue:
+
+        try:
+            return self.__jira_create_issue(
+                jira=self.get_jira_client(),
+                issue_summary=issue_summary,
+                issue_desc=issue_desc,
+                aws_account_id=aws_account_id,
+                issue_content=issue_content,
+                project_config=project_config
             )
-               
-            # Building an JIRA issue
-            self.logger.debug("JIRA Issue Summary: " + str(issue_summary))
-            self.logger.debug("JIRA Issue Description: %s", issue_desc)
-
-            # Update or Insert a JIRA issue. If the issue exists, then update it. If the issue doesn't exist, then create a new issue.
-            issue = issueObj.upsert_jira_issue(
-                issue_summary = issue_summary,
-                issue_desc = issue_desc,
-                issue_type = "Task"
+
+        except JIRAError as e:
+            if not is_unauthorized(e):
+                raise
+            self.logger.warning("JIRA session is unauthorized. Reconnecting - %s", e)
+            return self.__jira_create_issue(
+                jira=self.get_jira_client(force_reconnect=True),
+                issue_summary=issue_summary,
+                issue_desc=issue_desc,
+                aws_account_id=aws_account_id,
+                issue_content=issue_content,
+                project_config=project_config
             )
-                
-            self.logger.info("Success.")
 
-            return issue
+        finally:
+            self.issue_index.flush()
+
+    # jira_upsert_issues: Creates or updates the JIRA issues for a batch of AWS accounts using the shared JiraClient Object.
+    # When Jira rejects the session with a 401, only the accounts which failed with it are retried once on a new session. The issue index changes are written once, after the batch.
+    # items: list of dicts with `issue_summary`, `issue_desc`, `aws_account_id` and optionally `issue_content`
+    # project_config: Optional dict with the `project_key` and `default_issue_labels` chosen by the routing table, overriding the configured ones
+    # Returns dict mapping AWS Account ID to the upserted issue, or to the exception raised for that account.
+    def jira_upsert_issues(self, items: list, project_config: dict = None) -> dict:
+
+        try:
+            results = self.__get_issues_object(jira=self.get_jira_client(), project_config=project_config).upsert_jira_issues(items=items, issue_type="Task")
+
+        # Raised by the project lookup or the issue search, before anything was written
+        except JIRAError as e:
+            if not is_unauthorized(e):
+                raise
+            self.logger.warning("JIRA session is unauthorized. Reconnecting - %s", e)
+            return self.__get_issues_object(jira=self.get_jira_client(force_reconnect=True), project_config=project_config).upsert_jira_issues(items=items, issue_type="Task")
 
         else:
-            raise Exception("JIRA Cloud Project does not exist.")
\ No newline at end of file
+            unauthorized_items = [x for x in items if is_unauthorized(results.get(str(x['aws_account_id'])))]
+            if unauthorized_items:
+                self.logger.warning("JIRA session is unauthorized. Reconnecting to retry %s of %s issues", len(unauthorized_items), len(results))
+                results.update(self.__get_issues_object(jira=self.get_jira_client(force_reconnect=True), project_config=project_config).upsert_jira_issues(items=unauthorized_items, issue_type="Task"))
+            return results
+
+        finally:
+            self.issue_index.flush()
+
+    # __get_issues_object: Returns an Issues object for the configured JIRA project, or the one in project_config. Raises an Exception when the project does not exist.
+    def __get_issues_object(self, jira: JiraClient, project_config: dict = None) -> Issues:
+
+        jira_config = dict(self.config["jira"], **(project_config or {}))
+
+        # Create an Projects Object
+        projectsObj = Projects(jira_credentials=jira, logger=self.logger)
+
+        # Returns bool and project ID
+        project_info = projectsObj.does_project_exist(jira_config["project_key"])
+
+        if not project_info[0]:
+            raise Exception("JIRA Cloud Project does not exist.")
+
+        # Create an Issues Object
+        return Issues(
+            logger=self.logger,
+            jira_credentials=jira,
+            project_key=jira_config["project_key"],
+            project_id=project_info[1],
+            email_domain="@" + str(self.config["jira"]["auth_email"].split('@')[1]),
+            default_issue_labels=jira_config["default_issue_labels"],
+            issue_index=self.issue_index,
+        )
+
+    # __jira_create_issue: Creates a new issue on JIRA, or updates the existing one, with the given JiraClient Object
+    def __jira_create_issue(self, jira: JiraClient, issue_summary: str, issue_desc: str, aws_account_id: str = None, issue_content = None, project_config: dict = None) -> Issue:
+
+        issueObj = self.__get_issues_object(jira=jira, project_config=project_config)
+
+        # Building an JIRA issue
+        self.logger.debug("JIRA Issue Summary: %s", issue_summary)
+        self.logger.debug("JIRA Issue Description: %s", issue_desc)
+
+        # Update or Insert a JIRA issue. If the issue exists, then update it. If the issue doesn't exist, then create a new issue.
+        issue = issueObj.upsert_jira_issue(
+            issue_summary = issue_summary,
+            issue_desc = issue_desc,
+            issue_type = "Task",
+            aws_account_id = aws_account_id,
+            issue_content = issue_content
+        )
+
+        self.logger.info("Success.")
+
+        return issue
\ No newline at end of file
@@ -1,49 +1,130 @@
 import logging
-from jira.client import JIRA
+import threading
+import json
+import time
+from os import environ, replace
+from jira.exceptions import JIRAError
+
+from jira_handler.jira_client.jira_client import JiraClient
+
+# Default time-to-live in seconds for cached JIRA project metadata. Can be overridden with the `JIRA_METADATA_CACHE_TTL` environment variable.
+DEFAULT_JIRA_METADATA_CACHE_TTL = 3600
+
+# Snapshot of the metadata cache, so a new execution environment on the same host can skip the project lookups
+JIRA_METADATA_CACHE_FILE = '/tmp/jira_project_metadata.json'
 
 # Projects - class to manage JIRA Cloud projects
 class Projects:
 
+    # JIRA project metadata cache shared by every Projects object and persisted to JIRA_METADATA_CACHE_FILE.
+    # Keyed by '<server_url>|project|<project_key>' for project IDs and '<server_url>|issue_types|<project_id>' for issue types. Each entry holds the value and its expiry epoch.
+    metadata_cache = {}
+    metadata_cache_loaded = False
+    metadata_cache_lock = threading.Lock()
+
     # Projects Constructor
-    # jira_credentials: JIRA credentials object 
+    # jira_credentials: JiraClient object
     # logger: Logger object
     #
     # Returns: Projects object
     # Raises: None
-    def __init__(self, jira_credentials: JIRA, logger: logging.Logger):
+    def __init__(self, jira_credentials: JiraClient, logger: logging.Logger):
         self.jira = jira_credentials
         self.logger = logger
-
-    # TODO: Create a new JIRA Cloud project
-    def create_project(self):
-        pass
+        self.metadata_cache_ttl = int(environ.get('JIRA_METADATA_CACHE_TTL', DEFAULT_JIRA_METADATA_CACHE_TTL))
+
+    # __get_cache_key: Returns str with the metadata cache key scoped to the JIRA Cloud server
+    def __get_cache_key(self, kind: str, name: str) -> str:
+        return str(self.jira.server_url) + '|' + kind + '|' + str(name)
+
+    # __load_metadata_cache: Loads the metadata cache snapshot from /tmp once per execution environment
+    def __load_metadata_cache(self) -> None:
+
+        if Projects.metadata_cache_loaded:
+            return
+
+        Projects.metadata_cache_loaded = True
+        try:
+            with open(JIRA_METADATA_CACHE_FILE, 'r') as cache_file:
+                Projects.metadata_cache.update(json.loads(cache_file.read()))
+            self.logger.debug("Loaded JIRA metadata cache snapshot with %s entries", len(Projects.metadata_cache))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.warning("Unable to load JIRA metadata cache snapshot - %s", e)
+
+    # __save_metadata_cache: Writes the metadata cache snapshot to /tmp. The file is replaced atomically so concurrent readers never see a partial snapshot.
+    def __save_metadata_cache(self) -> None:
+
+        try:
+            with open(JIRA_METADATA_CACHE_FILE + '.tmp', 'w') as cache_file:
+                cache_file.write(json.dumps(Projects.metadata_cache))
+            replace(JIRA_METADATA_CACHE_FILE + '.tmp', JIRA_METADATA_CACHE_FILE)
+        except Exception as e:
+            self.logger.warning("Unable to save JIRA metadata cache snapshot - %s", e)
+
+    # __get_cached: Returns the cached value for the key, or None when it is missing or expired
+    def __get_cached(self, cache_key: str):
+
+        with Projects.metadata_cache_lock:
+            self.__load_metadata_cache()
+            cached_entry = Projects.metadata_cache.get(cache_key)
+            if cached_entry and cached_entry['expires_at'] > time.time():
+                return cached_entry['value']
+            return None
+
+    # __set_cached: Stores a value in the metadata cache and persists the snapshot
+    def __set_cached(self, cache_key: str, value) -> None:
+
+        with Projects.metadata_cache_lock:
+            Projects.metadata_cache[cache_key] = {
+                'value': value,
+                'expires_at': time.time() + self.metadata_cache_ttl
+            }
+            self.__save_metadata_cache()
 
     # Get all JIRA Cloud projects
     def get_projects(self) -> list:        
         projects = self.jira.projects()
         return projects
 
-    # Check if project exists in JIRA Cloud
+    # Check if project exists in JIRA Cloud. Looks the project up directly by key and caches its ID.
     def does_project_exist(self, project_key: str) -> tuple[bool, str]:
 
-        projects = self.get_projects()
+        cache_key = self.__get_cache_key('project', project_key)
+        project_id = self.__get_cached(cache_key)
 
-        self.logger.debug("List of ALL Projects - " + str(projects))    
+        if project_id:
+            self.logger.debug("Project %s found in metadata cache - %s", project_key, project_id)
+            return True, project_id
 
-        for project in projects:
-            # key, name, id
-            if project.key == project_key:
-                return True, project.id
+        try:
+            project = self.jira.project(project_key)
+        except JIRAError as e:
+            if e.status_code == 404:
+                self.logger.debug("Project %s does not exist", project_key)
+                return False, ''
+            raise
 
-        return False
+        self.__set_cached(cache_key, project.id)
+
+        return True, project.id
     
     def get_project_issue_types(self, project_id: str):
 
+        cache_key = self.__get_cache_key('issue_types', project_id)
+        issue_types_raw_list = self.__get_cached(cache_key)
+
+        if issue_types_raw_list is not None:
+            return [self.jira.get_issue_type(raw=issue_type_raw) for issue_type_raw in issue_types_raw_list]
+
         issue_types_list =  self.jira.issue_types_for_project(
             projectIdOrKey = project_id
         )
 
-        self.logger.debug("List of ALL Issue Types for Project ID " + project_id + " - " + str(issue_types_list))
+        self.logger.debug("List of ALL Issue Types for Project ID %s - %s", project_id, issue_types_list)
+
+        self.__set_cached(cache_key, [issue_type.raw for issue_type in issue_types_list])
 
         return issue_types_list
 
@@ -58,4 +139,4 @@ class Projects:
             if issue_type.raw["name"] == issue_type_name:
                 return issue_type.raw["id"]
 
-        
\ No newline at end of file
+        
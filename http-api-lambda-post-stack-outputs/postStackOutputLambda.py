@@ -1,42 +1,394 @@
 import logging
 from os import environ
-import base64
 import json
+import hashlib
+import re
 from http.client import responses
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import time
 
-from config_handler.config_handler import ConfigHandler
-from jira_handler.jira_handler import JiraHandler
-from slack_block_generator.slack_block_generator import SlackBlockGenerator
+# Start of the init phase, for the init report at the end of this module
+init_started_at = time.perf_counter()
 
-logger = logging.getLogger(__name__)
-logger.setLevel(environ.get('LOG_LEVEL') if 'LOG_LEVEL' in environ.keys() else 'INFO')
+from delivery_queue.delivery_queue import DeliveryQueue
+from rate_governor.rate_governor import RateGovernor, RateGovernorBudgetExhausted
+from structured_logger.structured_logger import get_logger, start_request, log_payload
+
+# Log entries are written as JSON with secrets redacted, see `structured_logger`
+logger = get_logger(__name__, level=environ.get('LOG_LEVEL') if 'LOG_LEVEL' in environ.keys() else 'INFO')
 
 from utils.utils import Utils
 utilsObj = Utils(logger=logger)
 
 region_name = environ.get("REGION")
 
-config_handler = ConfigHandler(logger=logger, region_name=region_name)
-config = config_handler.get_combined_config()
-logger.debug("Final combined config - " + str(config))
+# The integrations are imported and created on first use and then reused across warm invocations, so the init phase only loads what every request needs.
+
+# load_config: Returns dict with the config of the enabled integrations. The SSM parameters are read from the Utils cache, which the config provider refreshes before every reload.
+def load_config() -> dict:
+
+    config = {}
+
+    from config_handler.config_handler import ConfigHandler
+    configHandlerObj = ConfigHandler(logger=logger, region_name=region_name)
+
+    if bool(environ.get("ENABLE_JIRA_INTEGRATION")):
+        config.update(configHandlerObj.get_combined_config())
+    else:
+        config.update({'routing': configHandlerObj.get_routing_config()})
+
+    # Routing rules kept in an SSM parameter replace the ones compiled into the package, so tenants can be routed without a redeploy
+    if environ.get('ROUTING_CONFIG_PARAMETER'):
+        config.update({
+            'routing': json.loads(utilsObj.get_ssm_parameter(
+                parameter_name=environ.get('ROUTING_CONFIG_PARAMETER'),
+                region_name=region_name
+            ))
+        })
+
+    if bool(environ.get('ENABLE_SLACK_INTEGRATION')):
+        config.update({
+            'slack': {
+                'webhook_url': utilsObj.get_ssm_parameter(
+                    parameter_name=environ.get('SLACK_WEBHOOK_URL'),
+                    region_name=region_name
+                )
+            }
+        })
+
+    logger.debug("Final combined config - %s", config)
+    return config
+
+# get_config: Returns dict with the current config. The config provider loads it on first use, then reloads it in the background so rotated tokens and webhooks are picked up without a redeploy.
+def get_config() -> dict:
+
+    from config_provider.config_provider import ConfigProvider
+
+    return utilsObj.get_lazy('config_provider', lambda: ConfigProvider(
+        logger=logger,
+        region_name=region_name,
+        ssm_parameter_names=[
+            environ.get("JIRA_API_TOKEN") if bool(environ.get("ENABLE_JIRA_INTEGRATION")) else None,
+            environ.get("SLACK_WEBHOOK_URL") if bool(environ.get('ENABLE_SLACK_INTEGRATION')) else None,
+            environ.get('ROUTING_CONFIG_PARAMETER')
+        ],
+        load_config=load_config
+    )).get_config()
+
+# get_jira: Returns the shared JiraHandler object
+def get_jira():
+
+    # Imported here since the jira SDK is the heaviest import of this function
+    from jira_handler.jira_handler import JiraHandler
+
+    jira = utilsObj.get_lazy('jira', lambda: JiraHandler(logger=logger, config=get_config(), region_name=region_name))
+
+    # Hand the current config to the shared handler. A rotated API token makes it reconnect on its next call.
+    jira.config = get_config()
+
+    return jira
+
+# get_routing_table: Returns the RoutingTable for the current config. It is compiled again only when a config reload swapped in new routing rules.
+def get_routing_table():
+
+    from routing_table.routing_table import RoutingTable
+
+    return RoutingTable.get_routing_table(logger=logger, routing_config=get_config().get('routing'))
+
+# route_batch: Groups a batch of stack outputs documents by their destination for one sink. Returns list of (destination, positions in http_bodies) tuples, in order of first appearance.
+# Documents which are not delivered to the sink are grouped under a None destination.
+def route_batch(http_bodies: list, sink: str) -> list:
+
+    routing_table = get_routing_table()
+    routes = {}
+
+    for position, http_body in enumerate(http_bodies):
+        destination = routing_table.get_destinations(http_body=http_body)[sink]
+        routes.setdefault(json.dumps(destination, sort_keys=True), (destination, []))[1].append(position)
+
+    return list(routes.values())
+
+# AWS Account IDs are 12 digits, leading zeros included
+AWS_ACCOUNT_ID_PATTERN = r'[0-9]{12}'
+
+# Status reported for a sink which the routing table does not deliver the stack outputs to
+NOT_ROUTED_RESPONSE = { "statusCode": 200, "body": "Not routed" }
+
+# Milliseconds held back from the Lambda's remaining time, so the handler can still return partial results after a sink misses its deadline
+DELIVERY_DEADLINE_MARGIN_MS = 1000
+
+# Remaining time assumed when the handler is invoked without a Lambda context, e.g. locally
+DEFAULT_REMAINING_TIME_MS = 30000
+
+# Queue used by the asynchronous delivery mode. The API handler enqueues and `worker_handler` drains it.
+delivery_queue = DeliveryQueue(logger=logger, region_name=region_name)
+
+# Slack digest mode - The worker coalesces queued deliveries into one batch, so a rollout across many accounts is posted as a few digest messages instead of one webhook call per account.
+# Deliveries are collected for up to SLACK_DIGEST_WINDOW_MS, or until SLACK_DIGEST_MAX_ACCOUNTS are queued.
+DEFAULT_SLACK_DIGEST_WINDOW_MS = 2000
+DEFAULT_SLACK_DIGEST_MAX_ACCOUNTS = 50
+
+# Thread pool used to run the Slack and Jira deliveries concurrently. Created once and reused across warm invocations.
+delivery_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='delivery')
+
+# is_slack_digest_enabled: Returns bool, True when the worker should deliver queued stack outputs as digests
+def is_slack_digest_enabled() -> bool:
+    return environ.get('SLACK_DIGEST_ENABLED', 'false').lower() == 'true'
+
+# get_slack_block_generator: Returns a SlackBlockGenerator object for the configured Slack webhook and channel, or for the ones in the routed slack_destination.
+# One object, with its connection pool and rate governor, is kept per webhook and channel and reused across warm invocations. It is keyed by a digest so the webhook URL is never logged.
+def get_slack_block_generator(slack_destination: dict = None):
+
+    # Imported here to keep urllib3 out of the init phase when Slack is disabled
+    from slack_block_generator.slack_block_generator import SlackBlockGenerator
+
+    slack_destination = slack_destination or {}
+
+    # Access environment variables. A routed webhook is the name of the SSM parameter holding the tenant's webhook URL.
+    slack_webhook_url = utilsObj.get_ssm_parameter(parameter_name=slack_destination['webhook_url'], region_name=region_name) if slack_destination.get('webhook_url') else get_config()['slack']['webhook_url']
+    slack_channel = slack_destination.get('channel', environ.get('SLACK_CHANNEL'))
+    slack_username = slack_destination.get('username', environ.get('SLACK_USERNAME'))
+    slack_icon_url = slack_destination.get('icon_url', environ.get('SLACK_ICON_URL'))
+
+    slack_key = hashlib.sha256(json.dumps([slack_webhook_url, slack_channel, slack_username, slack_icon_url]).encode('utf-8')).hexdigest()
+
+    return utilsObj.get_lazy('slack_block_generator|' + slack_key, lambda: SlackBlockGenerator(
+        webhook_url = slack_webhook_url,
+        channel = slack_channel,
+        username = slack_username,
+        icon_url = slack_icon_url,
+        logger = logger,
+    ))
+
+# get_slack_response: Returns dict with the Slack API status for the HTTP response from a (HTTP status, response data) tuple
+def get_slack_response(slack_http_status: tuple) -> dict:
+    return {
+        "statusCode": slack_http_status[0],
+        "body": slack_http_status[1].decode('utf-8') if isinstance(slack_http_status[1], bytes) else slack_http_status[1]
+    }
+
+# get_batch_response: Returns dict with the overall status of a batch delivery and one status per item. The overall status is the worst item status.
+def get_batch_response(item_responses: list) -> dict:
+
+    batch_status = max([x["statusCode"] for x in item_responses] or [200])
+
+    return {
+        "statusCode": batch_status,
+        "body": responses.get(batch_status, ''),
+        "Items": item_responses
+    }
+
+# post_to_slack: Posts the stack outputs to the Slack destination chosen by the routing table. Returns dict with the Slack API status for the HTTP response.
+def post_to_slack(http_body: dict) -> dict:
+
+    slack_destination = get_routing_table().get_destinations(http_body=http_body)['slack']
+
+    if slack_destination is None:
+        logger.debug("Stack outputs of %s are not routed to Slack", http_body.get("AWSAccountId"))
+        return NOT_ROUTED_RESPONSE
+
+    slack = get_slack_block_generator(slack_destination=slack_destination)
+
+    logger.debug("Slack Integration is Enabled. Posting to Slack...")
+    return get_slack_response(slack.post_slack_message(http_body=http_body))
+
+# post_batch_to_slack: Posts the stack outputs of a batch of AWS accounts to Slack, grouped into as few messages as possible per routed destination. Returns dict with the batch status and one Slack API status per item.
+def post_batch_to_slack(http_bodies: list) -> dict:
+
+    logger.debug("Slack Integration is Enabled. Posting batch of %s to Slack...", len(http_bodies))
+
+    item_responses = [NOT_ROUTED_RESPONSE] * len(http_bodies)
+
+    for slack_destination, positions in route_batch(http_bodies=http_bodies, sink='slack'):
+
+        if slack_destination is None:
+            continue
+
+        slack = get_slack_block_generator(slack_destination=slack_destination)
+        for position, slack_http_status in zip(positions, slack.post_slack_messages(http_bodies=[http_bodies[x] for x in positions])):
+            item_responses[position] = get_slack_response(slack_http_status)
+
+    return get_batch_response(item_responses)
+
+# post_to_jira: Creates or updates the Jira issue for the AWS account in the project chosen by the routing table. Returns dict with the Jira API status for the HTTP response.
+def post_to_jira(http_body: dict) -> dict:
+
+    log_payload(logger, "JSON Body", http_body)
+
+    jira_destination = get_routing_table().get_destinations(http_body=http_body)['jira']
+
+    if jira_destination is None:
+        logger.debug("Stack outputs of %s are not routed to Jira", http_body["AWSAccountId"])
+        return NOT_ROUTED_RESPONSE
+
+    issue = get_jira().jira_create_issue(
+        issue_summary="AWS Account - " + str(http_body["AWSAccountId"]),
+        issue_desc=str(http_body),
+        aws_account_id=str(http_body["AWSAccountId"]),
+        issue_content=http_body,
+        project_config=jira_destination
+    )
+
+    create_issue_status = 200 if "-" in str(issue) else 400
+
+    return {
+        "statusCode": create_issue_status,
+        "body": responses[create_issue_status]
+    }
+
+# post_batch_to_jira: Creates or updates the Jira issues for a batch of AWS accounts, with one bulk upsert per routed project. Returns dict with the batch status and one Jira API status per item.
+def post_batch_to_jira(http_bodies: list) -> dict:
+
+    item_responses = [NOT_ROUTED_RESPONSE] * len(http_bodies)
+
+    for jira_destination, positions in route_batch(http_bodies=http_bodies, sink='jira'):
+
+        if jira_destination is None:
+            continue
+
+        issues = get_jira().jira_upsert_issues(items=[
+            {
+                "issue_summary": "AWS Account - " + str(http_bodies[x]["AWSAccountId"]),
+                "issue_desc": str(http_bodies[x]),
+                "aws_account_id": str(http_bodies[x]["AWSAccountId"]),
+                "issue_content": http_bodies[x]
+            } for x in positions
+        ], project_config=jira_destination)
+
+        for position in positions:
+            issue = issues.get(str(http_bodies[position]["AWSAccountId"]))
+            create_issue_status = get_exception_status(issue) if isinstance(issue, Exception) else (200 if "-" in str(issue) else 400)
+            item_responses[position] = {
+                "statusCode": create_issue_status,
+                "body": str(issue) if create_issue_status == 200 else responses[create_issue_status]
+            }
+
+    return get_batch_response(item_responses)
+
+# get_exception_status: Returns int with the HTTP status reported for a failed delivery, 429 when the destination was still throttling once the retry budget was spent, else 500
+def get_exception_status(e: Exception) -> int:
+    return 429 if isinstance(e, RateGovernorBudgetExhausted) or RateGovernor.get_retry_after(e) is not None else 500
+
+# get_delivery_deadline: Returns the time.monotonic() deadline for a delivery sink, derived from the Lambda's remaining time and an optional per-sink timeout.
+def get_delivery_deadline(context, sink_timeout_env: str) -> float:
+
+    remaining_time_ms = context.get_remaining_time_in_millis() if hasattr(context, 'get_remaining_time_in_millis') else DEFAULT_REMAINING_TIME_MS
+    deadline_ms = remaining_time_ms - DELIVERY_DEADLINE_MARGIN_MS
+
+    if environ.get(sink_timeout_env):
+        deadline_ms = min(deadline_ms, int(environ.get(sink_timeout_env)))
+
+    return time.monotonic() + max(deadline_ms, 0) / 1000
+
+# get_deliveries: Returns dict with the enabled delivery sinks. Maps the response key to the delivery function and the environment variable holding its optional timeout in milliseconds.
+# Batch sinks take a list of stack outputs documents and return one status per document under `Items`.
+def get_deliveries(batch: bool = False) -> dict:
+
+    deliveries = {}
+
+    if bool(environ.get('ENABLE_SLACK_INTEGRATION')):
+        deliveries.update({"SlackAPI": (post_batch_to_slack if batch else post_to_slack, 'SLACK_DELIVERY_TIMEOUT_MS')})
+
+    if bool(environ.get("ENABLE_JIRA_INTEGRATION")):
+        deliveries.update({"JiraAPI": (post_batch_to_jira if batch else post_to_jira, 'JIRA_DELIVERY_TIMEOUT_MS')})
+
+    return deliveries
+
+# is_valid_http_body: Returns bool, True when the parsed HTTP body is a stack outputs document which can be delivered.
+# The AWS Account ID has to be a 12-digit string, since it ends up in the Jira label and the batch JQL search.
+def is_valid_http_body(http_body) -> bool:
+    return isinstance(http_body, dict) and isinstance(http_body.get('AWSAccountId'), str) and re.fullmatch(AWS_ACCOUNT_ID_PATTERN, http_body['AWSAccountId']) is not None
+
+# deliver_batch: Delivers a batch of stack outputs documents with one call per sink. Returns dict with the status of each sink and, under `Items`, the per-document status in request order.
+# Invalid documents are reported with a 400 status and skipped. A sink that fails or misses its deadline as a whole is reported against every document.
+def deliver_batch(http_bodies: list, context) -> dict:
+
+    valid_http_bodies = [x for x in http_bodies if is_valid_http_body(x)]
+    delivery_response = deliver(deliveries=get_deliveries(batch=True), http_body=valid_http_bodies, context=context) if valid_http_bodies else {}
+
+    items = []
+    valid_item_position = 0
+    for http_body in http_bodies:
+
+        if not is_valid_http_body(http_body):
+            items.append({ "statusCode": 400, "body": responses[400] })
+            continue
+
+        item = { "AWSAccountId": http_body["AWSAccountId"], "statusCode": 200 }
+        for sink_name, sink_response in delivery_response.items():
+            item.update({sink_name: sink_response["Items"][valid_item_position] if "Items" in sink_response else sink_response})
+            item.update({"statusCode": max(item["statusCode"], item[sink_name]["statusCode"])})
+
+        items.append(item)
+        valid_item_position += 1
+
+    batch_response = { sink_name: { "statusCode": x["statusCode"], "body": x["body"] } for sink_name, x in delivery_response.items() }
+    batch_response.update({ "Items": items })
+    return batch_response
+
+# run_delivery: Calls the delivery sink with the rate governor bounded by the sink's deadline. Returns dict with the sink's status.
+def run_delivery(delivery_function, http_body, deadline: float) -> dict:
+
+    RateGovernor.set_deadline(deadline)
+    try:
+        return delivery_function(http_body)
+    finally:
+        RateGovernor.set_deadline(None)
+
+# is_delivered: Returns bool, True when the delivery status is final. Server errors and throttling are worth retrying.
+def is_delivered(status_code: int) -> bool:
+    return status_code < 500 and status_code != 429
+
+# deliver: Runs the delivery sinks, concurrently unless DELIVERY_MODE is `sequential`. Returns dict with one status entry per sink.
+# In concurrent mode each sink is bounded by its own deadline. A sink that fails or misses its deadline is reported with a 500 or 504 status, while the other sinks' results are kept.
+# A sink still throttled once its retry budget is spent is reported with a 429 status.
+def deliver(deliveries: dict, http_body: dict, context) -> dict:
+
+    delivery_response = {}
+
+    if environ.get('DELIVERY_MODE', 'concurrent').lower() == 'sequential':
+        for sink_name, delivery in deliveries.items():
+            delivery_response.update({sink_name: run_delivery(delivery[0], http_body, get_delivery_deadline(context, delivery[1]))})
+        return delivery_response
+
+    futures = {}
+    for sink_name, delivery in deliveries.items():
+        deadline = get_delivery_deadline(context, delivery[1])
+        futures.update({sink_name: (delivery_executor.submit(run_delivery, delivery[0], http_body, deadline), deadline)})
+
+    for sink_name, (future, deadline) in futures.items():
+        try:
+            delivery_response.update({sink_name: future.result(timeout=max(deadline - time.monotonic(), 0))})
+        except TimeoutError:
+            logger.error("%s delivery did not finish before its deadline.", sink_name)
+            delivery_response.update({sink_name: {"statusCode": 504, "body": responses[504]}})
+        except Exception as e:
+            if get_exception_status(e) == 429:
+                logger.error("%s delivery was throttled. %s", sink_name, e)
+                delivery_response.update({sink_name: {"statusCode": 429, "body": responses[429]}})
+                continue
+            logger.exception("%s delivery failed.", sink_name)
+            delivery_response.update({sink_name: {"statusCode": 500, "body": responses[500]}})
+
+    return delivery_response
 
-if bool(environ.get("ENABLE_JIRA_INTEGRATION")):
-    jira = JiraHandler(logger=logger, config=config)
 
 def lambda_handler(event, context):
 
-    logger.info("Event - " + str(event))
+    start_request(context)
+    log_payload(logger, "Event", event, level=logging.INFO)
 
     if 'body' in event:
 
-        body = event['body']
+        # The body may be base64-encoded and gzip-compressed, see `Utils.get_http_body`
+        try:
+            http_body = json.loads(utilsObj.get_http_body(event))
+        except Exception as e:
+            logger.error("HTTP Error - 400. Message: Invalid HTTP Body. %s", e)
+            return { "statusCode": 400, "body": responses[400] }
 
-        if event['isBase64Encoded']:
-            body = base64.b64decode(body)
-
-        http_body = json.loads(body)
         logger.debug("HTTP Status Code - 200")
-        logger.info("HTTP Response Body - " + str(http_body))
+        log_payload(logger, "HTTP Response Body", http_body, level=logging.INFO)
 
         response = {}
         response.update({ 
@@ -46,54 +398,125 @@ def lambda_handler(event, context):
             }
         })
 
-        if bool(environ.get('ENABLE_SLACK_INTEGRATION')):
+        # Asynchronous mode - Validate and enqueue the stack outputs, then return 202 with the delivery ID. `worker_handler` delivers them to Slack and Jira.
+        # A batch is enqueued as one message per document and returns one delivery ID per document, or null for invalid documents.
+        if environ.get('ASYNC_DELIVERY', 'false').lower() == 'true':
 
-            # Access environment variables
-            slack_webhook_url = utilsObj.get_ssm_parameter(
-                parameter_name=environ.get('SLACK_WEBHOOK_URL'),
-                region_name=region_name
-            )
-            slack_channel = environ.get('SLACK_CHANNEL')
-            slack_username = environ.get('SLACK_USERNAME')
-            slack_icon_url = environ.get('SLACK_ICON_URL')
-
-            slack = SlackBlockGenerator(
-                webhook_url = slack_webhook_url,
-                channel = slack_channel,
-                username = slack_username,
-                icon_url = slack_icon_url,
-                logger = logger,
-            )
-
-            logger.debug("Slack Integration is Enabled. Posting to Slack...")
-            slack_http_status = slack.post_slack_message(http_body=http_body)
-
-            response.update({ 
-                "SlackAPI": { 
-                    "statusCode": slack_http_status[0],
-                    "body": slack_http_status[1]
-                }
-            })
-
-        if bool(environ.get("ENABLE_JIRA_INTEGRATION")):
-
-            logger.debug("JSON Body - " + str(http_body))
-
-            issue = jira.jira_create_issue(
-                issue_summary="AWS Account - " + str(http_body["AWSAccountId"]),
-                issue_desc=str(http_body)
-            )
-
-            create_issue_status = 200 if "-" in str(issue) else 400
-
-            response.update({ 
-                "JiraAPI": { 
-                    "statusCode": create_issue_status,
-                    "body": responses[create_issue_status]
-                }
-            })
+            if not (is_valid_http_body(http_body) or (isinstance(http_body, list) and any(is_valid_http_body(x) for x in http_body))):
+                logger.error("HTTP Error - 400. Message: Invalid HTTP Body.")
+                return { "statusCode": 400, "body": responses[400] }
+
+            # Accepting the stack outputs without a queue the worker reads would lose them
+            if not delivery_queue.is_configured():
+                logger.error("HTTP Error - 500. Message: ASYNC_DELIVERY is enabled but neither DELIVERY_QUEUE_URL nor DELIVERY_QUEUE_DIR is set.")
+                return { "statusCode": 500, "body": responses[500] }
+
+            if isinstance(http_body, list):
+                delivery_ids = [delivery_queue.enqueue(message=x) if is_valid_http_body(x) else None for x in http_body]
+            else:
+                delivery_ids = delivery_queue.enqueue(message=http_body)
+            logger.info("Delivery %s accepted", delivery_ids)
+
+            return {
+                "statusCode": 202,
+                "headers": { "Content-Type": "application/json" },
+                "body": json.dumps({
+                    "API": {
+                        "statusCode": 202,
+                        "body": responses[202]
+                    },
+                    ("DeliveryIds" if isinstance(http_body, list) else "DeliveryId"): delivery_ids
+                })
+            }
+
+        # Batch mode - The body is an array of stack outputs documents, delivered with one Jira search, bulk creates and grouped Slack messages
+        if isinstance(http_body, list):
+            response.update(deliver_batch(http_bodies=http_body, context=context))
+            return response
+
+        response.update(deliver(deliveries=get_deliveries(), http_body=http_body, context=context))
 
         return response
     
     logger.exception("HTTP Error - 500. Message: Invalid HTTP Body.")
     return { "statusCode": 500, "body": "Error" }
+
+# worker_handler: Delivers the stack outputs queued by the asynchronous mode of lambda_handler.
+# Invoked by an SQS event source mapping, the records in the event are processed and failed ones are returned as `batchItemFailures`, so only those are retried.
+# Invoked without SQS records, the queue is drained directly until it is empty or the Lambda is about to time out.
+# With SLACK_DIGEST_ENABLED, each batch of queued stack outputs is delivered together through the batch sinks, grouping the accounts into digest messages.
+def worker_handler(event, context):
+
+    start_request(context)
+    deliveries = get_deliveries()
+    results = {}
+    is_digest = is_slack_digest_enabled()
+    digest_max_accounts = int(environ.get('SLACK_DIGEST_MAX_ACCOUNTS', DEFAULT_SLACK_DIGEST_MAX_ACCOUNTS))
+
+    # deliver_message: Returns bool, True when every sink accepted the stack outputs
+    def deliver_message(delivery_id: str, http_body: dict) -> bool:
+        delivery_response = deliver(deliveries=deliveries, http_body=http_body, context=context)
+        results.update({delivery_id: delivery_response})
+        logger.info("Delivery %s - %s", delivery_id, delivery_response)
+        return all(is_delivered(x["statusCode"]) for x in delivery_response.values())
+
+    # deliver_digest: Delivers several queued stack outputs with one call per sink. Returns list of bool, True for each message every sink accepted.
+    def deliver_digest(messages: list) -> list:
+        digest_response = deliver_batch(http_bodies=[x[2] for x in messages], context=context)
+        logger.info("Digest of %s deliveries - %s", len(messages), { x: y for x, y in digest_response.items() if x != "Items" })
+        for message, item_response in zip(messages, digest_response["Items"]):
+            results.update({message[1]: item_response})
+        return [is_delivered(x["statusCode"]) for x in digest_response["Items"]]
+
+    # deliver_messages: Delivers (receipt, delivery ID, message) tuples, as one digest or one by one. Returns list of bool in the same order.
+    def deliver_messages(messages: list) -> list:
+        if is_digest:
+            return [x for offset in range(0, len(messages), digest_max_accounts) for x in deliver_digest(messages=messages[offset:offset + digest_max_accounts])]
+        return [deliver_message(delivery_id=x[1], http_body=x[2]) for x in messages]
+
+    if 'Records' in event:
+
+        # The digest window for SQS is the event source mapping's batching window
+        messages = []
+        for record in event['Records']:
+            message_body = json.loads(record['body'])
+            messages.append((record['messageId'], message_body['DeliveryId'], message_body['Message']))
+
+        batch_item_failures = [{ "itemIdentifier": message[0] } for message, is_message_delivered in zip(messages, deliver_messages(messages=messages)) if not is_message_delivered]
+
+        return { "batchItemFailures": batch_item_failures }
+
+    while not hasattr(context, 'get_remaining_time_in_millis') or context.get_remaining_time_in_millis() > DELIVERY_DEADLINE_MARGIN_MS:
+
+        if is_digest:
+            # Wait for more deliveries to coalesce, but never past the point where the digest could no longer be delivered in time
+            remaining_time_ms = context.get_remaining_time_in_millis() if hasattr(context, 'get_remaining_time_in_millis') else DEFAULT_REMAINING_TIME_MS
+            digest_window_ms = min(int(environ.get('SLACK_DIGEST_WINDOW_MS', DEFAULT_SLACK_DIGEST_WINDOW_MS)), max((remaining_time_ms - DELIVERY_DEADLINE_MARGIN_MS) // 2, 0))
+            messages = delivery_queue.receive_batch(max_messages=digest_max_accounts, window_seconds=digest_window_ms / 1000)
+        else:
+            messages = delivery_queue.receive()
+
+        if not messages:
+            break
+
+        is_batch_delivered = True
+        for message, is_message_delivered in zip(messages, deliver_messages(messages=messages)):
+            if is_message_delivered:
+                delivery_queue.delete(receipt=message[0])
+            else:
+                is_batch_delivered = False
+
+        # Failed messages stay on the queue for the next run. Stop instead of receiving them again straight away.
+        if not is_batch_delivered:
+            break
+
+    return results
+
+# With EAGER_INIT (e.g. under provisioned concurrency), create the enabled integrations during the init phase instead
+if environ.get('EAGER_INIT', 'false').lower() == 'true':
+    if bool(environ.get("ENABLE_JIRA_INTEGRATION")):
+        get_jira()
+    if bool(environ.get('ENABLE_SLACK_INTEGRATION')):
+        get_slack_block_generator()
+
+utilsObj.report_init(started_at=init_started_at)
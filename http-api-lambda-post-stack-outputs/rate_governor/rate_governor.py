@@ -0,0 +1,198 @@
+import logging
+import threading
+import hashlib
+import random
+import time
+from os import environ
+from email.utils import parsedate_to_datetime
+
+# Default number of retries after a throttled response. Can be overridden per destination with the `<DESTINATION>_MAX_RETRIES` environment variable.
+DEFAULT_MAX_RETRIES = 3
+
+# Backoff in seconds used when a throttled response has no Retry-After header. Doubles on every retry up to RATE_GOVERNOR_MAX_BACKOFF.
+RATE_GOVERNOR_BASE_BACKOFF = 0.5
+RATE_GOVERNOR_MAX_BACKOFF = 30
+
+# HTTP statuses treated as throttling. A 503 only counts when the server sent a Retry-After header.
+THROTTLE_STATUS_CODES = [429, 503]
+
+# RateGovernorBudgetExhausted - raised when a call cannot get a token before the delivery deadline
+class RateGovernorBudgetExhausted(Exception):
+    pass
+
+# RateGovernor - class to smooth outbound calls to a rate-limited destination (Slack, Jira Cloud)
+# Calls take a token from a bucket shared by every RateGovernor object for the same destination, or the same destination and bucket key, in the execution environment.
+# Throttled responses are retried with Retry-After-aware backoff and jitter, within the retry limit and the deadline set for the current thread.
+class RateGovernor:
+
+    # Token buckets keyed by destination, suffixed with the digest of the bucket key when there is one. Each entry holds the available tokens, the last refill time and the time until which the destination asked us to back off.
+    buckets = {}
+    # Throttle counters keyed by destination
+    throttle_stats = {}
+    rate_governor_lock = threading.Lock()
+
+    # Delivery deadline (time.monotonic) of the calls made by the current thread. Set by the delivery sink before it calls out.
+    deadline_context = threading.local()
+
+    # RateGovernor Constructor
+    # logger: Logger object
+    # destination: Name of the rate-limited destination, e.g. SLACK or JIRA. Prefix of the environment variables overriding the defaults below.
+    # default_rate_per_second: Tokens added to the bucket per second (`<DESTINATION>_RATE_LIMIT_PER_SECOND`)
+    # default_burst: Bucket size, the number of calls allowed back to back (`<DESTINATION>_RATE_LIMIT_BURST`)
+    # bucket_key: Optional key giving the calls their own bucket within the destination, for destinations limited per endpoint, e.g. the Slack webhook URL. Only its digest is kept.
+    #
+    # Returns: RateGovernor object
+    # Raises: None
+    def __init__(self, logger: logging.Logger, destination: str, default_rate_per_second: float, default_burst: int, bucket_key: str = None):
+
+        self.logger = logger
+        self.destination = destination.upper()
+        self.bucket_name = self.destination + ('|' + hashlib.sha256(bucket_key.encode('utf-8')).hexdigest()[:16] if bucket_key else '')
+        self.rate_per_second = float(environ.get(self.destination + '_RATE_LIMIT_PER_SECOND', default_rate_per_second))
+        self.burst = int(environ.get(self.destination + '_RATE_LIMIT_BURST', default_burst))
+        self.max_retries = int(environ.get(self.destination + '_MAX_RETRIES', DEFAULT_MAX_RETRIES))
+
+        with RateGovernor.rate_governor_lock:
+            RateGovernor.buckets.setdefault(self.bucket_name, {
+                'tokens': float(self.burst),
+                'updated_at': time.monotonic(),
+                'blocked_until': 0.0
+            })
+            RateGovernor.throttle_stats.setdefault(self.destination, {
+                'calls': 0,
+                'throttled': 0,
+                'retries': 0,
+                'budget_exhausted': 0,
+                'wait_ms': 0
+            })
+
+    # set_deadline: Sets the deadline (time.monotonic) for the calls made by the current thread. None removes the bound.
+    @staticmethod
+    def set_deadline(deadline: float = None) -> None:
+        RateGovernor.deadline_context.deadline = deadline
+
+    # get_deadline: Returns the deadline for the calls made by the current thread, or None
+    @staticmethod
+    def get_deadline() -> float:
+        return getattr(RateGovernor.deadline_context, 'deadline', None)
+
+    # get_retry_after: Returns float with the seconds to wait when the response or exception is a throttled HTTP response (0 when the server did not say), or None when it is not throttled.
+    # Works with urllib3 and requests responses and with exceptions carrying one, e.g. JIRAError.
+    @staticmethod
+    def get_retry_after(response_or_exception) -> float:
+
+        status = getattr(response_or_exception, 'status_code', None) or getattr(response_or_exception, 'status', None)
+        if status not in THROTTLE_STATUS_CODES:
+            return None
+
+        headers = getattr(response_or_exception, 'headers', None)
+        if headers is None and getattr(response_or_exception, 'response', None) is not None:
+            headers = getattr(response_or_exception.response, 'headers', None)
+
+        retry_after = headers.get('Retry-After') if headers else None
+
+        if retry_after is None:
+            return 0.0 if status == 429 else None
+
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+
+        try:
+            return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return 0.0
+
+    # get_throttle_stats: Returns dict with the throttle counters of this destination
+    def get_throttle_stats(self) -> dict:
+        with RateGovernor.rate_governor_lock:
+            return dict(RateGovernor.throttle_stats[self.destination])
+
+    # __count: Adds to one of the throttle counters of this destination
+    def __count(self, counter: str, value: int = 1) -> None:
+        with RateGovernor.rate_governor_lock:
+            RateGovernor.throttle_stats[self.destination][counter] += value
+
+    # __acquire: Takes a token from the bucket, sleeping until one is available.
+    # Raises: RateGovernorBudgetExhausted when the token would only be available after the deadline
+    def __acquire(self, deadline: float) -> None:
+
+        with RateGovernor.rate_governor_lock:
+
+            bucket = RateGovernor.buckets[self.bucket_name]
+            now = time.monotonic()
+
+            bucket['tokens'] = min(bucket['tokens'] + (now - bucket['updated_at']) * self.rate_per_second, float(self.burst))
+            bucket['updated_at'] = now
+
+            # Reserve the token now, even when it has to be waited for, so concurrent callers queue up behind each other
+            wait = max((1 - bucket['tokens']) / self.rate_per_second, bucket['blocked_until'] - now, 0.0)
+
+            if deadline is not None and now + wait > deadline:
+                RateGovernor.throttle_stats[self.destination]['budget_exhausted'] += 1
+                raise RateGovernorBudgetExhausted(self.destination + " rate limit leaves no time before the deadline. Wait needed: " + str(round(wait, 3)) + "s")
+
+            bucket['tokens'] -= 1
+            RateGovernor.throttle_stats[self.destination]['calls'] += 1
+
+        if wait > 0:
+            self.logger.debug("%s rate governor waiting %ss for a token", self.destination, round(wait, 3))
+            self.__count('wait_ms', int(wait * 1000))
+            time.sleep(wait)
+
+    # __block: Holds every caller sharing the bucket back for `delay` seconds after a throttled response
+    def __block(self, delay: float) -> None:
+        with RateGovernor.rate_governor_lock:
+            bucket = RateGovernor.buckets[self.bucket_name]
+            bucket['blocked_until'] = max(bucket['blocked_until'], time.monotonic() + delay)
+
+    # call: Calls func(*args, **kwargs) under the bucket's rate limit. Retries throttled responses and throttled exceptions with backoff, within the retry limit and the current thread's deadline.
+    # Returns the result of func. When the retries run out, the last throttled response is returned, or the last throttled exception is raised.
+    # Raises: RateGovernorBudgetExhausted when no call could be made before the deadline, and any exception from func that is not throttling
+    def call(self, func, *args, **kwargs):
+
+        deadline = RateGovernor.get_deadline()
+        retry_number = 0
+
+        while True:
+
+            self.__acquire(deadline=deadline)
+
+            throttled_exception = None
+            try:
+                result = func(*args, **kwargs)
+                retry_after = RateGovernor.get_retry_after(result)
+            except Exception as e:
+                retry_after = RateGovernor.get_retry_after(e)
+                if retry_after is None:
+                    raise
+                throttled_exception = e
+
+            if retry_after is None:
+                return result
+
+            self.__count('throttled')
+
+            # Retry-After wins over the exponential backoff. Jitter spreads the retries of concurrent callers.
+            delay = min(retry_after or RATE_GOVERNOR_BASE_BACKOFF * (2 ** retry_number), RATE_GOVERNOR_MAX_BACKOFF) * random.uniform(1.0, 1.25)
+            self.__block(delay=delay)
+
+            if retry_number >= self.max_retries or (deadline is not None and time.monotonic() + delay > deadline):
+                self.logger.warning("%s throttled the call and the retry budget is spent after %s retries", self.destination, retry_number)
+                self.__count('budget_exhausted')
+                if throttled_exception is not None:
+                    raise throttled_exception
+                return result
+
+            self.logger.info("%s throttled the call. Retrying in %ss", self.destination, round(delay, 3))
+            self.__count('retries')
+            retry_number += 1
+
+    # wrap: Returns a function which calls func through `call`
+    def wrap(self, func):
+
+        def governed_func(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+
+        return governed_func
@@ -0,0 +1,169 @@
+import logging
+import threading
+
+# Match kinds of a routing rule, in the order they are tried for a stack outputs document. The first kind with a matching rule wins.
+ROUTE_MATCH_KINDS = ['account', 'ou', 'tag']
+
+# Suffix marking a prefix pattern, e.g. `ou:ou-ab12-*` or `tag:Team=payments*`. Any other pattern only matches exactly.
+ROUTE_PREFIX_WILDCARD = '*'
+
+# Keys of the stack outputs document holding the organizational unit ID and the account tags used for routing
+ROUTE_OU_KEY = 'AWSOrganizationalUnitId'
+ROUTE_TAGS_KEY = 'AWSAccountTags'
+
+# Destination settings a routing rule may override per sink. `webhook_url` is the name of the SSM parameter holding the tenant's Slack webhook URL.
+ROUTE_DESTINATION_KEYS = {
+    'jira': ['project_key', 'default_issue_labels'],
+    'slack': ['webhook_url', 'channel', 'username', 'icon_url']
+}
+
+# Key of the trie node entry holding the rule of the prefix ending at that node. Trie edges are single characters, so it never collides with one.
+TRIE_RULE_KEY = ''
+
+# RoutingTable - class to choose the Jira and Slack destinations of a stack outputs document from the routing rules in config
+#
+# Routing config:
+#   {
+#       "default": { "jira": {...}, "slack": {...} },
+#       "rules": [
+#           { "match": "account:123456789012", "jira": { "project_key": "PAY" }, "slack": { "channel": "payments-stacks" } },
+#           { "match": "ou:ou-ab12-*", "slack": false },
+#           { "match": "tag:Team=data*", "jira": { "project_key": "DATA" } }
+#       ]
+#   }
+#
+# Each rule's destinations are merged over the default ones when the table is compiled. A sink set to false is not delivered to for the matching accounts.
+# Exact patterns go into a dict and prefix patterns into a character trie, so a lookup costs one dict hit plus one walk of the route key, however many rules there are.
+class RoutingTable:
+
+    # Last compiled routing table, reused until the config provider swaps in a different routing config. Holds the routing config object and its RoutingTable.
+    compiled_routing_table = (None, None)
+    compiled_routing_table_lock = threading.Lock()
+
+    # RoutingTable Constructor
+    # logger: Logger object
+    # routing_config: dict with the `default` destinations and the `rules` list, see above. None routes every document to the default destinations.
+    #
+    # Returns: RoutingTable object
+    # Raises: Exception when a rule is invalid
+    def __init__(self, logger: logging.Logger, routing_config: dict = None):
+
+        self.logger = logger
+        routing_config = routing_config or {}
+
+        self.default_destinations = self.__merge_destinations(base_destinations={'jira': {}, 'slack': {}}, rule=routing_config.get('default') or {}, rule_name='default')
+        self.exact_routes = {}
+        self.prefix_trie = {}
+
+        for rule_position, rule in enumerate(routing_config.get('rules') or []):
+            self.__add_rule(rule_position=rule_position, rule=rule)
+
+        self.logger.debug("Compiled routing table with %s exact and %s prefix rules", len(self.exact_routes), self.__count_prefix_rules(self.prefix_trie))
+
+    # get_routing_table: Returns the RoutingTable for the routing config, compiling it only when the config object differs from the last compiled one
+    @staticmethod
+    def get_routing_table(logger: logging.Logger, routing_config: dict = None) -> 'RoutingTable':
+
+        with RoutingTable.compiled_routing_table_lock:
+
+            if RoutingTable.compiled_routing_table[1] is None or RoutingTable.compiled_routing_table[0] is not routing_config:
+                RoutingTable.compiled_routing_table = (routing_config, RoutingTable(logger=logger, routing_config=routing_config))
+
+            return RoutingTable.compiled_routing_table[1]
+
+    # __merge_destinations: Returns dict with the rule's sink settings merged over the base destinations. A sink set to false in the rule becomes None.
+    def __merge_destinations(self, base_destinations: dict, rule: dict, rule_name: str) -> dict:
+
+        destinations = {}
+
+        for sink, destination_keys in ROUTE_DESTINATION_KEYS.items():
+
+            sink_destination = rule.get(sink, {})
+
+            if sink_destination is False:
+                destinations[sink] = None
+                continue
+
+            if not isinstance(sink_destination, dict) or any(x not in destination_keys for x in sink_destination):
+                raise Exception('Invalid ' + sink + ' destination in routing rule ' + rule_name + ' - expected false or an object with ' + str(destination_keys))
+
+            destinations[sink] = dict(base_destinations[sink] or {}, **sink_destination) if sink_destination or base_destinations[sink] is not None else None
+
+        return destinations
+
+    # __add_rule: Validates a rule and adds it to the exact routes or the prefix trie. An earlier rule with the same pattern wins.
+    def __add_rule(self, rule_position: int, rule: dict) -> None:
+
+        route_match = rule.get('match') if isinstance(rule, dict) else None
+
+        if not isinstance(route_match, str) or route_match.split(':', 1)[0] not in ROUTE_MATCH_KINDS or ':' not in route_match:
+            raise Exception('Invalid routing rule ' + str(rule_position) + ' - `match` must be one of ' + str([x + ':<pattern>' for x in ROUTE_MATCH_KINDS]))
+
+        route = (rule_position, self.__merge_destinations(base_destinations=self.default_destinations, rule=rule, rule_name=route_match))
+
+        if route_match.endswith(ROUTE_PREFIX_WILDCARD):
+            trie_node = self.prefix_trie
+            for character in route_match[:-len(ROUTE_PREFIX_WILDCARD)]:
+                trie_node = trie_node.setdefault(character, {})
+            if TRIE_RULE_KEY in trie_node:
+                self.logger.warning("Routing rule %s duplicates the pattern %s of an earlier rule and is ignored", rule_position, route_match)
+                return
+            trie_node[TRIE_RULE_KEY] = route
+            return
+
+        if route_match in self.exact_routes:
+            self.logger.warning("Routing rule %s duplicates the pattern %s of an earlier rule and is ignored", rule_position, route_match)
+            return
+        self.exact_routes[route_match] = route
+
+    # __count_prefix_rules: Returns int with the number of rules in the trie below trie_node
+    def __count_prefix_rules(self, trie_node: dict) -> int:
+        return sum(1 if x == TRIE_RULE_KEY else self.__count_prefix_rules(y) for x, y in trie_node.items())
+
+    # __get_route_keys: Returns dict mapping each match kind to the route keys of the stack outputs document, e.g. ['account:123456789012']
+    def __get_route_keys(self, http_body: dict) -> dict:
+
+        account_tags = http_body.get(ROUTE_TAGS_KEY)
+
+        return {
+            'account': ['account:' + str(http_body['AWSAccountId'])] if 'AWSAccountId' in http_body else [],
+            'ou': ['ou:' + str(http_body[ROUTE_OU_KEY])] if http_body.get(ROUTE_OU_KEY) else [],
+            'tag': ['tag:' + str(x) + '=' + str(y) for x, y in account_tags.items()] if isinstance(account_tags, dict) else []
+        }
+
+    # __match_route_key: Returns tuple with the (exact, prefix length, rule position, destinations) of the best rule for the route key, or None.
+    # An exact match beats any prefix match and a longer prefix beats a shorter one.
+    def __match_route_key(self, route_key: str) -> tuple:
+
+        if route_key in self.exact_routes:
+            rule_position, destinations = self.exact_routes[route_key]
+            return (True, len(route_key), rule_position, destinations)
+
+        best_match = None
+        trie_node = self.prefix_trie
+        for prefix_length in range(len(route_key) + 1):
+            if TRIE_RULE_KEY in trie_node:
+                best_match = (False, prefix_length) + trie_node[TRIE_RULE_KEY]
+            if prefix_length == len(route_key) or route_key[prefix_length] not in trie_node:
+                break
+            trie_node = trie_node[route_key[prefix_length]]
+
+        return best_match
+
+    # get_destinations: Returns dict with the `jira` and `slack` destinations of the stack outputs document. A sink is None when the document is not delivered to it.
+    # The returned dicts are shared with the table and must not be modified.
+    def get_destinations(self, http_body: dict) -> dict:
+
+        route_keys = self.__get_route_keys(http_body=http_body)
+
+        for match_kind in ROUTE_MATCH_KINDS:
+
+            # Among several keys of the same kind (tags), the most specific match wins, then the earliest rule
+            matches = [x for x in (self.__match_route_key(route_key=y) for y in route_keys[match_kind]) if x]
+
+            if matches:
+                best_match = max(matches, key=lambda x: (x[0], x[1], -x[2]))
+                self.logger.debug("Routing %s with rule %s", route_keys[match_kind], best_match[2])
+                return best_match[3]
+
+        return self.default_destinations
@@ -2,6 +2,26 @@ import urllib3
 import json
 import logging
 
+from rate_governor.rate_governor import RateGovernor
+from structured_logger.structured_logger import log_payload
+
+# Slack rejects messages with more than 50 blocks
+SLACK_MAX_BLOCKS_PER_MESSAGE = 50
+
+# Slack rejects context blocks with more than 10 elements
+SLACK_MAX_CONTEXT_ELEMENTS = 10
+
+# Slack rejects text objects longer than 3000 characters and header text longer than 150 characters
+SLACK_MAX_TEXT_LENGTH = 3000
+SLACK_MAX_HEADER_TEXT_LENGTH = 150
+
+# Slack allows about one message per second per webhook, with short bursts. Every webhook URL gets its own bucket.
+SLACK_RATE_LIMIT_PER_SECOND = 1
+SLACK_RATE_LIMIT_BURST = 3
+
+# Marker appended to values that were cut to fit the Slack text limits
+SLACK_TRUNCATION_MARKER = '... (truncated)'
+
 class SlackBlockGenerator:
     def __init__(self, webhook_url: str, channel: str, username: str, icon_url: str, logger: logging.Logger):
         self.webhook_url = webhook_url
@@ -10,6 +30,13 @@ class SlackBlockGenerator:
         self.icon_url = icon_url
         self.logger = logger
         self.http = urllib3.PoolManager()
+        self.rate_governor = RateGovernor(
+            logger=logger,
+            destination='SLACK',
+            default_rate_per_second=SLACK_RATE_LIMIT_PER_SECOND,
+            default_burst=SLACK_RATE_LIMIT_BURST,
+            bucket_key=webhook_url
+        )
 
     def __new_header(self, header_text: str) -> dict:
         return {
@@ -78,84 +105,160 @@ class SlackBlockGenerator:
             'blocks': blocks
         }
 
-        self.logger.debug("Slack Generated Blocks - " + str(data))
+        log_payload(self.logger, "Slack Generated Blocks", data)
 
         encoded_data = json.dumps(data).encode('utf-8')
+
         headers = {'Content-Type': 'application/json'}
-        response = self.http.request('POST', self.webhook_url, headers=headers, body=encoded_data)
+        response = self.rate_governor.call(self.http.request, 'POST', self.webhook_url, headers=headers, body=encoded_data)
         
-        self.logger.debug("Slack HTTP Response Status- " + str(response.status))
-        self.logger.debug("Slack HTTP Response Data - " + str(response.data))
+        self.logger.debug("Slack HTTP Response Status- %s", response.status)
+        self.logger.debug("Slack HTTP Response Data - %s", response.data)
 
         return (response.status, response.data)
-    
+
+    # __send_messages: Posts the messages in order and stops at the first one Slack rejects, so the channel never shows a later part without the earlier ones.
+    # Returns tuple with the (HTTP status, response data) of the rejected message, or of the last message when all of them were posted.
+    def __send_messages(self, messages) -> tuple[int, str]:
+
+        message_status = (200, b'')
+        for message_position, blocks in enumerate(messages):
+
+            message_status = self.__send_message(blocks=blocks)
+
+            if message_status[0] != 200:
+                self.logger.error("Slack rejected message part %s with HTTP status %s", message_position + 1, message_status[0])
+                break
+
+        return message_status
+
     def post_slack_message(self, http_body: dict) -> tuple[int, str]:
+        return self.__send_messages(messages=self.__split_messages(blocks=self.__iter_blocks(http_body=http_body)))
 
-        # Iterate through body and build text field for key-value pairs and field section for dictionaries
-        slack_blocks = []
+    # post_slack_messages: Posts the stack outputs of several AWS accounts, grouping as many accounts per message as the Slack block limit allows.
+    # An account with more blocks than fit in one message is posted on its own, split into several messages.
+    # Returns list with one (HTTP status, response data) tuple per item in http_bodies, from the message the item was posted in.
+    def post_slack_messages(self, http_bodies: list) -> list:
 
-        for key, value in http_body.items():
+        item_statuses = []
+        message_blocks = []
+        message_items = 0
 
-            if 'AWSAccountId' == key:
+        for http_body in http_bodies:
 
-                slack_blocks.append(
-                    self.__new_header(
-                        header_text = "AWS Account ID - " + str(value)
-                    )
-                )
+            blocks = self.__build_blocks(http_body=http_body)
+
+            # Flush the current message when this account's blocks (plus the separating divider) would go over the limit
+            if message_blocks and len(message_blocks) + len(blocks) + 1 > SLACK_MAX_BLOCKS_PER_MESSAGE:
+                item_statuses.extend([self.__send_message(blocks=message_blocks)] * message_items)
+                message_blocks = []
+                message_items = 0
+
+            if len(blocks) > SLACK_MAX_BLOCKS_PER_MESSAGE:
+                item_statuses.append(self.__send_messages(messages=self.__split_messages(blocks=blocks)))
+                continue
+
+            if message_blocks:
+                message_blocks.append(self.__new_divider())
+            message_blocks.extend(blocks)
+            message_items += 1
+
+        if message_blocks:
+            item_statuses.extend([self.__send_message(blocks=message_blocks)] * message_items)
+
+        return item_statuses
+
+    # __truncate: Returns str cut to max_length characters, ending with SLACK_TRUNCATION_MARKER when it was cut
+    def __truncate(self, text: str, max_length: int) -> str:
+
+        if len(text) <= max_length:
+            return text
+
+        self.logger.debug("Truncating Slack text of %s characters to %s", len(text), max_length)
+        return text[:max(max_length - len(SLACK_TRUNCATION_MARKER), 0)] + SLACK_TRUNCATION_MARKER
+
+    # __new_key_value_text: Returns str with the `*key* - `value`` markdown, truncating the value so the text (and its closing backtick) stays within the Slack text limit
+    def __new_key_value_text(self, key_text: str, value) -> str:
+
+        key_text = self.__truncate(text=key_text, max_length=SLACK_MAX_TEXT_LENGTH // 2)
+        return key_text + " - `" + self.__truncate(text=str(value), max_length=SLACK_MAX_TEXT_LENGTH - len(key_text) - 5) + "`"
+
+    # __get_stack_name: Returns str with the stack name from a CloudFormation stack ARN, or the key itself when it is not a stack ARN
+    def __get_stack_name(self, key: str) -> str:
+
+        try:
+            return (key.split(':')[5]).split('/')[1]
+        except IndexError:
+            return str(key)
+
+    # __iter_blocks: Yields the Slack blocks for one AWS account's stack outputs in a single pass over http_body.
+    # Stack outputs are rendered as context blocks of at most SLACK_MAX_CONTEXT_ELEMENTS elements each.
+    def __iter_blocks(self, http_body: dict):
+
+        if 'AWSAccountId' in http_body:
+            yield self.__new_header(
+                header_text = self.__truncate(text="AWS Account ID - " + str(http_body['AWSAccountId']), max_length=SLACK_MAX_HEADER_TEXT_LENGTH)
+            )
 
         for key, value in http_body.items():
 
-            self.logger.debug("HTTP Body key - " + str(key) + " : " + str(value))
-            text_section_list = []
+            if 'AWSAccountId' == key:
+                continue
+
+            yield self.__new_divider()
 
             if isinstance(value, dict):
 
-                text_section_list.append(
-                    self.__new_divider()
-                )
-
-                text_section_list.append(
-                    self.__new_text_section(
-                        text_section_dict = self.__new_markdown_text_field(
-                            markdown_text = "*" + (key.split(':')[5]).split('/')[1] + "*"
-                        )
+                yield self.__new_text_section(
+                    text_section_dict = self.__new_markdown_text_field(
+                        markdown_text = self.__truncate(text="*" + self.__get_stack_name(key=key) + "*", max_length=SLACK_MAX_TEXT_LENGTH)
                     )
                 )
-                
+
                 temp_elements_list = []
 
                 for dict_key, dict_value in value.items():
-                    
+
                     temp_elements_list.append(self.__new_markdown_text_field(
-                        markdown_text = str(dict_key) + " - `" + str(dict_value) + "`"
+                        markdown_text = self.__new_key_value_text(key_text=str(dict_key), value=dict_value)
                     ))
-                    
-                text_section_list.append(
-                    self.__new_context(
-                        elements_list = temp_elements_list
-                    )
-                )
 
-                self.logger.debug("(Dict) Text Section - " + str(text_section_list))
+                    if len(temp_elements_list) == SLACK_MAX_CONTEXT_ELEMENTS:
+                        yield self.__new_context(elements_list = temp_elements_list)
+                        temp_elements_list = []
+
+                # Slack rejects empty context blocks
+                if temp_elements_list:
+                    yield self.__new_context(elements_list = temp_elements_list)
+
             else:
 
-                if 'AWSAccountId' != key:
-                    text_section_list.append(
-                        self.__new_divider()
-                    )
-                    text_section_list.append(
-                        self.__new_text_section(
-                            text_section_dict = self.__new_markdown_text_field(
-                                markdown_text = "*" + str(key) + "* - `" + str(value) + "`"
-                            )
-                        )
+                yield self.__new_text_section(
+                    text_section_dict = self.__new_markdown_text_field(
+                        markdown_text = self.__new_key_value_text(key_text="*" + str(key) + "*", value=value)
                     )
+                )
+
+    # __build_blocks: Returns list with the Slack blocks for one AWS account's stack outputs
+    def __build_blocks(self, http_body: dict) -> list:
+        return list(self.__iter_blocks(http_body=http_body))
+
+    # __split_messages: Yields lists of at most SLACK_MAX_BLOCKS_PER_MESSAGE blocks from the blocks iterable, in order.
+    # A message never starts with a divider, since the message boundary already separates the sections.
+    def __split_messages(self, blocks):
+
+        message_blocks = []
+
+        for block in blocks:
 
-                self.logger.debug("(str) Text Section - " + str(slack_blocks))
+            if len(message_blocks) == SLACK_MAX_BLOCKS_PER_MESSAGE:
+                yield message_blocks
+                message_blocks = []
 
-            slack_blocks.extend(text_section_list)
+            if not message_blocks and block['type'] == 'divider':
+                continue
 
-            self.logger.debug("Slack Blocks Log - " + str(slack_blocks))
+            message_blocks.append(block)
 
-        return self.__send_message(blocks=slack_blocks)
\ No newline at end of file
+        if message_blocks:
+            yield message_blocks
@@ -1,9 +1,14 @@
 import logging
-import urllib3
 import json
 from os import environ
 
 from utils.utils import Utils
+from transport.transport import Transport
+
+# Timeouts in seconds and retry policy of the Archera endpoints called by this lambda, see `transport.transport.Transport`. Verifying has no side effects, so it is retried like a GET.
+ARCHERA_ENDPOINTS = {
+    'verify': {'connect_timeout': 3, 'read_timeout': 15, 'idempotent': True}
+}
 
 class Archera:
 
@@ -16,13 +21,19 @@ class Archera:
 
         self.logger = logger
         self.utils = Utils(logger=self.logger)
-        self.http = urllib3.PoolManager()
+        self.transport = Transport(logger=self.logger, service_name='ARCHERA', endpoints=ARCHERA_ENDPOINTS)
         self.base_url = base_url
         self.region_name = region_name
 
         ssm_key_partner_org_account_id = environ.get('SSM_KEY_ARCHERA_PARTNER_ORG_ID') # Archera Partner Account ID
         ssm_key_partner_api_key = environ.get('SSM_KEY_ARCHERA_PARTNER_API_KEY')
 
+        # Resolve both Archera Partner parameters with a single GetParameters call. The `get_ssm_parameter` calls below are then served from the cache.
+        self.utils.prefetch(
+            region_name=self.region_name,
+            ssm_parameter_names=[ssm_key_partner_org_account_id, ssm_key_partner_api_key]
+        )
+
         self.partner_account_id = self.utils.get_ssm_parameter(
             parameter_name=ssm_key_partner_org_account_id,
             region_name=region_name
@@ -39,8 +50,6 @@ class Archera:
     # __get_headers: Returns the headers for the Archera REST APIs. Returns dict with the headers.
     def __get_headers(self, api_key: str) -> dict:
 
-        self.logger.debug('Archera API Key: ' + api_key)
-
         import base64
 
         # Convert string to bytes
@@ -52,8 +61,6 @@ class Archera:
         # Convert bytes back to string for readability
         base64_str = base64_str.decode('utf-8')
 
-        self.logger.debug("Base64 encoded string: " + base64_str)
-
         return {
             'Content-Type': 'application/json',
             'Authorization': 'Basic ' + base64_str
@@ -66,14 +73,15 @@ class Archera:
             'account_id': customer_aws_account_id
         }
         try:
-            self.logger.debug('Verify Onboarding Request Body: ' + str(httpBody))
-            r = self.http.request(
+            self.logger.debug('Verify Onboarding Request Body: %s', httpBody)
+            r = self.transport.request(
                 'POST', self.__get_base_url(account_id=child_account_id) + '/partners/onboarding/aws/verify',
-                headers=self.__get_headers(),
+                endpoint='verify',
+                headers=self.__get_headers(api_key=self.partner_api_key),
                 body=json.dumps(httpBody)
             )
             response = json.loads(r.data)
-            self.logger.debug('Verify Onboarding Response: ' + str(response))
+            self.logger.debug('Verify Onboarding Response: %s', response)
             if r.status == 200:
                 return True
             else:
@@ -1,44 +1,84 @@
 from os import environ
 import logging
 import traceback
-import boto3
+import time
 
-# Setting up the logging level from the environment variable `LOGLEVEL`.
-logging.basicConfig()
-logger = logging.getLogger(__name__)
-logger.setLevel(environ['LOGLEVEL'] if 'LOGLEVEL' in environ.keys() else 'INFO')
+# Start of the init phase, for the init report at the end of this module
+init_started_at = time.perf_counter()
+
+from structured_logger.structured_logger import get_logger, start_request, log_payload
+
+# Setting up the logging level from the environment variable `LOGLEVEL`. Log entries are written as JSON with secrets redacted, see `structured_logger`.
+logger = get_logger(__name__, level=environ['LOGLEVEL'] if 'LOGLEVEL' in environ.keys() else 'INFO')
 
 # Setting up logging level specific to `botocore` from the environment variable `BOTOCORE_LOGLEVEL`.
 if 'BOTOCORE_LOGLEVEL' in environ.keys():
+    import boto3
     if environ['BOTOCORE_LOGLEVEL'] == 'DEBUG':
         logger.info('Setting boto3 logging to DEBUG')
         boto3.set_stream_logger('') # Log everything on boto3 messages to stdout
     else:
-        logger.info('Setting boto3 logging to ' + environ['BOTOCORE_LOGLEVEL'])
+        logger.info('Setting boto3 logging to %s', environ['BOTOCORE_LOGLEVEL'])
         boto3.set_stream_logger(level=logging._nameToLevel[environ['BOTOCORE_LOGLEVEL']]) # Log boto3 messages that match BOTOCORE_LOGLEVEL to stdout
 
 # Access environment variables
 base_url = environ.get('ARCHERA_BASE_URL')
 region_name = environ.get('REGION')
 
-from archera.archera import Archera
-archera = Archera(
-    logger=logger,
-    base_url=base_url,
-    region_name=region_name
-)
+from utils.utils import Utils
+utilsObj = Utils(logger=logger)
+
+# get_archera: Returns the shared Archera object. It is created on the first request, so the init phase does not wait on its SSM calls.
+def get_archera():
+
+    # Imported here to keep urllib3 and the Archera client out of the init phase
+    from archera.archera import Archera
+
+    return utilsObj.get_lazy('archera', lambda: Archera(
+        logger=logger,
+        base_url=base_url,
+        region_name=region_name
+    ))
+
+# Milliseconds held back from the Lambda's remaining time, so the handler can still log and respond when an Archera call is cut short
+ARCHERA_DEADLINE_MARGIN_MS = 1000
+
+# set_archera_deadline: Bounds the Archera calls of this request, timeouts and retries included, by the Lambda's remaining time
+def set_archera_deadline(context) -> None:
+
+    from transport.transport import Transport
+
+    if hasattr(context, 'get_remaining_time_in_millis'):
+        Transport.set_deadline(time.monotonic() + max(context.get_remaining_time_in_millis() - ARCHERA_DEADLINE_MARGIN_MS, 0) / 1000)
+    else:
+        Transport.set_deadline(None)
+
+# log_archera_transport_stats: Logs the Archera circuit breaker state and latency histograms, which are shared by the execution environment
+def log_archera_transport_stats() -> None:
+
+    from transport.transport import Transport
+
+    logger.info('Archera transport stats - %s', Transport(logger=logger, service_name='ARCHERA').get_transport_stats())
+
+# With EAGER_INIT (e.g. under provisioned concurrency), create the Archera object during the init phase instead
+if environ.get('EAGER_INIT', 'false').lower() == 'true':
+    get_archera()
+
+utilsObj.report_init(started_at=init_started_at)
 
 # lambda_handler: This script executes as part of an API to create Archera Accounts using Archera's API. The script is executed when the stack is created, updated and removed.
 # Returns the dynamic Archera CloudFormation template in the HTTP API response
 def lambda_handler(event, context) -> dict:
     
-    logger.debug('Event - ' + str(event))
-    logger.debug('Context - ' + str(context))
-    logger.debug('Environment variables - ' + str(environ))
+    start_request(context)
+    set_archera_deadline(context)
+    log_payload(logger, 'Event', event)
+    logger.debug('Context - %s', context)
+    logger.debug('Environment variables - %s', environ)
 
-    # Parse HTTP Request Body for request parameters
+    # Parse HTTP Request Body for request parameters. The body may be base64-encoded and gzip-compressed, see `Utils.get_http_body`.
     import json
-    http_body = json.loads(event['body'])
+    http_body = json.loads(utilsObj.get_http_body(event))
     
     child_account_id = http_body['child_account_id']
     onboarding_id = http_body['onboarding_id']
@@ -46,15 +86,14 @@ def lambda_handler(event, context) -> dict:
 
     try:
         logger.debug('Verify Archera Account Integration through Ibexlabs API')
-        logger.debug('Event - ' + str(event))
 
-        archera_onboarding_status = archera.verify_onboarding_success(
+        archera_onboarding_status = get_archera().verify_onboarding_success(
             child_account_id=child_account_id,
             onboarding_id=onboarding_id,
             customer_aws_account_id=account_id
         )
 
-        logger.debug('Archera Onboarding Status - ' + str(archera_onboarding_status))        
+        logger.debug('Archera Onboarding Status - %s', archera_onboarding_status)        
         if archera_onboarding_status:
             return archera_onboarding_status
         else:
@@ -62,8 +101,10 @@ def lambda_handler(event, context) -> dict:
 
     # Handling error response when the account creation failed and there is an exception in calling the API.
     except Exception as e:
-        logger.exception('Verify Archera Account Error - ' + str(traceback.print_tb(e.__traceback__)))
+        logger.exception('Verify Archera Account Error - %s', traceback.print_tb(e.__traceback__))
+        log_archera_transport_stats()
         # Respond to HTTP request with failure message
         return {
-            'ArcheraAccountCreationStatus': 'ACCOUNT_CREATION_UNVERIFIED'
+            'ArcheraAccountCreationStatus': 'ACCOUNT_CREATION_UNVERIFIED',
+            'ArcheraErrorMessage': str(e)
         }
\ No newline at end of file
@@ -0,0 +1,140 @@
+import logging
+import json
+import random
+import re
+import sys
+import time
+from collections.abc import Mapping
+from os import environ
+
+# Maximum length of a rendered log message, and of a payload inside it. Can be overridden with the `LOG_MESSAGE_MAX_LENGTH` environment variable.
+DEFAULT_LOG_MESSAGE_MAX_LENGTH = 8192
+
+# Share of requests whose full payloads (events, HTTP bodies, generated messages) are logged. Other requests log a summary instead. Can be overridden with the `LOG_PAYLOAD_SAMPLE_RATE` environment variable.
+DEFAULT_LOG_PAYLOAD_SAMPLE_RATE = 0.1
+
+# Mapping keys whose values are never logged
+REDACTED_KEY_PATTERN = re.compile(r'api[_-]?key|token|secret|password|authorization|webhook', re.IGNORECASE)
+
+# Secrets that can show up inside rendered strings: HTTP auth header values and Slack webhook URLs
+REDACTED_VALUE_PATTERNS = [
+    (re.compile(r'\b(Basic|Bearer) [A-Za-z0-9+/=._~-]+'), r'\1 ***'),
+    (re.compile(r'https://hooks\.slack\.com/services/[^\s\'"]+'), 'https://hooks.slack.com/services/***')
+]
+
+REDACTED_VALUE = '***'
+
+# Request currently being handled by this execution environment. Lambda handles one request at a time, so the sink threads share it.
+request_context = {'request_id': None, 'is_payload_sampled': False}
+
+# redact: Returns a copy of the value with the values of secret-looking mapping keys replaced, recursing into mappings, lists and tuples
+def redact(value):
+
+    if isinstance(value, Mapping):
+        return {
+            key: REDACTED_VALUE if isinstance(key, str) and REDACTED_KEY_PATTERN.search(key) else redact(item)
+            for key, item in value.items()
+        }
+
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+
+    return value
+
+# redact_text: Returns str with the secrets matched by REDACTED_VALUE_PATTERNS replaced
+def redact_text(text: str) -> str:
+
+    for pattern, replacement in REDACTED_VALUE_PATTERNS:
+        text = pattern.sub(replacement, text)
+
+    return text
+
+# truncate_text: Returns str cut to `max_length` characters with a note of how much was dropped
+def truncate_text(text: str, max_length: int = None) -> str:
+
+    max_length = max_length or int(environ.get('LOG_MESSAGE_MAX_LENGTH', DEFAULT_LOG_MESSAGE_MAX_LENGTH))
+
+    if len(text) <= max_length:
+        return text
+
+    return text[:max_length] + '... (' + str(len(text) - max_length) + ' more characters)'
+
+# RedactingFilter - logging filter which redacts the %-style arguments of a record before they are rendered
+class RedactingFilter(logging.Filter):
+
+    def filter(self, record: logging.LogRecord) -> bool:
+
+        if isinstance(record.args, Mapping):
+            record.args = redact(record.args)
+        elif record.args:
+            record.args = tuple(redact(arg) for arg in record.args)
+
+        return True
+
+# JsonFormatter - logging formatter which writes one JSON object per record, with the message redacted and capped to LOG_MESSAGE_MAX_LENGTH
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+
+        log_entry = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + '.%03dZ' % record.msecs,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': truncate_text(redact_text(record.getMessage()))
+        }
+
+        if request_context['request_id']:
+            log_entry['request_id'] = request_context['request_id']
+
+        if record.exc_info:
+            log_entry['exception'] = truncate_text(redact_text(self.formatException(record.exc_info)))
+
+        return json.dumps(log_entry, default=str)
+
+# TextFormatter - logging formatter for LOG_FORMAT=text, with the same redaction and cap as JsonFormatter
+class TextFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        return truncate_text(redact_text(super().format(record)))
+
+# get_logger: Returns the named Logger set up with the redacting filter and a JSON (or, with LOG_FORMAT=text, plain text) handler on stdout.
+# Messages should pass their values as %-style arguments, e.g. logger.debug('Event - %s', event), so they are only rendered when the level is enabled.
+def get_logger(name: str, level: str = None) -> logging.Logger:
+
+    logger = logging.getLogger(name)
+    logger.setLevel(level or 'INFO')
+
+    if not any(isinstance(x, RedactingFilter) for x in logger.filters):
+
+        handler = logging.StreamHandler(sys.stdout)
+        if environ.get('LOG_FORMAT', 'json').lower() == 'text':
+            handler.setFormatter(TextFormatter('[%(levelname)s] %(name)s - %(message)s'))
+        else:
+            handler.setFormatter(JsonFormatter())
+
+        logger.addFilter(RedactingFilter())
+        logger.addHandler(handler)
+
+        # The Lambda runtime's root handler would write every record a second time
+        logger.propagate = False
+
+    return logger
+
+# start_request: Records the request ID for the log entries of this request and decides whether its full payloads are logged
+def start_request(context) -> None:
+    request_context['request_id'] = getattr(context, 'aws_request_id', None)
+    request_context['is_payload_sampled'] = random.random() < float(environ.get('LOG_PAYLOAD_SAMPLE_RATE', DEFAULT_LOG_PAYLOAD_SAMPLE_RATE))
+
+# log_payload: Logs a payload under a label. The full payload is logged for sampled requests and a summary of its size and keys for the others.
+# Nothing is rendered when the level is disabled.
+def log_payload(logger: logging.Logger, label: str, payload, level: int = logging.DEBUG) -> None:
+
+    if not logger.isEnabledFor(level):
+        return
+
+    if request_context['is_payload_sampled']:
+        logger.log(level, '%s - %s', label, payload)
+    elif isinstance(payload, Mapping):
+        logger.log(level, '%s - %s keys %s (payload not sampled)', label, len(payload), list(payload.keys())[:20])
+    else:
+        logger.log(level, '%s - %s (payload not sampled)', label, type(payload).__name__ + (' of length ' + str(len(payload)) if hasattr(payload, '__len__') else ''))
@@ -0,0 +1,274 @@
+import logging
+import threading
+import random
+import time
+from os import environ
+from email.utils import parsedate_to_datetime
+
+import urllib3
+from urllib3.exceptions import HTTPError, NewConnectionError, ConnectTimeoutError
+
+# Default timeouts in seconds and attempts per call. Each one can be overridden per endpoint with `<SERVICE>_<ENDPOINT>_<SETTING>`, e.g. `ARCHERA_REGISTER_CHILD_READ_TIMEOUT`,
+# and for the whole service with `<SERVICE>_<SETTING>`, e.g. `ARCHERA_MAX_ATTEMPTS`.
+DEFAULT_TRANSPORT_SETTINGS = {
+    'CONNECT_TIMEOUT': 3.0,
+    'READ_TIMEOUT': 10.0,
+    'MAX_ATTEMPTS': 3
+}
+
+# Connection pool size per host, shared by the threads of a request. Can be overridden with `<SERVICE>_HTTP_MAX_POOL_SIZE`.
+DEFAULT_HTTP_MAX_POOL_SIZE = 10
+
+# Backoff in seconds before a retry, doubled on every attempt up to TRANSPORT_MAX_BACKOFF, with full jitter. A Retry-After header takes precedence.
+TRANSPORT_BASE_BACKOFF = 0.2
+TRANSPORT_MAX_BACKOFF = 2.0
+
+# HTTP statuses worth retrying for idempotent calls
+RETRY_STATUS_CODES = [429, 502, 503, 504]
+
+# Circuit breaker defaults. The circuit opens after `<SERVICE>_CIRCUIT_FAILURE_THRESHOLD` consecutive failed calls and lets one trial call through after `<SERVICE>_CIRCUIT_RESET_SECONDS`.
+DEFAULT_CIRCUIT_FAILURE_THRESHOLD = 5
+DEFAULT_CIRCUIT_RESET_SECONDS = 30
+
+# Upper bounds in milliseconds of the latency histogram buckets. The last bucket holds every slower call.
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+# TransportError - raised when a call failed without an HTTP response, after its retries
+class TransportError(Exception):
+    pass
+
+# CircuitOpenError - raised without calling out while the circuit breaker of the service is open
+class CircuitOpenError(TransportError):
+    pass
+
+# Transport - class for resilient HTTP calls to a REST service (Archera)
+# Every call runs with the connect and read timeouts of its endpoint, bounded by the request deadline. Failed calls are retried with backoff when that is safe:
+# connection failures always (the request never reached the service), timeouts and retryable statuses only for idempotent calls, i.e. GETs and endpoints marked
+# idempotent. An idempotency key does not make a call retry-eligible, since the service may not honor it. A circuit breaker shared by the execution environment fails fast while the service keeps failing.
+class Transport:
+
+    # Connection pools, circuit breakers and latency histograms keyed by service, shared by every Transport object in the execution environment
+    pool_managers = {}
+    circuit_breakers = {}
+    latency_stats = {}
+    transport_lock = threading.Lock()
+
+    # Deadline (time.monotonic) of the current Lambda request. A Lambda environment serves one request at a time, so it is shared by the threads the request starts.
+    request_deadline = None
+
+    # Transport Constructor
+    # logger: Logger object
+    # service_name: Name of the service, e.g. ARCHERA. Prefix of the environment variables overriding the defaults above.
+    # endpoints: dict mapping endpoint names to dicts overriding `connect_timeout`, `read_timeout` and `max_attempts`, and marking `idempotent` endpoints
+    #
+    # Returns: Transport object
+    # Raises: None
+    def __init__(self, logger: logging.Logger, service_name: str, endpoints: dict = None):
+
+        self.logger = logger
+        self.service_name = service_name.upper()
+        self.endpoints = endpoints or {}
+        self.failure_threshold = int(environ.get(self.service_name + '_CIRCUIT_FAILURE_THRESHOLD', DEFAULT_CIRCUIT_FAILURE_THRESHOLD))
+        self.reset_seconds = float(environ.get(self.service_name + '_CIRCUIT_RESET_SECONDS', DEFAULT_CIRCUIT_RESET_SECONDS))
+
+        with Transport.transport_lock:
+            if self.service_name not in Transport.pool_managers:
+                # Retries and redirects are handled here, not by urllib3, so they respect the deadline and the idempotency rules
+                Transport.pool_managers[self.service_name] = urllib3.PoolManager(
+                    num_pools=2,
+                    maxsize=int(environ.get(self.service_name + '_HTTP_MAX_POOL_SIZE', DEFAULT_HTTP_MAX_POOL_SIZE)),
+                    block=False,
+                    retries=False
+                )
+            Transport.circuit_breakers.setdefault(self.service_name, {
+                'state': 'closed',
+                'consecutive_failures': 0,
+                'opened_at': 0.0,
+                'opened': 0,
+                'rejected': 0
+            })
+            Transport.latency_stats.setdefault(self.service_name, {})
+
+        self.http = Transport.pool_managers[self.service_name]
+
+    # set_deadline: Sets the deadline (time.monotonic) of the current request. None removes the bound.
+    @staticmethod
+    def set_deadline(deadline: float = None) -> None:
+        Transport.request_deadline = deadline
+
+    # get_transport_stats: Returns dict with the circuit breaker state and the per-endpoint latency histograms of the service
+    def get_transport_stats(self) -> dict:
+
+        with Transport.transport_lock:
+            return {
+                'circuit_breaker': dict(Transport.circuit_breakers[self.service_name]),
+                'latency': {x: dict(y, buckets=dict(y['buckets'])) for x, y in Transport.latency_stats[self.service_name].items()}
+            }
+
+    # __get_setting: Returns float with an endpoint setting, from the environment, the endpoint definition or the defaults in that order
+    def __get_setting(self, endpoint: str, setting: str) -> float:
+
+        for env_key in [self.service_name + '_' + endpoint.upper() + '_' + setting, self.service_name + '_' + setting]:
+            if environ.get(env_key):
+                return float(environ.get(env_key))
+
+        return float(self.endpoints.get(endpoint, {}).get(setting.lower(), DEFAULT_TRANSPORT_SETTINGS[setting]))
+
+    # __get_remaining_seconds: Returns float with the seconds left until the request deadline, or None without a deadline
+    def __get_remaining_seconds(self) -> float:
+        return None if Transport.request_deadline is None else Transport.request_deadline - time.monotonic()
+
+    # __before_call: Raises CircuitOpenError while the circuit is open. Once the reset time has passed, lets a single trial call through.
+    def __before_call(self, endpoint: str) -> None:
+
+        with Transport.transport_lock:
+
+            circuit_breaker = Transport.circuit_breakers[self.service_name]
+
+            if circuit_breaker['state'] == 'closed':
+                return
+
+            reopen_in = circuit_breaker['opened_at'] + self.reset_seconds - time.monotonic()
+            if circuit_breaker['state'] == 'open' and reopen_in <= 0:
+                circuit_breaker['state'] = 'half_open'
+                self.logger.info('%s circuit half-open, trying %s', self.service_name, endpoint)
+                return
+
+            circuit_breaker['rejected'] += 1
+
+        raise CircuitOpenError(self.service_name + ' is unavailable, failing fast for ' + str(round(max(reopen_in, 0), 1)) + 's after ' + str(self.failure_threshold) + ' consecutive failures')
+
+    # __after_call: Records the outcome of a call in the circuit breaker and the latency histogram of the endpoint
+    def __after_call(self, endpoint: str, latency_ms: float, is_failure: bool) -> None:
+
+        with Transport.transport_lock:
+
+            latency_stats = Transport.latency_stats[self.service_name].setdefault(endpoint, {
+                'count': 0,
+                'failures': 0,
+                'sum_ms': 0.0,
+                'max_ms': 0.0,
+                'buckets': {str(x): 0 for x in LATENCY_BUCKETS_MS + ['+Inf']}
+            })
+            latency_stats['count'] += 1
+            latency_stats['failures'] += 1 if is_failure else 0
+            latency_stats['sum_ms'] = round(latency_stats['sum_ms'] + latency_ms, 1)
+            latency_stats['max_ms'] = max(latency_stats['max_ms'], round(latency_ms, 1))
+            latency_stats['buckets'][str(next((x for x in LATENCY_BUCKETS_MS if latency_ms <= x), '+Inf'))] += 1
+
+            circuit_breaker = Transport.circuit_breakers[self.service_name]
+
+            if not is_failure:
+                if circuit_breaker['state'] != 'closed':
+                    self.logger.info('%s circuit closed after a successful %s call', self.service_name, endpoint)
+                circuit_breaker.update({'state': 'closed', 'consecutive_failures': 0})
+                return
+
+            circuit_breaker['consecutive_failures'] += 1
+            if circuit_breaker['state'] == 'half_open' or (circuit_breaker['state'] == 'closed' and circuit_breaker['consecutive_failures'] >= self.failure_threshold):
+                circuit_breaker.update({'state': 'open', 'opened_at': time.monotonic()})
+                circuit_breaker['opened'] += 1
+                self.logger.error('%s circuit opened after %s consecutive failures, last on %s', self.service_name, circuit_breaker['consecutive_failures'], endpoint)
+
+    # __get_backoff: Returns float with the seconds to wait before the next attempt, from the Retry-After header when the response has one
+    def __get_backoff(self, attempt: int, response=None) -> float:
+
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+
+        if retry_after:
+            try:
+                return max(float(retry_after), 0.0)
+            except ValueError:
+                try:
+                    return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+                except (TypeError, ValueError):
+                    pass
+
+        return random.uniform(0, min(TRANSPORT_MAX_BACKOFF, TRANSPORT_BASE_BACKOFF * (2 ** attempt)))
+
+    # __can_retry: Returns bool, True when another attempt is left and it can still finish before the deadline after waiting `backoff` seconds
+    def __can_retry(self, endpoint: str, attempt: int, max_attempts: int, backoff: float) -> bool:
+
+        remaining_seconds = self.__get_remaining_seconds()
+
+        if attempt + 1 >= max_attempts:
+            return False
+
+        if remaining_seconds is not None and remaining_seconds - backoff < self.__get_setting(endpoint, 'CONNECT_TIMEOUT'):
+            self.logger.warning('Not retrying %s %s, %.1fs left before the deadline', self.service_name, endpoint, remaining_seconds)
+            return False
+
+        return True
+
+    # request: Sends an HTTP request to an endpoint of the service. Returns the urllib3 response of the last attempt, which may be a retryable status once the retries are spent.
+    # endpoint: Name of the endpoint, selecting its timeouts and retry policy
+    # idempotency_key: Optional key sent as the `Idempotency-Key` header, so the service can recognize a replayed call. It does not change the retry policy.
+    # Raises: CircuitOpenError while the circuit is open, TransportError when the call failed without a response
+    def request(self, method: str, url: str, endpoint: str, headers: dict = None, body = None, preload_content: bool = True, idempotency_key: str = None):
+
+        is_idempotent = method.upper() in ['GET', 'HEAD', 'OPTIONS'] or bool(self.endpoints.get(endpoint, {}).get('idempotent'))
+        max_attempts = int(self.__get_setting(endpoint, 'MAX_ATTEMPTS'))
+
+        if idempotency_key:
+            headers = dict(headers or {}, **{'Idempotency-Key': idempotency_key})
+
+        attempt = 0
+        while True:
+
+            self.__before_call(endpoint=endpoint)
+
+            # Timeouts are cut to the time left before the deadline, so a hung call cannot use up the whole Lambda budget
+            connect_timeout = self.__get_setting(endpoint, 'CONNECT_TIMEOUT')
+            read_timeout = self.__get_setting(endpoint, 'READ_TIMEOUT')
+            remaining_seconds = self.__get_remaining_seconds()
+            if remaining_seconds is not None:
+                connect_timeout = max(min(connect_timeout, remaining_seconds), 0.1)
+                read_timeout = max(min(read_timeout, remaining_seconds), 0.1)
+
+            started_at = time.perf_counter()
+            try:
+                response = self.http.request(
+                    method, url,
+                    headers=headers,
+                    body=body,
+                    timeout=urllib3.Timeout(connect=connect_timeout, read=read_timeout),
+                    preload_content=preload_content,
+                    redirect=False
+                )
+            except HTTPError as e:
+                latency_ms = (time.perf_counter() - started_at) * 1000
+                self.__after_call(endpoint=endpoint, latency_ms=latency_ms, is_failure=True)
+
+                # A failed connection never reached the service, so even non-idempotent calls are safe to retry
+                is_retry_safe = is_idempotent or isinstance(e, (NewConnectionError, ConnectTimeoutError))
+                backoff = self.__get_backoff(attempt=attempt)
+
+                self.logger.warning('%s %s attempt %s failed after %.0fms - %s', self.service_name, endpoint, attempt + 1, latency_ms, e)
+                if not is_retry_safe or not self.__can_retry(endpoint=endpoint, attempt=attempt, max_attempts=max_attempts, backoff=backoff):
+                    raise TransportError(self.service_name + ' ' + endpoint + ' call failed after ' + str(attempt + 1) + ' attempt(s) - ' + type(e).__name__ + ': ' + str(e))
+
+                time.sleep(backoff)
+                attempt += 1
+                continue
+
+            latency_ms = (time.perf_counter() - started_at) * 1000
+            is_failure = response.status >= 500 or response.status == 429
+            self.__after_call(endpoint=endpoint, latency_ms=latency_ms, is_failure=is_failure)
+            self.logger.debug('%s %s returned HTTP %s in %.0fms', self.service_name, endpoint, response.status, latency_ms)
+
+            if response.status not in RETRY_STATUS_CODES or not is_idempotent:
+                return response
+
+            backoff = self.__get_backoff(attempt=attempt, response=response)
+            if not self.__can_retry(endpoint=endpoint, attempt=attempt, max_attempts=max_attempts, backoff=backoff):
+                return response
+
+            self.logger.warning('%s %s returned HTTP %s, retrying in %.1fs', self.service_name, endpoint, response.status, backoff)
+
+            # Release the connection of the discarded response before retrying
+            if not preload_content:
+                response.drain_conn()
+                response.release_conn()
+
+            time.sleep(backoff)
+            attempt += 1
@@ -0,0 +1,48 @@
+import json
+import logging
+
+import pytest
+
+from tests.conftest import add_lambda_path
+from tests.aws_fakes import FakeSSMClient
+
+LAMBDA_PATH = add_lambda_path('http-api-lambda-archera-api-onboarding')
+
+# FakeResponse: Stand-in for the urllib3 response returned by `Transport.request`
+class FakeResponse:
+
+    def __init__(self, status: int, body: dict):
+        self.status = status
+        self.data = json.dumps(body).encode('utf-8')
+
+# FakeTransport: Stand-in for `transport.transport.Transport`. Answers every endpoint from the queue in `responses` and records (endpoint, idempotency_key) in `calls`.
+class FakeTransport:
+
+    def __init__(self):
+        self.responses = {}
+        self.calls = []
+
+    def request(self, method: str, url: str, endpoint: str, headers: dict = None, body = None, preload_content: bool = True, idempotency_key: str = None):
+
+        self.calls.append((endpoint, idempotency_key))
+        response = self.responses[endpoint].pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return FakeResponse(*response)
+
+# archera: Returns an Archera object with the partner parameters served by a fake SSM client and its transport replaced by a FakeTransport
+@pytest.fixture
+def archera(aws_clients, monkeypatch):
+
+    from archera.archera import Archera
+
+    monkeypatch.setenv('SSM_KEY_ARCHERA_PARTNER_ORG_ID', '/archera/partner-org-id')
+    monkeypatch.setenv('SSM_KEY_ARCHERA_PARTNER_API_KEY', '/archera/partner-api-key')
+    aws_clients[('ssm', 'us-east-1')] = FakeSSMClient(parameters={
+        '/archera/partner-org-id': ('partner-1', 1),
+        '/archera/partner-api-key': ('api-key', 1)
+    })
+
+    archera = Archera(logger=logging.getLogger('test_archera'), base_url='https://archera.example.com', region_name='us-east-1')
+    archera.transport = FakeTransport()
+    return archera
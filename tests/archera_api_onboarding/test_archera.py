@@ -0,0 +1,70 @@
+import copy
+
+import pytest
+
+from transport.transport import TransportError
+from job_store.job_store import JOB_STATE_ACCEPTED, JOB_STATE_CHILD_ACCOUNT_REGISTERED, JOB_STATE_SUCCEEDED
+
+def get_job(job_id: str = 'job-1') -> dict:
+    return {'JobId': job_id, 'State': JOB_STATE_ACCEPTED, 'Request': {'CustomerAccountName': 'Customer'}, 'Checkpoints': {}}
+
+@pytest.fixture
+def saved_jobs(archera, monkeypatch):
+
+    monkeypatch.setattr(archera, '_Archera__store_cloudformation_template', lambda httpHeaders, child_account_id: 'https://templates.example.com/' + child_account_id)
+    return []
+
+def test_job_resumes_after_its_last_checkpoint(archera, saved_jobs):
+
+    archera.transport.responses = {
+        'register_child': [(200, {'org_id': 'child-1'})],
+        'onboarding_start': [TransportError('read timeout'), (200, {'onboarding_id': 'onboarding-1'})]
+    }
+    job = get_job()
+
+    with pytest.raises(TransportError):
+        archera.run_create_job(job=job, save_job=lambda job: saved_jobs.append(copy.deepcopy(job)))
+
+    assert job['State'] == JOB_STATE_CHILD_ACCOUNT_REGISTERED
+    assert saved_jobs[-1]['Checkpoints'] == {'ArcheraChildAccountId': 'child-1'}
+
+    archera.run_create_job(job=saved_jobs[-1], save_job=lambda job: saved_jobs.append(copy.deepcopy(job)))
+
+    assert saved_jobs[-1]['State'] == JOB_STATE_SUCCEEDED
+    assert saved_jobs[-1]['Checkpoints'] == {
+        'ArcheraChildAccountId': 'child-1',
+        'ArcheraOnboardingId': 'onboarding-1',
+        'ArcheraCloudFormationTemplateUrl': 'https://templates.example.com/child-1'
+    }
+    assert [x[0] for x in archera.transport.calls] == ['register_child', 'onboarding_start', 'onboarding_start']
+
+def test_replayed_steps_reuse_their_idempotency_key(archera, saved_jobs):
+
+    archera.transport.responses = {
+        'register_child': [TransportError('read timeout'), (200, {'org_id': 'child-1'})],
+        'onboarding_start': [(200, {'onboarding_id': 'onboarding-1'})]
+    }
+    job = get_job()
+
+    with pytest.raises(TransportError):
+        archera.run_create_job(job=job, save_job=saved_jobs.append)
+    archera.run_create_job(job=job, save_job=saved_jobs.append)
+
+    assert archera.transport.calls == [
+        ('register_child', 'job-1:register_child'),
+        ('register_child', 'job-1:register_child'),
+        ('onboarding_start', 'job-1:onboarding_start')
+    ]
+
+def test_jobs_have_their_own_idempotency_keys(archera, saved_jobs):
+
+    archera.transport.responses = {
+        'register_child': [(200, {'org_id': 'child-1'}), (200, {'org_id': 'child-2'})],
+        'onboarding_start': [(200, {'onboarding_id': 'onboarding-1'}), (200, {'onboarding_id': 'onboarding-2'})]
+    }
+
+    archera.create_account(customer_account_name='Customer')
+    archera.create_account(customer_account_name='Customer')
+
+    register_child_keys = [x[1] for x in archera.transport.calls if x[0] == 'register_child']
+    assert len(set(register_child_keys)) == 2 and all(register_child_keys)
@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+import handler
+
+# FakeContext: Stand-in for the Lambda context, with `remaining_ms` left before the Lambda deadline
+class FakeContext:
+
+    def __init__(self, remaining_ms: int):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self) -> int:
+        return self.remaining_ms
+
+@pytest.fixture
+def concurrency(monkeypatch) -> int:
+    monkeypatch.setenv('ARCHERA_BULK_CONCURRENCY', '2')
+    return 2
+
+def test_results_keep_the_item_order_and_failures(concurrency):
+
+    def function(item):
+        if item == 'fail':
+            raise Exception('onboarding failed')
+        time.sleep(0.01 * (5 - len(item)))
+        return item.upper()
+
+    results = handler.run_bulk(function=function, items=['a', 'fail', 'bbb', 'cc'])
+
+    assert [x[0] for x in results] == [True, True, True, True]
+    assert [x[1] for x in results if not isinstance(x[1], Exception)] == ['A', 'BBB', 'CC']
+    assert str(results[1][1]) == 'onboarding failed'
+
+def test_concurrency_is_bounded(concurrency):
+
+    running = []
+    max_running = []
+    lock = threading.Lock()
+
+    def function(item):
+        with lock:
+            running.append(item)
+            max_running.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(item)
+
+    handler.run_bulk(function=function, items=list(range(8)))
+
+    assert max(max_running) == concurrency
+
+def test_items_not_started_before_the_deadline_are_cancelled(concurrency):
+
+    started = []
+    release = threading.Event()
+
+    def function(item):
+        started.append(item)
+        release.wait(5)
+        return item
+
+    try:
+        results = handler.run_bulk(function=function, items=list(range(6)), context=FakeContext(remaining_ms=handler.ARCHERA_DEADLINE_MARGIN_MS + 200))
+    finally:
+        release.set()
+
+    time.sleep(0.1)
+
+    assert results == [(False, None)] * 6
+    assert sorted(started) == [0, 1]
@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import io
+import json
+import logging
+import time
+import tracemalloc
+
+import pytest
+
+from tests.aws_fakes import FakeS3Client
+from s3.s3 import JSONStream, GzipStream, JSON_STREAM_BUFFER_SIZE, s3CopyFiles
+
+DOCUMENTS = [
+    {},
+    [],
+    'template',
+    42,
+    None,
+    {'AWSTemplateFormatVersion': '2010-09-09', 'Resources': {}, 'Outputs': []},
+    {'Description': 'Ünïcødé – template ✓', 'Parameters': {'Name': {'Type': 'String', 'Default': 'a"b\\c'}}},
+    {'Resources': {'Role': {'Type': 'AWS::IAM::Role', 'Properties': {'Policies': [{'PolicyName': 'p', 'Statement': [1, 2.5, True, None]}]}}}},
+    {1: 'integer key', 'nested': {2: 'integer key below the split depth'}},
+    [[[], {}], [{'a': [1, [2, [3]]]}], ({'tuple': (1, 2)},)]
+]
+
+# get_template: Returns dict with a CloudFormation-like template of `resource_count` resources of about 1 KB each
+def get_template(resource_count: int) -> dict:
+    return {
+        'AWSTemplateFormatVersion': '2010-09-09',
+        'Resources': {
+            'Role' + str(x): {
+                'Type': 'AWS::IAM::Role',
+                'Properties': {'RoleName': 'archera-role-' + str(x), 'Description': 'Archera onboarding role ' * 30, 'Tags': [{'Key': 'Index', 'Value': str(x)}]}
+            } for x in range(resource_count)
+        }
+    }
+
+@pytest.mark.parametrize('document', DOCUMENTS)
+@pytest.mark.parametrize('read_size', [1, 7, JSON_STREAM_BUFFER_SIZE])
+def test_json_stream_matches_json_dumps(document, read_size):
+
+    json_stream = JSONStream(document=document)
+
+    assert b''.join(iter(lambda: json_stream.read(read_size), b'')) == json.dumps(document).encode('utf-8')
+
+def test_json_stream_peak_memory_is_bounded_by_the_buffer():
+
+    document = get_template(resource_count=10000)
+    document_size = len(json.dumps(document))
+
+    tracemalloc.start()
+    try:
+        json_stream = io.BufferedReader(JSONStream(document=document), buffer_size=JSON_STREAM_BUFFER_SIZE)
+        streamed_size = sum(len(x) for x in iter(lambda: json_stream.read(JSON_STREAM_BUFFER_SIZE), b''))
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert streamed_size == document_size
+    assert peak_memory < 8 * JSON_STREAM_BUFFER_SIZE < document_size / 10
+
+@pytest.fixture
+def s3_copy(aws_clients, monkeypatch) -> s3CopyFiles:
+
+    monkeypatch.setattr(s3CopyFiles, 'content_addressed_cache', {})
+    aws_clients[('s3', 'us-east-1')] = FakeS3Client()
+    return s3CopyFiles(logger=logging.getLogger('test_s3'), region_name='us-east-1')
+
+def test_s3_upload_json_uploads_the_serialized_document(s3_copy):
+
+    document = get_template(resource_count=100)
+
+    presigned_url = s3_copy.s3_upload_json(dst_bucket='templates', dst_key_prefix='archera/', dst_key='child-1', document=document)
+
+    assert presigned_url.startswith('https://templates.s3.amazonaws.com/archera/child-1?')
+    assert s3_copy.s3_client.objects['archera/child-1'][0] == json.dumps(document).encode('utf-8')
+    assert s3_copy.s3_client.upload_args == {'ContentType': 'application/json'}
+
+def test_json_digest_matches_the_uploaded_bytes(s3_copy):
+
+    document = get_template(resource_count=10)
+
+    assert s3_copy.get_json_digest(document=document) == hashlib.sha256(json.dumps(document).encode('utf-8')).hexdigest()
+
+# get_gzip_stream: Returns a buffered GzipStream over the JSONStream of the document, the way `s3_upload_json` builds it
+def get_gzip_stream(document) -> io.BufferedReader:
+    return io.BufferedReader(GzipStream(source=io.BufferedReader(JSONStream(document=document), buffer_size=JSON_STREAM_BUFFER_SIZE)), buffer_size=JSON_STREAM_BUFFER_SIZE)
+
+@pytest.mark.parametrize('document', DOCUMENTS + [get_template(resource_count=1000)])
+def test_gzip_stream_decompresses_to_json_dumps(document):
+
+    gzip_stream = get_gzip_stream(document=document)
+
+    assert gzip.decompress(gzip_stream.read()) == json.dumps(document).encode('utf-8')
+
+def test_gzip_stream_is_deterministic():
+
+    document = get_template(resource_count=100)
+
+    assert get_gzip_stream(document=document).read() == get_gzip_stream(document=document).read()
+
+def test_s3_upload_json_compressed(s3_copy):
+
+    document = get_template(resource_count=100)
+
+    s3_copy.s3_upload_json(dst_bucket='templates', dst_key_prefix='archera/', dst_key='child-1', document=document, compress=True)
+
+    assert s3_copy.s3_client.upload_args == {'ContentType': 'application/json', 'ContentEncoding': 'gzip'}
+    assert gzip.decompress(s3_copy.s3_client.objects['archera/child-1'][0]) == json.dumps(document).encode('utf-8')
+
+def test_content_addressed_encodings_are_stored_apart(s3_copy):
+
+    document = get_template(resource_count=10)
+    json_digest = hashlib.sha256(json.dumps(document).encode('utf-8')).hexdigest()
+
+    s3_copy.s3_upload_json_content_addressed(dst_bucket='templates', dst_key_prefix='archera/', dst_key='child-1', document=document)
+    s3_copy.s3_upload_json_content_addressed(dst_bucket='templates', dst_key_prefix='archera/', dst_key='child-2', document=document, compress=True)
+
+    assert set(s3_copy.s3_client.objects) == {
+        'archera/templates/sha256-' + json_digest + '.json',
+        'archera/templates/gzip/sha256-' + json_digest + '.json',
+        'archera/accounts/child-1.json',
+        'archera/accounts/child-2.json'
+    }
+
+# Benchmark: Streaming the gzip-compressed template costs about as much as serializing and compressing it in memory, while holding only a few buffers.
+@pytest.mark.parametrize('resource_count', [10, 1000])
+def test_gzip_stream_benchmark(resource_count):
+
+    document = get_template(resource_count=resource_count)
+
+    started_at = time.perf_counter()
+    in_memory_size = len(gzip.compress(json.dumps(document).encode('utf-8'), compresslevel=6, mtime=0))
+    in_memory_seconds = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    gzip_stream = get_gzip_stream(document=document)
+    streamed_size = sum(len(x) for x in iter(lambda: gzip_stream.read(JSON_STREAM_BUFFER_SIZE), b''))
+    streamed_seconds = time.perf_counter() - started_at
+
+    print('\n%s resources: in memory %.1f ms, %s bytes / streamed %.1f ms, %s bytes' % (resource_count, in_memory_seconds * 1000, in_memory_size, streamed_seconds * 1000, streamed_size))
+
+    assert streamed_size == in_memory_size
+    assert streamed_seconds < 5 * in_memory_seconds + 0.05
+
+def test_content_addressed_pointer_is_always_written(s3_copy):
+
+    document = get_template(resource_count=10)
+    json_digest = hashlib.sha256(json.dumps(document).encode('utf-8')).hexdigest()
+
+    s3_copy.s3_upload_json_content_addressed(dst_bucket='templates', dst_key_prefix='archera/', dst_key='child-1', document=document)
+    # Another execution environment points the account at a different template
+    s3_copy.s3_client.set_object(Key='archera/accounts/child-1.json', Body=json.dumps({'Key': 'archera/templates/sha256-other.json'}).encode('utf-8'))
+    s3_copy.s3_client.calls.clear()
+
+    s3_copy.s3_upload_json_content_addressed(dst_bucket='templates', dst_key_prefix='archera/', dst_key='child-1', document=document)
+
+    assert s3_copy.s3_client.calls == [('PutObject', 'archera/accounts/child-1.json')]
+    assert json.loads(s3_copy.s3_client.objects['archera/accounts/child-1.json'][0])['Digest'] == json_digest
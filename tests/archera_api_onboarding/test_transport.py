@@ -0,0 +1,83 @@
+import logging
+
+import pytest
+from urllib3.exceptions import NewConnectionError, ReadTimeoutError
+
+import transport.transport as transport_module
+from transport.transport import Transport, TransportError
+from archera.archera import ARCHERA_ENDPOINTS
+
+# FakeResponse: Stand-in for a urllib3 response with an HTTP status
+class FakeResponse:
+
+    def __init__(self, status: int):
+        self.status = status
+        self.headers = {}
+
+# FakeHTTP: Stand-in for the urllib3 PoolManager. Answers from the queue in `responses`, raising queued exceptions, and records the headers of every call in `calls`.
+class FakeHTTP:
+
+    def __init__(self, responses: list):
+        self.responses = list(responses)
+        self.calls = []
+
+    def request(self, method: str, url: str, headers: dict = None, **kwargs):
+
+        self.calls.append(headers)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return FakeResponse(response)
+
+# get_transport: Returns a Transport for the Archera endpoints with fresh circuit breakers, no backoff and its pool manager replaced by a FakeHTTP answering `responses`
+@pytest.fixture
+def get_transport(monkeypatch):
+
+    monkeypatch.setattr(Transport, 'pool_managers', {})
+    monkeypatch.setattr(Transport, 'circuit_breakers', {})
+    monkeypatch.setattr(Transport, 'latency_stats', {})
+    monkeypatch.setattr(Transport, 'request_deadline', None)
+    monkeypatch.setattr(transport_module, 'TRANSPORT_BASE_BACKOFF', 0)
+
+    def get_transport(responses: list) -> Transport:
+        transport = Transport(logger=logging.getLogger('test_transport'), service_name='ARCHERA', endpoints=dict(ARCHERA_ENDPOINTS, verify={'idempotent': True}))
+        transport.http = FakeHTTP(responses=responses)
+        return transport
+
+    return get_transport
+
+def test_idempotency_key_does_not_retry_a_read_timeout(get_transport):
+
+    transport = get_transport(responses=[ReadTimeoutError(None, '/child', 'Read timed out.'), 200])
+
+    with pytest.raises(TransportError):
+        transport.request('POST', 'https://archera.example.com/child', endpoint='register_child', idempotency_key='job-1:register_child')
+
+    assert transport.http.calls == [{'Idempotency-Key': 'job-1:register_child'}]
+
+def test_idempotency_key_does_not_retry_a_server_error(get_transport):
+
+    transport = get_transport(responses=[503, 200])
+
+    response = transport.request('POST', 'https://archera.example.com/onboarding', endpoint='onboarding_start', idempotency_key='job-1:onboarding_start')
+
+    assert response.status == 503
+    assert len(transport.http.calls) == 1
+
+def test_connection_failure_is_retried_with_the_same_idempotency_key(get_transport):
+
+    transport = get_transport(responses=[NewConnectionError(None, 'Connection refused'), 201])
+
+    response = transport.request('POST', 'https://archera.example.com/child', endpoint='register_child', idempotency_key='job-1:register_child')
+
+    assert response.status == 201
+    assert transport.http.calls == [{'Idempotency-Key': 'job-1:register_child'}] * 2
+
+def test_idempotent_endpoint_retries_a_server_error(get_transport):
+
+    transport = get_transport(responses=[503, 200])
+
+    response = transport.request('POST', 'https://archera.example.com/verify', endpoint='verify')
+
+    assert response.status == 200
+    assert len(transport.http.calls) == 2
@@ -0,0 +1,111 @@
+import io
+from botocore.exceptions import ClientError
+
+# get_client_error: Returns a botocore ClientError with the error code, the way boto3 clients raise them
+def get_client_error(code: str, operation_name: str) -> ClientError:
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation_name)
+
+# FakeSSMClient: In-memory stand-in for the boto3 SSM client. Parameters map names to (value, version) tuples, and `calls` records the API calls made.
+class FakeSSMClient:
+
+    def __init__(self, parameters: dict = None):
+        self.parameters = parameters or {}
+        self.calls = []
+        self.error_code = None
+
+    def get_parameter(self, Name: str, WithDecryption: bool = False) -> dict:
+
+        self.calls.append(('GetParameter', Name))
+
+        if self.error_code:
+            raise get_client_error(self.error_code, 'GetParameter')
+        if Name not in self.parameters:
+            raise get_client_error('ParameterNotFound', 'GetParameter')
+        if self.parameters[Name] is None:
+            return {'Parameter': {'Name': Name}}
+
+        return {'Parameter': {'Name': Name, 'Value': self.parameters[Name][0], 'Version': self.parameters[Name][1]}}
+
+    def get_parameters(self, Names: list, WithDecryption: bool = False) -> dict:
+
+        self.calls.append(('GetParameters', tuple(Names)))
+
+        return {
+            'Parameters': [{'Name': x, 'Value': self.parameters[x][0], 'Version': self.parameters[x][1]} for x in Names if self.parameters.get(x)],
+            'InvalidParameters': [x for x in Names if x not in self.parameters]
+        }
+
+# FakeSecretsManagerClient: In-memory stand-in for the boto3 Secrets Manager client. Raises `error_code` as a ClientError when it is set.
+class FakeSecretsManagerClient:
+
+    def __init__(self, secrets: dict = None):
+        self.secrets = secrets or {}
+        self.calls = []
+        self.error_code = None
+
+    def get_secret_value(self, SecretId: str) -> dict:
+
+        self.calls.append(('GetSecretValue', SecretId))
+
+        if self.error_code:
+            raise get_client_error(self.error_code, 'GetSecretValue')
+
+        return {'ARN': SecretId, 'SecretString': self.secrets[SecretId]}
+
+# FakeS3Client: In-memory stand-in for the boto3 S3 client, with ETags and the IfMatch / IfNoneMatch conditions of GetObject and PutObject.
+# Objects map keys to (body, etag) tuples, and `calls` records the API calls made.
+class FakeS3Client:
+
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+        self.version = 0
+        self.upload_args = None
+
+    # set_object: Stores an object the way another writer would. Returns str with its new ETag.
+    def set_object(self, Key: str, Body: bytes) -> str:
+
+        self.version += 1
+        self.objects[Key] = (Body, '"etag-' + str(self.version) + '"')
+        return self.objects[Key][1]
+
+    def get_object(self, Bucket: str, Key: str, IfNoneMatch: str = None) -> dict:
+
+        self.calls.append(('GetObject', Key))
+
+        if Key not in self.objects:
+            raise get_client_error('NoSuchKey', 'GetObject')
+        if IfNoneMatch == self.objects[Key][1]:
+            raise get_client_error('304', 'GetObject')
+
+        return {'Body': io.BytesIO(self.objects[Key][0]), 'ETag': self.objects[Key][1]}
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, ContentType: str = None, IfMatch: str = None, IfNoneMatch: str = None) -> dict:
+
+        self.calls.append(('PutObject', Key))
+
+        if IfNoneMatch == '*' and Key in self.objects:
+            raise get_client_error('PreconditionFailed', 'PutObject')
+        if IfMatch is not None and (Key not in self.objects or self.objects[Key][1] != IfMatch):
+            raise get_client_error('PreconditionFailed', 'PutObject')
+
+        return {'ETag': self.set_object(Key=Key, Body=Body)}
+
+    # upload_fileobj: Reads the file object the way the S3 transfer manager does, in parts, and stores its bytes with the ExtraArgs in `upload_args`
+    def upload_fileobj(self, Fileobj, Bucket: str, Key: str, ExtraArgs: dict = None) -> None:
+
+        self.calls.append(('UploadFileobj', Key))
+        self.upload_args = dict(ExtraArgs or {})
+        self.set_object(Key=Key, Body=b''.join(iter(lambda: Fileobj.read(8 * 1024 * 1024), b'')))
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+
+        self.calls.append(('HeadObject', Key))
+
+        if Key not in self.objects:
+            raise get_client_error('404', 'HeadObject')
+
+        return {'ETag': self.objects[Key][1]}
+
+    def generate_presigned_url(self, ClientMethod: str, Params: dict, ExpiresIn: int) -> str:
+        return 'https://' + Params['Bucket'] + '.s3.amazonaws.com/' + Params['Key'] + '?X-Amz-Expires=' + str(ExpiresIn)
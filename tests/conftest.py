@@ -0,0 +1,41 @@
+import json
+import subprocess
+import sys
+from os import environ, path
+
+import pytest
+
+# Root of the repository. Every Lambda directory is deployed as its own package, with its modules at the top level.
+REPOSITORY_PATH = path.dirname(path.dirname(path.abspath(__file__)))
+
+# add_lambda_path: Makes the modules of a Lambda directory importable the way the Lambda runtime imports them, e.g. `from utils.utils import Utils`
+def add_lambda_path(lambda_directory: str) -> str:
+
+    lambda_path = path.join(REPOSITORY_PATH, lambda_directory)
+    if lambda_path not in sys.path:
+        sys.path.insert(0, lambda_path)
+
+    return lambda_path
+
+# get_import_report: Imports a Lambda handler module in a fresh interpreter, the way a cold start does. Returns dict with the import time in milliseconds and the loaded module names.
+def get_import_report(lambda_directory: str, module_name: str) -> dict:
+
+    script = 'import json, sys, time\nstarted_at = time.perf_counter()\nimport ' + module_name + '\nprint(json.dumps({"import_ms": (time.perf_counter() - started_at) * 1000, "modules": sorted(sys.modules)}))'
+    env = dict({x: y for x, y in environ.items() if x != 'EAGER_INIT'}, PYTHONDONTWRITEBYTECODE='1')
+
+    result = subprocess.run([sys.executable, '-c', script], cwd=path.join(REPOSITORY_PATH, lambda_directory), env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+# aws_clients: Empties the Utils client registry and caches for the test. Returns dict with the client registry, keyed by (service_name, region_name), to put fake clients in.
+@pytest.fixture
+def aws_clients(monkeypatch):
+
+    from utils.utils import Utils
+
+    aws_client_registry = {}
+    monkeypatch.setattr(Utils, 'aws_client_registry', aws_client_registry)
+    monkeypatch.setattr(Utils, 'ssm_parameter_cache', {})
+    monkeypatch.setattr(Utils, 'ssm_parameter_cache_stats', {'hits': 0, 'misses': 0, 'refreshes': 0, 'invalidations': 0})
+    monkeypatch.setattr(Utils, 'aws_secret_cache', {})
+
+    return aws_client_registry
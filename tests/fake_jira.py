@@ -0,0 +1,164 @@
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# FakeJira - in-process stand-in for the Jira Cloud REST API v2 endpoints used by the JIRA handler, backed by an in-memory issue store.
+# `calls` records (method, path) for every request. `responses` queues (status, body, headers) tuples answered instead of the next requests, e.g. to throttle them.
+# `path_responses` maps (method, path) to such a queue for that request only.
+class FakeJira:
+
+    def __init__(self, project_key: str = 'OPS', project_id: str = '10000'):
+        self.project_key = project_key
+        self.project_id = project_id
+        self.issues = {}
+        self.calls = []
+        self.responses = []
+        self.path_responses = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.__get_handler())
+        self.url = 'http://127.0.0.1:' + str(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    # add_issue: Adds an issue to the store. Returns str with the issue key.
+    def add_issue(self, summary: str, labels: list = None, properties: dict = None) -> str:
+
+        with self.lock:
+            issue_id = str(10000 + len(self.issues) + 1)
+            issue_key = self.project_key + '-' + str(len(self.issues) + 1)
+            self.issues[issue_key] = {
+                'id': issue_id,
+                'key': issue_key,
+                'self': self.url + '/rest/api/2/issue/' + issue_id,
+                'fields': {'summary': summary, 'labels': list(labels or []), 'description': ''},
+                'properties': dict(properties or {})
+            }
+            return issue_key
+
+    # get_calls: Returns list with the (method, path) of the requests made, without the ones to `exclude_prefix`
+    def get_calls(self, exclude_prefix: str = None) -> list:
+        return [x for x in self.calls if not exclude_prefix or not x[1].startswith(exclude_prefix)]
+
+    # find_issues: Returns list with the stored issues matching the JQL clauses this handler sends
+    def find_issues(self, jql: str) -> list:
+
+        labels = re.findall(r'labels = "([^"]+)"', jql) + [x.strip().strip('"') for clause in re.findall(r'labels in \(([^)]*)\)', jql) for x in clause.split(',')]
+        keys = [x.strip() for clause in re.findall(r'key in \(([^)]*)\)', jql) for x in clause.split(',')]
+        # Jira's `~` operator is a fuzzy text search. Every word of the phrase has to appear in the summary, in any order and with other words around it.
+        phrases = [x.split() for x in re.findall(r'summary ~ "\\"(.*?)\\""', jql)]
+
+        return [
+            x for x in self.issues.values()
+            if set(labels) & set(x['fields']['labels'])
+            or x['key'] in keys
+            or any(all(word in x['fields']['summary'].split() for word in phrase) for phrase in phrases)
+        ]
+
+    # get_issue_json: Returns dict with the issue JSON, with only the requested entity properties
+    def get_issue_json(self, issue: dict, properties: list) -> dict:
+
+        issue_json = {x: y for x, y in issue.items() if x != 'properties'}
+        issue_json['properties'] = {x: y for x, y in issue['properties'].items() if x in properties}
+        return issue_json
+
+    # create_issue: Stores an issue from a create payload. Returns dict with the create response.
+    def create_issue(self, payload: dict) -> dict:
+
+        issue_key = self.add_issue(
+            summary=payload['fields']['summary'],
+            labels=payload['fields'].get('labels'),
+            properties={x['key']: x['value'] for x in payload.get('properties', [])}
+        )
+        issue = self.issues[issue_key]
+        return {'id': issue['id'], 'key': issue['key'], 'self': issue['self']}
+
+    def __get_handler(self):
+
+        fake_jira = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def __reply(self, status: int, body=None, headers: dict = None):
+                data = json.dumps(body).encode('utf-8') if body is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for header_name, header_value in (headers or {}).items():
+                    self.send_header(header_name, header_value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def __handle(self, method: str):
+
+                url = urlparse(self.path)
+                query = {x: y[0] for x, y in parse_qs(url.query).items()}
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'null')
+                path = url.path[len('/rest/api/2/'):]
+
+                with fake_jira.lock:
+                    fake_jira.calls.append((method, path))
+                    path_responses = fake_jira.path_responses.get((method, path))
+                    if path_responses:
+                        queued_response = path_responses.pop(0)
+                    else:
+                        queued_response = fake_jira.responses.pop(0) if fake_jira.responses else None
+
+                if queued_response:
+                    return self.__reply(*queued_response)
+
+                properties = query.get('properties', '').split(',')
+
+                if method == 'GET' and path.startswith('project/') and path.endswith('/statuses'):
+                    return self.__reply(200, [{'id': '1', 'name': 'Task'}, {'id': '2', 'name': 'Bug'}])
+
+                if method == 'GET' and path.startswith('project/'):
+                    if path.split('/')[1] != fake_jira.project_key:
+                        return self.__reply(404, {'errorMessages': ['No project could be found']})
+                    return self.__reply(200, {'id': fake_jira.project_id, 'key': fake_jira.project_key})
+
+                if method == 'GET' and path == 'search':
+                    # Jira rejects the whole search when a `key in` clause names an issue that does not exist
+                    missing_keys = [x.strip() for clause in re.findall(r'key in \(([^)]*)\)', query['jql']) for x in clause.split(',') if x.strip() not in fake_jira.issues]
+                    if missing_keys:
+                        return self.__reply(400, {'errorMessages': ["An issue with key '" + missing_keys[0] + "' does not exist for field 'key'."]})
+                    issues = fake_jira.find_issues(query['jql'])[:int(query.get('maxResults', 50))]
+                    return self.__reply(200, {'issues': [fake_jira.get_issue_json(x, properties) for x in issues]})
+
+                if method == 'GET' and path.startswith('issue/'):
+                    issue = fake_jira.issues.get(path.split('/')[1])
+                    if issue is None:
+                        return self.__reply(404, {'errorMessages': ['Issue does not exist']})
+                    return self.__reply(200, fake_jira.get_issue_json(issue, properties))
+
+                if method == 'POST' and path == 'issue':
+                    return self.__reply(201, fake_jira.create_issue(payload))
+
+                if method == 'POST' and path == 'issue/bulk':
+                    return self.__reply(201, {'issues': [fake_jira.create_issue(x) for x in payload['issueUpdates']], 'errors': []})
+
+                if method == 'PUT' and path.startswith('issue/'):
+                    issue = next(x for x in fake_jira.issues.values() if x['id'] == path.split('/')[1])
+                    issue['fields'].update(payload['fields'])
+                    issue['properties'].update({x['key']: x['value'] for x in payload.get('properties', [])})
+                    return self.__reply(204)
+
+                return self.__reply(404, {'errorMessages': ['Not found']})
+
+            def do_GET(self):
+                self.__handle('GET')
+
+            def do_POST(self):
+                self.__handle('POST')
+
+            def do_PUT(self):
+                self.__handle('PUT')
+
+        return Handler
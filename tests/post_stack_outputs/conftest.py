@@ -0,0 +1,55 @@
+import logging
+
+import pytest
+
+from tests.conftest import add_lambda_path
+from tests.fake_jira import FakeJira
+
+LAMBDA_PATH = add_lambda_path('http-api-lambda-post-stack-outputs')
+
+@pytest.fixture
+def fake_jira():
+    fake_jira = FakeJira(project_key='OPS')
+    yield fake_jira
+    fake_jira.close()
+
+# jira_state: Empties the class-level Jira client, metadata, issue index and rate governor state, and moves their /tmp snapshots into the test's directory
+@pytest.fixture
+def jira_state(monkeypatch, tmp_path):
+
+    import jira_handler.projects.projects as projects_module
+    import jira_handler.issue_index.issue_index as issue_index_module
+    import rate_governor.rate_governor as rate_governor_module
+    from jira_handler.jira_handler import JiraHandler
+
+    monkeypatch.setattr(JiraHandler, 'jira_clients', {})
+    monkeypatch.setattr(JiraHandler, 'jira_client_stats', {'created': 0, 'reused': 0, 'reconnects': 0})
+    monkeypatch.setattr(projects_module.Projects, 'metadata_cache', {})
+    monkeypatch.setattr(projects_module.Projects, 'metadata_cache_loaded', False)
+    monkeypatch.setattr(projects_module, 'JIRA_METADATA_CACHE_FILE', str(tmp_path / 'jira_project_metadata.json'))
+    monkeypatch.setattr(issue_index_module.IssueIndex, 'index', {})
+    monkeypatch.setattr(issue_index_module.IssueIndex, 'index_loaded', False)
+    monkeypatch.setattr(issue_index_module.IssueIndex, 'index_etag', None)
+    monkeypatch.setattr(issue_index_module.IssueIndex, 'pending_changes', {})
+    monkeypatch.setattr(issue_index_module, 'JIRA_ISSUE_INDEX_FILE', str(tmp_path / 'jira_issue_index.json'))
+    monkeypatch.setattr(rate_governor_module.RateGovernor, 'buckets', {})
+    monkeypatch.setattr(rate_governor_module.RateGovernor, 'throttle_stats', {})
+    monkeypatch.setattr(rate_governor_module, 'RATE_GOVERNOR_BASE_BACKOFF', 0.01)
+    monkeypatch.delenv('JIRA_ISSUE_INDEX_BUCKET', raising=False)
+
+# jira_handler: Returns a JiraHandler object for the fake Jira Cloud
+@pytest.fixture
+def jira_handler(fake_jira, jira_state):
+
+    from jira_handler.jira_handler import JiraHandler
+
+    return JiraHandler(logger=logging.getLogger('test_jira'), config={
+        'jira': {
+            'cloud_url': fake_jira.url,
+            'project_key': 'OPS',
+            'auth_email': 'bot@example.com',
+            'api_token': 'token-1',
+            'default_issue_labels': ['stack-outputs'],
+            'enabled': True
+        }
+    })
@@ -0,0 +1,11 @@
+from tests.conftest import get_import_report
+
+# Generous bound for the module import, which takes well under 100 ms locally. Catches an SDK or an AWS call slipping back into the init phase.
+IMPORT_TIME_BUDGET_MS = 1000
+
+def test_integrations_are_not_imported_at_init():
+
+    import_report = get_import_report('http-api-lambda-post-stack-outputs', 'postStackOutputLambda')
+
+    assert [x for x in ['jira', 'requests', 'boto3', 'botocore', 'urllib3', 'mergedeep'] if x in import_report['modules']] == []
+    assert import_report['import_ms'] < IMPORT_TIME_BUDGET_MS
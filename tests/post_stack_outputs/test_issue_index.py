@@ -0,0 +1,95 @@
+import json
+import logging
+
+import pytest
+
+from tests.aws_fakes import FakeS3Client
+from jira_handler.issue_index.issue_index import IssueIndex
+import jira_handler.issue_index.issue_index as issue_index_module
+
+INDEX_KEY = 'jira-issue-index.json'
+
+@pytest.fixture
+def s3_client(aws_clients, jira_state, monkeypatch):
+
+    monkeypatch.setenv('JIRA_ISSUE_INDEX_BUCKET', 'index-bucket')
+    s3_client = FakeS3Client()
+    aws_clients[('s3', 'us-east-1')] = s3_client
+    return s3_client
+
+def get_issue_index() -> IssueIndex:
+    return IssueIndex(logger=logging.getLogger('test_issue_index'), region_name='us-east-1')
+
+def get_s3_index(s3_client: FakeS3Client) -> dict:
+    return json.loads(s3_client.objects[INDEX_KEY][0])
+
+# new_execution_environment: Forgets the in-memory index, the way a cold start on the same host would, keeping the /tmp snapshot
+def new_execution_environment(monkeypatch) -> None:
+    monkeypatch.setattr(IssueIndex, 'index', {})
+    monkeypatch.setattr(IssueIndex, 'index_loaded', False)
+    monkeypatch.setattr(IssueIndex, 'index_etag', None)
+
+def test_puts_are_written_once_per_flush(s3_client):
+
+    issue_index = get_issue_index()
+    issue_index.put_issue_key(project_key='OPS', aws_account_id='111111111111', issue_key='OPS-1')
+    issue_index.put_issue_key(project_key='OPS', aws_account_id='222222222222', issue_key='OPS-2')
+
+    assert ('PutObject', INDEX_KEY) not in s3_client.calls
+
+    issue_index.flush()
+    issue_index.flush()
+
+    assert s3_client.calls.count(('PutObject', INDEX_KEY)) == 1
+    assert get_s3_index(s3_client) == {'OPS|111111111111': 'OPS-1', 'OPS|222222222222': 'OPS-2'}
+
+def test_concurrent_writers_keep_each_others_entries(s3_client):
+
+    issue_index = get_issue_index()
+    issue_index.put_issue_key(project_key='OPS', aws_account_id='111111111111', issue_key='OPS-1')
+    issue_index.flush()
+
+    # Another execution environment writes its own entry after this one read the index
+    s3_client.set_object(Key=INDEX_KEY, Body=json.dumps({'OPS|111111111111': 'OPS-1', 'OPS|333333333333': 'OPS-3'}).encode('utf-8'))
+
+    issue_index.put_issue_key(project_key='OPS', aws_account_id='222222222222', issue_key='OPS-2')
+    issue_index.remove_issue_key(project_key='OPS', aws_account_id='111111111111')
+    issue_index.flush()
+
+    assert get_s3_index(s3_client) == {'OPS|222222222222': 'OPS-2', 'OPS|333333333333': 'OPS-3'}
+    assert issue_index.get_issue_key(project_key='OPS', aws_account_id='333333333333') == 'OPS-3'
+
+def test_current_snapshot_is_revalidated_without_a_download(s3_client, monkeypatch):
+
+    issue_index = get_issue_index()
+    issue_index.put_issue_key(project_key='OPS', aws_account_id='111111111111', issue_key='OPS-1')
+    issue_index.flush()
+
+    new_execution_environment(monkeypatch)
+    s3_client.calls.clear()
+
+    assert get_issue_index().get_issue_key(project_key='OPS', aws_account_id='111111111111') == 'OPS-1'
+    assert IssueIndex.index_etag == s3_client.objects[INDEX_KEY][1]
+    assert s3_client.calls == [('GetObject', INDEX_KEY)]
+
+def test_stale_snapshot_is_replaced_by_s3(s3_client, monkeypatch):
+
+    issue_index = get_issue_index()
+    issue_index.put_issue_key(project_key='OPS', aws_account_id='111111111111', issue_key='OPS-1')
+    issue_index.flush()
+
+    s3_client.set_object(Key=INDEX_KEY, Body=json.dumps({'OPS|111111111111': 'OPS-9'}).encode('utf-8'))
+    new_execution_environment(monkeypatch)
+
+    assert get_issue_index().get_issue_key(project_key='OPS', aws_account_id='111111111111') == 'OPS-9'
+
+    with open(issue_index_module.JIRA_ISSUE_INDEX_FILE, 'r') as index_file:
+        assert json.loads(index_file.read())['index'] == {'OPS|111111111111': 'OPS-9'}
+
+def test_upsert_flushes_the_index_once(s3_client, aws_clients, jira_handler):
+
+    aws_clients[('s3', None)] = s3_client
+    jira_handler.jira_upsert_issues(items=[{'issue_summary': 'AWS Account - ' + x, 'issue_desc': '{}', 'aws_account_id': x} for x in ['111111111111', '222222222222']])
+
+    assert s3_client.calls.count(('PutObject', INDEX_KEY)) == 1
+    assert get_s3_index(s3_client) == {'OPS|111111111111': 'OPS-1', 'OPS|222222222222': 'OPS-2'}
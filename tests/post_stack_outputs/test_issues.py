@@ -0,0 +1,85 @@
+from jira_handler.issue_index.issue_index import IssueIndex
+
+def upsert_issue(jira_handler, aws_account_id: str, issue_desc: str = '{}'):
+    return jira_handler.jira_create_issue(issue_summary='AWS Account - ' + aws_account_id, issue_desc=issue_desc, aws_account_id=aws_account_id)
+
+def test_similar_summary_is_not_adopted(jira_handler, fake_jira):
+
+    fake_jira.add_issue(summary='Stack outputs for AWS Account - 111111111111 (old)')
+
+    issue = upsert_issue(jira_handler, '111111111111')
+
+    assert str(issue) == 'OPS-2'
+    assert fake_jira.issues['OPS-1']['fields']['labels'] == []
+
+def test_legacy_lookup_adopts_the_exact_summary_only(jira_handler, fake_jira, monkeypatch):
+
+    monkeypatch.setenv('JIRA_LEGACY_SUMMARY_LOOKUP', 'true')
+    fake_jira.add_issue(summary='Stack outputs for AWS Account - 111111111111 (old)')
+    legacy_key = fake_jira.add_issue(summary='AWS Account - 111111111111')
+
+    issue = upsert_issue(jira_handler, '111111111111')
+
+    assert str(issue) == legacy_key
+    assert fake_jira.issues[legacy_key]['fields']['labels'] == ['aws-account-111111111111']
+    assert len(fake_jira.issues) == 2
+
+def test_legacy_lookup_creates_on_a_similar_summary(jira_handler, fake_jira, monkeypatch):
+
+    monkeypatch.setenv('JIRA_LEGACY_SUMMARY_LOOKUP', 'true')
+    fake_jira.add_issue(summary='Stack outputs for AWS Account - 111111111111 (old)')
+
+    issue = upsert_issue(jira_handler, '111111111111')
+
+    assert str(issue) == 'OPS-2'
+
+def get_batch_items(aws_account_ids: list) -> list:
+    return [{'issue_summary': 'AWS Account - ' + x, 'issue_desc': '{}', 'aws_account_id': x} for x in aws_account_ids]
+
+def test_batch_does_not_match_summaries(jira_handler, fake_jira):
+
+    fake_jira.add_issue(summary='AWS Account - 111111111111')
+
+    results = jira_handler.jira_upsert_issues(items=get_batch_items(['111111111111']))
+
+    assert str(results['111111111111']) == 'OPS-2'
+
+def test_legacy_batch_matches_exact_summaries(jira_handler, fake_jira, monkeypatch):
+
+    monkeypatch.setenv('JIRA_LEGACY_SUMMARY_LOOKUP', 'true')
+    fake_jira.add_issue(summary='Stack outputs for AWS Account - 111111111111 (old)')
+    legacy_key = fake_jira.add_issue(summary='AWS Account - 222222222222')
+
+    results = jira_handler.jira_upsert_issues(items=get_batch_items(['111111111111', '222222222222']))
+
+    assert {x: str(y) for x, y in results.items()} == {'111111111111': 'OPS-3', '222222222222': legacy_key}
+    assert fake_jira.issues[legacy_key]['fields']['labels'] == ['aws-account-222222222222']
+
+def test_new_account_costs_a_label_search_and_a_create(jira_handler, fake_jira):
+
+    upsert_issue(jira_handler, '111111111111')
+
+    assert fake_jira.get_calls(exclude_prefix='project/') == [('GET', 'search'), ('POST', 'issue')]
+
+def test_indexed_account_costs_a_read_and_an_update(jira_handler, fake_jira):
+
+    issue_key = str(upsert_issue(jira_handler, '111111111111'))
+    fake_jira.calls.clear()
+
+    upsert_issue(jira_handler, '111111111111', issue_desc='{"changed": true}')
+    upsert_issue(jira_handler, '111111111111', issue_desc='{"changed": true}')
+
+    issue_id = fake_jira.issues[issue_key]['id']
+    assert fake_jira.get_calls(exclude_prefix='project/') == [('GET', 'issue/' + issue_key), ('PUT', 'issue/' + issue_id), ('GET', 'issue/' + issue_key)]
+
+def test_batch_with_a_deleted_indexed_issue_replaces_the_index_entry(jira_handler, fake_jira):
+
+    results = jira_handler.jira_upsert_issues(items=get_batch_items(['111111111111', '222222222222']))
+    deleted_key = str(results['111111111111'])
+    fake_jira.issues.pop(deleted_key)
+
+    results = jira_handler.jira_upsert_issues(items=get_batch_items(['111111111111', '222222222222']))
+
+    assert str(results['111111111111']) not in [deleted_key, 'None']
+    assert str(results['222222222222']) in fake_jira.issues
+    assert IssueIndex.index['OPS|111111111111'] == str(results['111111111111'])
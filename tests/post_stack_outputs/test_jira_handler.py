@@ -0,0 +1,69 @@
+import pytest
+from jira.exceptions import JIRAError
+
+from jira_handler.jira_client.jira_client import RateGovernedAdapter
+from rate_governor.rate_governor import RateGovernor
+
+def test_jira_client_is_reused_and_rate_governed(jira_handler, fake_jira):
+
+    jira_client = jira_handler.get_jira_client()
+
+    assert jira_handler.get_jira_client() is jira_client
+    assert isinstance(jira_client.session.get_adapter(fake_jira.url + '/rest/api/2/search'), RateGovernedAdapter)
+    assert jira_handler.get_jira_client_stats() == {'created': 1, 'reused': 1, 'reconnects': 0}
+
+def test_rotated_token_reconnects(jira_handler):
+
+    jira_client = jira_handler.get_jira_client()
+    jira_handler.config = {'jira': dict(jira_handler.config['jira'], api_token='token-2')}
+
+    assert jira_handler.get_jira_client() is not jira_client
+    assert jira_handler.get_jira_client_stats()['reconnects'] == 1
+
+def test_throttled_requests_are_retried_by_the_rate_governor(jira_handler, fake_jira):
+
+    fake_jira.responses.append((429, {'errorMessages': ['Rate limited']}, {'Retry-After': '0'}))
+
+    issue = jira_handler.jira_create_issue(issue_summary='AWS Account - 111111111111', issue_desc='{}', aws_account_id='111111111111', issue_content={})
+
+    assert str(issue) == 'OPS-1'
+    assert fake_jira.calls[:2] == [('GET', 'project/OPS'), ('GET', 'project/OPS')]
+    assert RateGovernor.throttle_stats['JIRA']['retries'] == 1
+
+def test_unauthorized_create_is_retried_on_a_new_session(jira_handler, fake_jira):
+
+    fake_jira.path_responses[('POST', 'issue')] = [(401, {'errorMessages': ['Unauthorized']})]
+
+    issue = jira_handler.jira_create_issue(issue_summary='AWS Account - 111111111111', issue_desc='{}', aws_account_id='111111111111', issue_content={})
+
+    assert str(issue) == 'OPS-1'
+    assert len(fake_jira.issues) == 1
+    assert jira_handler.get_jira_client_stats()['reconnects'] == 1
+
+def test_failed_create_is_not_retried(jira_handler, fake_jira):
+
+    fake_jira.path_responses[('POST', 'issue')] = [(500, {'errorMessages': ['Internal error']})]
+
+    with pytest.raises(JIRAError):
+        jira_handler.jira_create_issue(issue_summary='AWS Account - 111111111111', issue_desc='{}', aws_account_id='111111111111', issue_content={})
+
+    assert fake_jira.get_calls().count(('POST', 'issue')) == 1
+    assert jira_handler.get_jira_client_stats()['reconnects'] == 0
+
+def test_unauthorized_batch_retries_only_the_failed_items(jira_handler, fake_jira):
+
+    first_key = fake_jira.add_issue(summary='AWS Account - 111111111111', labels=['aws-account-111111111111'])
+    second_key = fake_jira.add_issue(summary='AWS Account - 222222222222', labels=['aws-account-222222222222'])
+    fake_jira.path_responses[('PUT', 'issue/' + fake_jira.issues[second_key]['id'])] = [(401, {'errorMessages': ['Unauthorized']})]
+
+    results = jira_handler.jira_upsert_issues(items=[
+        {'issue_summary': 'AWS Account - 111111111111', 'issue_desc': '{"a": 1}', 'aws_account_id': '111111111111'},
+        {'issue_summary': 'AWS Account - 222222222222', 'issue_desc': '{"a": 2}', 'aws_account_id': '222222222222'},
+        {'issue_summary': 'AWS Account - 333333333333', 'issue_desc': '{"a": 3}', 'aws_account_id': '333333333333'}
+    ])
+
+    assert {x: str(y) for x, y in results.items()} == {'111111111111': first_key, '222222222222': second_key, '333333333333': 'OPS-3'}
+    assert fake_jira.get_calls().count(('PUT', 'issue/' + fake_jira.issues[first_key]['id'])) == 1
+    assert fake_jira.get_calls().count(('PUT', 'issue/' + fake_jira.issues[second_key]['id'])) == 2
+    assert fake_jira.get_calls().count(('POST', 'issue/bulk')) == 1
+    assert len(fake_jira.issues) == 3
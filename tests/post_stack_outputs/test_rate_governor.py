@@ -0,0 +1,57 @@
+import logging
+import time
+
+import pytest
+
+from rate_governor.rate_governor import RateGovernor, RateGovernorBudgetExhausted
+
+WEBHOOK_URLS = ['https://hooks.slack.com/services/T0/B1/secret-1', 'https://hooks.slack.com/services/T0/B2/secret-2']
+
+# FakeResponse: Stand-in for an HTTP response with a status and headers
+class FakeResponse:
+
+    def __init__(self, status: int, headers: dict = None):
+        self.status = status
+        self.headers = headers or {}
+
+def get_rate_governor(bucket_key: str = None) -> RateGovernor:
+    return RateGovernor(logger=logging.getLogger('test_rate_governor'), destination='SLACK', default_rate_per_second=1, default_burst=1, bucket_key=bucket_key)
+
+@pytest.fixture(autouse=True)
+def no_deadline(jira_state):
+    RateGovernor.set_deadline(None)
+    yield
+    RateGovernor.set_deadline(None)
+
+def test_webhooks_have_their_own_buckets():
+
+    RateGovernor.set_deadline(time.monotonic() + 0.5)
+
+    for webhook_url in WEBHOOK_URLS:
+        assert get_rate_governor(bucket_key=webhook_url).call(lambda: 'sent') == 'sent'
+
+    with pytest.raises(RateGovernorBudgetExhausted):
+        get_rate_governor(bucket_key=WEBHOOK_URLS[0]).call(lambda: 'sent')
+
+def test_bucket_names_do_not_hold_the_webhook_url():
+
+    for webhook_url in WEBHOOK_URLS:
+        get_rate_governor(bucket_key=webhook_url)
+
+    assert len(RateGovernor.buckets) == 2
+    assert not any('secret' in x for x in RateGovernor.buckets)
+
+def test_throttled_responses_are_retried():
+
+    responses = [FakeResponse(429, {'Retry-After': '0'}), FakeResponse(503, {'Retry-After': '0'}), FakeResponse(200)]
+    rate_governor = RateGovernor(logger=logging.getLogger('test_rate_governor'), destination='SLACK', default_rate_per_second=100, default_burst=10)
+
+    assert rate_governor.call(responses.pop, 0).status == 200
+    assert rate_governor.get_throttle_stats()['retries'] == 2
+
+def test_503_without_retry_after_is_not_throttling():
+
+    rate_governor = get_rate_governor()
+
+    assert rate_governor.call(lambda: FakeResponse(503)).status == 503
+    assert rate_governor.get_throttle_stats()['throttled'] == 0
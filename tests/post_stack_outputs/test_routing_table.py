@@ -0,0 +1,63 @@
+import logging
+
+import pytest
+
+from routing_table.routing_table import RoutingTable
+
+ROUTING_CONFIG = {
+    'default': {'jira': {'project_key': 'OPS'}, 'slack': {'channel': 'stacks'}},
+    'rules': [
+        {'match': 'account:111111111111', 'jira': {'project_key': 'PAY'}},
+        {'match': 'account:1111*', 'jira': {'project_key': 'SHORT'}},
+        {'match': 'account:11111111*', 'jira': {'project_key': 'LONG'}},
+        {'match': 'ou:ou-ab12-*', 'slack': False},
+        {'match': 'ou:ou-ab12-cd34*', 'slack': {'channel': 'team-cd34'}},
+        {'match': 'tag:Team=data*', 'jira': {'project_key': 'DATA'}},
+        {'match': 'tag:Team=data-platform', 'jira': {'project_key': 'PLATFORM'}},
+        {'match': 'tag:Env=prod*', 'jira': {'project_key': 'PROD'}}
+    ]
+}
+
+@pytest.fixture
+def routing_table() -> RoutingTable:
+    return RoutingTable(logger=logging.getLogger('test_routing_table'), routing_config=ROUTING_CONFIG)
+
+@pytest.mark.parametrize('aws_account_id, project_key', [
+    ('111111111111', 'PAY'),
+    ('111111112222', 'LONG'),
+    ('111122222222', 'SHORT'),
+    ('222222222222', 'OPS')
+])
+def test_exact_match_beats_the_longest_prefix(routing_table, aws_account_id, project_key):
+    assert routing_table.get_destinations({'AWSAccountId': aws_account_id})['jira']['project_key'] == project_key
+
+def test_longest_ou_prefix_wins_and_disabled_sinks_are_none(routing_table):
+
+    assert routing_table.get_destinations({'AWSAccountId': '3', 'AWSOrganizationalUnitId': 'ou-ab12-ef56'})['slack'] is None
+    assert routing_table.get_destinations({'AWSAccountId': '3', 'AWSOrganizationalUnitId': 'ou-ab12-cd34xyz'})['slack'] == {'channel': 'team-cd34'}
+
+def test_most_specific_tag_wins(routing_table):
+
+    http_body = {'AWSAccountId': '3', 'AWSAccountTags': {'Env': 'production', 'Team': 'data-platform'}}
+
+    assert routing_table.get_destinations(http_body)['jira'] == {'project_key': 'PLATFORM'}
+
+def test_account_rules_are_tried_before_ou_rules(routing_table):
+
+    http_body = {'AWSAccountId': '111111111111', 'AWSOrganizationalUnitId': 'ou-ab12-ef56'}
+
+    assert routing_table.get_destinations(http_body) == {'jira': {'project_key': 'PAY'}, 'slack': {'channel': 'stacks'}}
+
+def test_earlier_duplicate_rule_wins():
+
+    routing_table = RoutingTable(logger=logging.getLogger('test_routing_table'), routing_config={'rules': [
+        {'match': 'ou:ou-1*', 'jira': {'project_key': 'FIRST'}},
+        {'match': 'ou:ou-1*', 'jira': {'project_key': 'SECOND'}}
+    ]})
+
+    assert routing_table.get_destinations({'AWSOrganizationalUnitId': 'ou-123'})['jira'] == {'project_key': 'FIRST'}
+
+def test_invalid_rule_is_rejected():
+
+    with pytest.raises(Exception, match='Invalid routing rule 0'):
+        RoutingTable(logger=logging.getLogger('test_routing_table'), routing_config={'rules': [{'match': 'region:us-east-1'}]})
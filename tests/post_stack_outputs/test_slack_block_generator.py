@@ -0,0 +1,111 @@
+import json
+import logging
+import time
+
+import pytest
+
+from slack_block_generator.slack_block_generator import SlackBlockGenerator, SLACK_MAX_BLOCKS_PER_MESSAGE, SLACK_MAX_CONTEXT_ELEMENTS, SLACK_MAX_TEXT_LENGTH
+
+# FakeResponse: Stand-in for the urllib3 response of a Slack webhook
+class FakeResponse:
+
+    def __init__(self, status: int):
+        self.status = status
+        self.data = b'ok' if status == 200 else b'invalid_blocks'
+        self.headers = {}
+
+# FakeHTTP: Stand-in for the urllib3 PoolManager posting to Slack. Records the posted messages and answers with the queued statuses, then 200.
+class FakeHTTP:
+
+    def __init__(self):
+        self.messages = []
+        self.statuses = []
+
+    def request(self, method: str, url: str, headers: dict = None, body: bytes = None):
+        self.messages.append(json.loads(body)['blocks'])
+        return FakeResponse(self.statuses.pop(0) if self.statuses else 200)
+
+@pytest.fixture
+def slack(jira_state, monkeypatch) -> SlackBlockGenerator:
+
+    monkeypatch.setenv('SLACK_RATE_LIMIT_PER_SECOND', '10000')
+    monkeypatch.setenv('SLACK_RATE_LIMIT_BURST', '10000')
+
+    slack = SlackBlockGenerator(webhook_url='https://hooks.slack.com/services/T0/B1/secret', channel='stacks', username='bot', icon_url='', logger=logging.getLogger('test_slack'))
+    slack.http = FakeHTTP()
+    return slack
+
+# get_http_body: Returns dict with the stack outputs of an AWS account, `stack_count` stacks of `output_count` outputs each
+def get_http_body(aws_account_id: str, stack_count: int, output_count: int) -> dict:
+    return dict({
+        'arn:aws:cloudformation:us-east-1:' + aws_account_id + ':stack/stack-' + str(x) + '/id': {'Output' + str(y): 'value-' + str(y) for y in range(output_count)}
+        for x in range(stack_count)
+    }, AWSAccountId=aws_account_id)
+
+# get_texts: Returns list with the text of every text object in the blocks
+def get_texts(blocks: list) -> list:
+    return [x['text']['text'] for x in blocks if 'text' in x] + [y['text'] for x in blocks if x['type'] == 'context' for y in x['elements']]
+
+def test_large_account_is_split_within_the_slack_limits(slack):
+
+    assert slack.post_slack_message(http_body=get_http_body('111111111111', stack_count=30, output_count=25))[0] == 200
+
+    assert len(slack.http.messages) > 1
+    for blocks in slack.http.messages:
+        assert len(blocks) <= SLACK_MAX_BLOCKS_PER_MESSAGE
+        assert blocks[0]['type'] != 'divider'
+        assert all(len(x['elements']) <= SLACK_MAX_CONTEXT_ELEMENTS for x in blocks if x['type'] == 'context')
+
+    output_texts = [x for blocks in slack.http.messages for x in get_texts(blocks) if x.startswith('Output')]
+    assert len(output_texts) == 30 * 25
+
+def test_long_values_are_truncated(slack):
+
+    slack.post_slack_message(http_body={'AWSAccountId': '111111111111', 'Notes': 'x' * 10000})
+
+    assert all(len(x) <= SLACK_MAX_TEXT_LENGTH for x in get_texts(slack.http.messages[0]))
+    assert '... (truncated)`' in get_texts(slack.http.messages[0])[-1]
+
+def test_posting_stops_at_the_first_rejected_message(slack):
+
+    slack.http.statuses = [200, 400]
+
+    assert slack.post_slack_message(http_body=get_http_body('111111111111', stack_count=30, output_count=25))[0] == 400
+    assert len(slack.http.messages) == 2
+
+def test_small_accounts_share_a_message(slack):
+
+    statuses = slack.post_slack_messages(http_bodies=[get_http_body(str(x) * 12, stack_count=1, output_count=3) for x in range(1, 4)])
+
+    assert [x[0] for x in statuses] == [200, 200, 200]
+    assert len(slack.http.messages) == 1
+
+# Benchmark: Blocks are built in one pass, so building the messages of a large account scales linearly with its outputs.
+@pytest.mark.parametrize('stack_count', [10, 100])
+def test_block_builder_benchmark(slack, stack_count):
+
+    http_body = get_http_body('111111111111', stack_count=stack_count, output_count=20)
+
+    started_at = time.perf_counter()
+    for _ in range(10):
+        messages = list(slack._SlackBlockGenerator__split_messages(blocks=slack._SlackBlockGenerator__iter_blocks(http_body=http_body)))
+    build_seconds = (time.perf_counter() - started_at) / 10
+
+    print('\n%s stacks of 20 outputs: %s messages built in %.2f ms' % (stack_count, len(messages), build_seconds * 1000))
+
+    assert build_seconds < 0.005 * stack_count
+
+def test_generator_is_reused_per_webhook_and_channel(monkeypatch):
+
+    import postStackOutputLambda
+    from utils.utils import Utils
+
+    monkeypatch.setattr(Utils, 'lazy_registry', {})
+    monkeypatch.setattr(Utils, 'lazy_init_durations', {})
+    monkeypatch.setattr(postStackOutputLambda, 'get_config', lambda: {'slack': {'webhook_url': 'https://hooks.slack.com/services/T0/B1/secret'}})
+
+    slack = postStackOutputLambda.get_slack_block_generator()
+
+    assert postStackOutputLambda.get_slack_block_generator() is slack
+    assert postStackOutputLambda.get_slack_block_generator(slack_destination={'channel': 'other'}) is not slack
+    assert all('secret' not in x for x in Utils.lazy_registry)
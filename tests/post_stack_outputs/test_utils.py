@@ -0,0 +1,130 @@
+import base64
+import gzip
+import logging
+
+import pytest
+from botocore.exceptions import ClientError
+
+from tests.aws_fakes import FakeSSMClient, FakeSecretsManagerClient
+from utils.utils import Utils
+
+REGION_NAME = 'us-east-1'
+
+@pytest.fixture
+def utils_obj() -> Utils:
+    return Utils(logger=logging.getLogger('test_utils'))
+
+@pytest.fixture
+def ssm_client(aws_clients) -> FakeSSMClient:
+    aws_clients[('ssm', REGION_NAME)] = FakeSSMClient(parameters={'/app/token': ('token-1', 1)})
+    return aws_clients[('ssm', REGION_NAME)]
+
+# expire_ssm_parameter: Moves the expiry of every cached entry of the parameter into the past
+def expire_ssm_parameter(parameter_name: str) -> None:
+    for cache_key, cached_parameter in Utils.ssm_parameter_cache.items():
+        if cache_key[1] == parameter_name:
+            cached_parameter['expires_at'] = 0
+
+def test_ssm_parameter_is_cached_until_ttl_expires(utils_obj, ssm_client):
+
+    assert utils_obj.get_ssm_parameter(parameter_name='/app/token', region_name=REGION_NAME, ttl=60) == 'token-1'
+    assert utils_obj.get_ssm_parameter(parameter_name='/app/token', region_name=REGION_NAME) == 'token-1'
+    assert len(ssm_client.calls) == 1
+
+    expire_ssm_parameter('/app/token')
+    assert utils_obj.get_ssm_parameter(parameter_name='/app/token', region_name=REGION_NAME) == 'token-1'
+    assert len(ssm_client.calls) == 2
+
+    stats = utils_obj.get_ssm_parameter_cache_stats()
+    assert (stats['hits'], stats['misses'], stats['refreshes'], stats['invalidations']) == (1, 2, 1, 0)
+
+def test_changed_ssm_parameter_version_replaces_cached_value(utils_obj, ssm_client):
+
+    utils_obj.get_ssm_parameter(parameter_name='/app/token', region_name=REGION_NAME)
+    ssm_client.parameters['/app/token'] = ('token-2', 2)
+
+    # Still fresh, so the rotated value is not seen until the entry expires
+    assert utils_obj.get_ssm_parameter(parameter_name='/app/token', region_name=REGION_NAME) == 'token-1'
+
+    expire_ssm_parameter('/app/token')
+    assert utils_obj.get_ssm_parameter(parameter_name='/app/token', region_name=REGION_NAME) == 'token-2'
+    assert utils_obj.get_ssm_parameter_version(parameter_name='/app/token', region_name=REGION_NAME) == 2
+    assert utils_obj.get_ssm_parameter_cache_stats()['invalidations'] == 1
+
+def test_expected_version_forces_a_read(utils_obj, ssm_client):
+
+    utils_obj.get_ssm_parameter(parameter_name='/app/token', region_name=REGION_NAME)
+    ssm_client.parameters['/app/token'] = ('token-2', 2)
+
+    assert utils_obj.get_ssm_parameter(parameter_name='/app/token', region_name=REGION_NAME, version=2) == 'token-2'
+    assert len(ssm_client.calls) == 2
+
+def test_prefetch_fills_the_cache_with_one_call(utils_obj, ssm_client):
+
+    ssm_client.parameters['/app/webhook'] = ('https://hooks.example.com/1', 3)
+
+    prefetched = utils_obj.prefetch(region_name=REGION_NAME, ssm_parameter_names=['/app/token', '/app/webhook', '/app/token', None])
+
+    assert prefetched == {'/app/token': 'token-1', '/app/webhook': 'https://hooks.example.com/1'}
+    assert utils_obj.get_ssm_parameter(parameter_name='/app/webhook', region_name=REGION_NAME) == 'https://hooks.example.com/1'
+    assert ssm_client.calls == [('GetParameters', ('/app/token', '/app/webhook'))]
+
+def test_ssm_client_errors_are_raised_and_not_cached(utils_obj, ssm_client):
+
+    with pytest.raises(ClientError):
+        utils_obj.get_ssm_parameter(parameter_name='/app/missing', region_name=REGION_NAME)
+
+    ssm_client.error_code = 'AccessDeniedException'
+    with pytest.raises(ClientError):
+        utils_obj.get_ssm_parameter(parameter_name='/app/token', region_name=REGION_NAME)
+
+    assert Utils.ssm_parameter_cache == {}
+
+def test_ssm_parameter_without_value_returns_none(utils_obj, ssm_client):
+
+    ssm_client.parameters['/app/empty'] = None
+
+    assert utils_obj.get_ssm_parameter(parameter_name='/app/empty', region_name=REGION_NAME) is None
+    assert utils_obj.get_ssm_parameter(parameter_name='/app/empty', region_name=REGION_NAME) is None
+    assert len(ssm_client.calls) == 2
+
+def test_aws_secret_errors_are_raised_and_not_cached(utils_obj, aws_clients):
+
+    secrets_client = aws_clients[('secretsmanager', REGION_NAME)] = FakeSecretsManagerClient(secrets={'arn:secret': 'value'})
+    secrets_client.error_code = 'ResourceNotFoundException'
+
+    with pytest.raises(ClientError):
+        utils_obj.get_aws_secret(secret_arn='arn:secret', region_name=REGION_NAME)
+    assert Utils.aws_secret_cache == {}
+
+    secrets_client.error_code = None
+    assert utils_obj.get_aws_secret(secret_arn='arn:secret', region_name=REGION_NAME) == 'value'
+    assert utils_obj.get_aws_secret(secret_arn='arn:secret', region_name=REGION_NAME) == 'value'
+    assert len(secrets_client.calls) == 2
+
+@pytest.mark.parametrize('headers', [{'Content-Encoding': 'gzip'}, {'content-encoding': 'GZIP'}, {}])
+def test_gzip_request_bodies_are_decompressed(utils_obj, headers):
+
+    http_body = gzip.compress(b'{"AWSAccountId": "111111111111"}')
+
+    assert utils_obj.get_http_body({'body': base64.b64encode(http_body).decode('ascii'), 'isBase64Encoded': True, 'headers': headers}) == b'{"AWSAccountId": "111111111111"}'
+
+def test_plain_request_bodies_are_returned_as_bytes(utils_obj):
+
+    assert utils_obj.get_http_body({'body': '{"a": 1}', 'headers': {}}) == b'{"a": 1}'
+    assert utils_obj.get_http_body({'headers': {}}) is None
+
+def test_gzip_bomb_is_rejected(utils_obj, monkeypatch):
+
+    monkeypatch.setenv('MAX_HTTP_BODY_SIZE', '1024')
+    http_body = gzip.compress(b' ' * 1025)
+
+    with pytest.raises(Exception, match='larger than 1024 bytes'):
+        utils_obj.get_http_body({'body': base64.b64encode(http_body).decode('ascii'), 'isBase64Encoded': True, 'headers': {'Content-Encoding': 'gzip'}})
+
+def test_truncated_gzip_body_is_rejected(utils_obj):
+
+    http_body = gzip.compress(b'{"a": 1}')[:-4]
+
+    with pytest.raises(Exception, match='truncated'):
+        utils_obj.get_http_body({'body': base64.b64encode(http_body).decode('ascii'), 'isBase64Encoded': True, 'headers': {}})
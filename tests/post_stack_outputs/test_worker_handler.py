@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+import postStackOutputLambda
+
+# deliveries: Enables the Slack sink with a stand-in for post_to_slack, which fails for the account `fail`, and points the delivery queue at a local directory.
+# Returns list with the account IDs in delivery order.
+@pytest.fixture
+def deliveries(monkeypatch, tmp_path):
+
+    monkeypatch.setenv('ENABLE_SLACK_INTEGRATION', 'true')
+    monkeypatch.delenv('ENABLE_JIRA_INTEGRATION', raising=False)
+    monkeypatch.delenv('SLACK_DIGEST_ENABLED', raising=False)
+    monkeypatch.setattr(postStackOutputLambda.delivery_queue, 'queue_url', None)
+    monkeypatch.setattr(postStackOutputLambda.delivery_queue, 'queue_dir', str(tmp_path))
+
+    delivered = []
+
+    def post_to_slack(http_body: dict) -> dict:
+        delivered.append(http_body['AWSAccountId'])
+        return {'statusCode': 500 if http_body['AWSAccountId'] == 'fail' else 200, 'body': ''}
+
+    monkeypatch.setattr(postStackOutputLambda, 'post_to_slack', post_to_slack)
+    return delivered
+
+def get_sqs_record(message_id: str, aws_account_id: str) -> dict:
+    return {
+        'messageId': message_id,
+        'body': json.dumps({'DeliveryId': 'delivery-' + message_id, 'Message': {'AWSAccountId': aws_account_id}})
+    }
+
+def test_sqs_records_report_only_failed_items(deliveries):
+
+    response = postStackOutputLambda.worker_handler({'Records': [
+        get_sqs_record('1', '111111111111'),
+        get_sqs_record('2', 'fail'),
+        get_sqs_record('3', '333333333333')
+    ]}, None)
+
+    assert response == {'batchItemFailures': [{'itemIdentifier': '2'}]}
+    assert deliveries == ['111111111111', 'fail', '333333333333']
+
+def test_drain_delivers_and_deletes_queued_messages(deliveries):
+
+    delivery_ids = [postStackOutputLambda.delivery_queue.enqueue(message={'AWSAccountId': x}) for x in ['111111111111', '222222222222']]
+
+    results = postStackOutputLambda.worker_handler({}, None)
+
+    assert sorted(results) == sorted(delivery_ids)
+    assert all(x['SlackAPI']['statusCode'] == 200 for x in results.values())
+    assert deliveries == ['111111111111', '222222222222']
+    assert postStackOutputLambda.delivery_queue.receive() == []
+
+def test_drain_keeps_failed_messages_queued(deliveries):
+
+    postStackOutputLambda.delivery_queue.enqueue(message={'AWSAccountId': 'fail'})
+
+    postStackOutputLambda.worker_handler({}, None)
+
+    assert [x[2]['AWSAccountId'] for x in postStackOutputLambda.delivery_queue.receive()] == ['fail']
+    assert deliveries == ['fail']
+
+def test_async_request_fails_without_a_delivery_queue(deliveries, monkeypatch):
+
+    monkeypatch.setenv('ASYNC_DELIVERY', 'true')
+    monkeypatch.setattr(postStackOutputLambda.delivery_queue, 'queue_dir', None)
+
+    response = postStackOutputLambda.lambda_handler({'body': json.dumps({'AWSAccountId': '111111111111'})}, None)
+
+    assert response['statusCode'] == 500
+
+def test_async_request_is_queued_for_the_worker(deliveries, monkeypatch):
+
+    monkeypatch.setenv('ASYNC_DELIVERY', 'true')
+
+    response = postStackOutputLambda.lambda_handler({'body': json.dumps({'AWSAccountId': '111111111111'})}, None)
+
+    assert response['statusCode'] == 202
+    assert [x[1] for x in postStackOutputLambda.delivery_queue.receive()] == [json.loads(response['body'])['DeliveryId']]
+
+def test_batch_reports_invalid_account_ids_per_item(deliveries, monkeypatch):
+
+    delivered_batches = []
+
+    def post_batch_to_slack(http_bodies: list) -> dict:
+        delivered_batches.append([x['AWSAccountId'] for x in http_bodies])
+        return {'statusCode': 200, 'body': '', 'Items': [{'statusCode': 200, 'body': ''}] * len(http_bodies)}
+
+    monkeypatch.setattr(postStackOutputLambda, 'post_batch_to_slack', post_batch_to_slack)
+
+    response = postStackOutputLambda.lambda_handler({'body': json.dumps([
+        {'AWSAccountId': '011111111111'},
+        {'AWSAccountId': '1111'},
+        {'AWSAccountId': 111111111111},
+        {'AWSAccountId': '111111111111") OR project = OTHER AND ("'}
+    ])}, None)
+
+    assert [x['statusCode'] for x in response['Items']] == [200, 400, 400, 400]
+    assert delivered_batches == [['011111111111']]